@@ -0,0 +1,234 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmark_comparison import benchmark_tickers, compare_to_benchmarks
+from correlation import pairwise_correlation
+from dividends import DividendCache, dividends_since_purchase
+from ledger import account_lots, is_ledger_csv, read_ledger, value_ledger
+from market_data import FixtureProvider, YahooProvider
+from metrics import add_dividend_metrics, add_position_metrics, annualized_volatility, max_drawdown, portfolio_summary
+from portfolio_io import read_portfolio_csv
+from price_store import PriceStore
+from rolling_risk import DEFAULT_WINDOWS, daily_returns, rolling_risk
+from valuation import value_lots
+
+
+# The analyzer's stages as plain functions that return frames and dicts, so other code can import them.
+#
+# Nothing in here prints, draws or touches the network at import time: yfinance only comes in when a
+# YahooProvider actually downloads, and matplotlib / seaborn only in the chart functions (charts.py and
+# correlation.plot_correlation_heatmap). That keeps `--json` runs and library users off the plotting stack.
+
+
+ANALYZER_BENCHMARKS = ('VOO', 'QQQ', 'AGG', 'SPY:0.6+AGG:0.4')
+HISTORY_PADDING = pd.Timedelta(days=60)
+LARGE_UNIVERSE = 500
+ROLLING_METRICS = ('volatility', 'beta', 'correlation', 'sharpe', 'sortino', 'max_drawdown')
+POSITION_COLUMNS = [
+    'shares',
+    'purchase_price',
+    'totalAmountInvested',
+    'current_price',
+    'whatsItWorthNow',
+    'allMyDividendsReceived',
+    'whatsItWorthNowPlusDividends',
+    'dollarChange',
+    'percentChange',
+    'totalGainLossIncludingDivs',
+    'percentGainLossIncludingDivs',
+    'howLongYouHeldItYears',
+    'yearlyGrowthPercent'
+]
+
+
+def market_data_provider(fixture_dir=None):
+    """Offline fixtures when `fixture_dir` (or PORTFOLIO_FIXTURE_DIR) is set, Yahoo Finance otherwise."""
+    fixture_dir = fixture_dir or os.environ.get('PORTFOLIO_FIXTURE_DIR')
+    return FixtureProvider(fixture_dir) if fixture_dir else YahooProvider()
+
+
+def open_data_stores(provider=None, root=None):
+    """(PriceStore, DividendCache) under `root` (default PORTFOLIO_PRICE_STORE or .price_store)."""
+    provider = provider or market_data_provider()
+    price_store = PriceStore(root or os.environ.get('PORTFOLIO_PRICE_STORE', '.price_store'), provider)
+    return price_store, DividendCache(os.path.join(price_store.root, 'dividends'), provider)
+
+
+def load_portfolio(path_or_buffer, lot_method='fifo'):
+    """Lots from a lot CSV or a transaction ledger: (lots indexed by ticker, LotAccounting or None).
+
+    Ledgers are recognized by their Action column and boiled down to the lots still held.
+    """
+    if is_ledger_csv(path_or_buffer):
+        accounting = account_lots(read_ledger(path_or_buffer), lot_method)
+        return accounting.open_lots.copy(), accounting
+    return read_portfolio_csv(path_or_buffer), None
+
+
+def lots_from_entries(entries):
+    """Lot frame from a list of {'ticker', 'shares', 'purchase_date', 'purchase_price'} dicts."""
+    lots = pd.DataFrame(list(entries), columns=['ticker', 'shares', 'purchase_date', 'purchase_price'])
+    lots['purchase_date'] = pd.to_datetime(lots['purchase_date'])
+    return lots.set_index('ticker')
+
+
+def history_start(lots, lot_accounting=None):
+    """First day of price history the analysis needs (a little before the first purchase)."""
+    first = lots['purchase_date'].min()
+    if lot_accounting is not None and len(lot_accounting.ledger):
+        first = pd.Timestamp(lot_accounting.ledger.dates.min())
+    return first - HISTORY_PADDING
+
+
+def fetch_prices(price_store, lots, benchmarks=ANALYZER_BENCHMARKS, as_of=None, lot_accounting=None):
+    """Adjusted closes for the holdings (and anything a ledger sold) plus the benchmark components."""
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.now()
+    tickers = list(dict.fromkeys(lots.index))
+    if lot_accounting is not None:
+        tickers = list(dict.fromkeys(tickers + list(lot_accounting.ledger.tickers)))
+    return price_store.adjusted_close(tickers + benchmark_tickers(benchmarks), history_start(lots, lot_accounting), as_of)
+
+
+def fetch_dividends(dividend_cache, tickers):
+    """(histories by ticker, errors by ticker) from the dividend cache."""
+    return dividend_cache.histories(list(dict.fromkeys(tickers)))
+
+
+def compute_performance(lots, prices, dividend_histories, as_of=None, lot_accounting=None, latest_prices=None):
+    """Per-lot metrics plus the whole-portfolio summary: (positions frame, summary dict, tickers missing a price).
+
+    A lot without any price falls back to what was paid for it. When a ledger recorded dividend cash,
+    that's used instead of the dividend histories. Callers valuing many portfolios against the same
+    prices can pass `latest_prices` (last close by ticker) to skip looking it up every time.
+    """
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.now()
+    positions = lots.copy()
+    tickers = list(dict.fromkeys(positions.index))
+    if latest_prices is None:
+        latest_prices = prices.reindex(columns=tickers).ffill().iloc[-1] if len(prices) else pd.Series(np.nan, index=tickers)
+    positions['current_price'] = positions.index.map(latest_prices)
+    missing = sorted(set(positions.index[positions['current_price'].isnull()]))
+    positions['current_price'] = positions['current_price'].fillna(positions['purchase_price'])
+    add_position_metrics(positions, as_of)
+
+    per_share = dividends_since_purchase(dividend_histories, positions.index, positions['purchase_date'], as_of)
+    if lot_accounting is not None and lot_accounting.positions['dividends'].sum() > 0:
+        per_share = lot_accounting.dividends_per_share(positions)
+    add_dividend_metrics(positions, per_share)
+    return positions, portfolio_summary(positions, as_of), missing
+
+
+def value_history(positions, prices, lot_accounting=None):
+    """Daily portfolio value (a Series named 'Portfolio Value'), only the days it was worth something."""
+    if lot_accounting is not None:
+        valuation = value_ledger(lot_accounting, prices)
+    else:
+        valuation = value_lots(positions.index, positions['shares'], positions['purchase_date'], prices)
+    values = valuation.total
+    return values[values > 0]
+
+
+def risk_summary(values):
+    """Max drawdown and annualized volatility (both in percent) of a value series."""
+    if values.empty:
+        return {'max_drawdown': 0, 'volatility': 0}
+    return {'max_drawdown': max_drawdown(values), 'volatility': annualized_volatility(values)}
+
+
+def correlation_matrix(prices, tickers):
+    """Pairwise correlation of the tickers' daily returns (None with fewer than two tickers)."""
+    tickers = list(dict.fromkeys(tickers))
+    if len(tickers) < 2 or prices.empty:
+        return None
+    returns = pd.DataFrame(daily_returns(prices[tickers]), index=prices.index, columns=tickers).iloc[1:]
+    return pairwise_correlation(returns, dtype='float32' if len(tickers) > LARGE_UNIVERSE else 'float64')
+
+
+def compare_benchmarks(values, prices, benchmarks=ANALYZER_BENCHMARKS):
+    """(benchmark values scaled to the portfolio, one row per benchmark) or (None, None) without history."""
+    if values.empty:
+        return None, None
+    return compare_to_benchmarks(values, prices, list(benchmarks))
+
+
+def latest_rolling_risk(values, prices, tickers, benchmark_values, windows=DEFAULT_WINDOWS):
+    """Latest rolling numbers for the portfolio and every holding: rows (window, metric), one column each."""
+    inputs = prices[list(dict.fromkeys(tickers))].reindex(values.index)
+    inputs.insert(0, 'Portfolio', values)
+    report = rolling_risk(inputs, benchmark_values, windows)
+    return pd.DataFrame({
+        (window, metric): report[window][metric].iloc[-1]
+        for window in windows
+        for metric in ROLLING_METRICS
+    }).T
+
+
+class AnalysisResult:
+    """Everything one analysis run computed; frames and dicts only, nothing printed or drawn."""
+
+    def __init__(self, as_of, positions, summary, values, benchmarks, benchmark_table, correlation,
+                 missing_prices, dividend_errors, lot_accounting=None):
+        self.as_of = as_of
+        self.positions = positions
+        self.summary = summary
+        self.values = values
+        self.benchmarks = benchmarks
+        self.benchmark_table = benchmark_table
+        self.correlation = correlation
+        self.missing_prices = missing_prices
+        self.dividend_errors = dividend_errors
+        self.lot_accounting = lot_accounting
+
+    def to_dict(self):
+        """JSON-ready summary, per-position table and benchmark table (NaN becomes None)."""
+        def records(frame, index_name):
+            frame = frame.reset_index().rename(columns={'index': index_name})
+            for column in frame.columns[frame.dtypes.map(lambda dtype: dtype.kind == 'M')]:
+                frame[column] = frame[column].dt.strftime('%Y-%m-%d')
+            return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+        def number(value):
+            return None if value is None or not np.isfinite(value) else float(value)
+
+        result = {
+            'as_of': self.as_of.strftime('%Y-%m-%d'),
+            'summary': {key: number(value) for key, value in self.summary.items()},
+            'positions': records(self.positions[['purchase_date'] + POSITION_COLUMNS], 'ticker'),
+            'benchmarks': [] if self.benchmark_table is None else records(self.benchmark_table, 'benchmark'),
+            'missing_prices': list(self.missing_prices),
+            'dividend_errors': {ticker: str(error) for ticker, error in self.dividend_errors.items()},
+        }
+        if self.lot_accounting is not None:
+            result['lot_method'] = self.lot_accounting.method
+            result['realized'] = records(self.lot_accounting.positions, 'ticker')
+        return result
+
+
+def analyze(lots, price_store, dividend_cache, benchmarks=ANALYZER_BENCHMARKS, as_of=None, lot_accounting=None,
+            correlation=True):
+    """Run every non-drawing stage for one portfolio and return an AnalysisResult.
+
+    Raises ValueError when there's no price history at all for the holdings.
+    """
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.now()
+    prices = fetch_prices(price_store, lots, benchmarks, as_of, lot_accounting)
+    histories, errors = fetch_dividends(dividend_cache, list(dict.fromkeys(lots.index)))
+    return analyze_prices(lots, prices, histories, benchmarks, as_of, lot_accounting, correlation, errors)
+
+
+def analyze_prices(lots, prices, dividend_histories, benchmarks=ANALYZER_BENCHMARKS, as_of=None, lot_accounting=None,
+                   correlation=True, dividend_errors=None):
+    """analyze() on market data that's already in hand (prices must include the benchmark components)."""
+    as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.now()
+    tickers = list(dict.fromkeys(lots.index))
+    if prices.reindex(columns=tickers).dropna(how='all').empty:
+        raise ValueError(f"Could not get any price history for {tickers}.")
+    positions, summary, missing = compute_performance(lots, prices, dividend_histories, as_of, lot_accounting)
+    values = value_history(positions, prices, lot_accounting)
+    summary.update(risk_summary(values))
+    normalized, table = compare_benchmarks(values, prices, benchmarks)
+    return AnalysisResult(as_of, positions, summary, values, normalized, table,
+                          correlation_matrix(prices, tickers) if correlation else None, missing,
+                          dividend_errors or {}, lot_accounting)
@@ -0,0 +1,343 @@
+import argparse
+import itertools
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmark_comparison import benchmark_levels, benchmark_tickers, relative_statistics
+from metrics import DAYS_PER_YEAR, TRADING_DAYS_PER_YEAR
+
+
+# Replaying history under rebalancing policies instead of buy-and-hold: calendar rebalancing, drift
+# bands, target weights that change over time (from a file), with transaction costs and dividends either
+# reinvested or left in cash.
+#
+# Between two rebalances nothing trades, so every strategy's value is its (fixed) units times the price
+# rows, and all strategies are stepped together from event to event rather than day by day: each step
+# looks at the next block of days for every strategy at once, finds where each one's next rebalance
+# falls (calendar date, band breach or new targets), records the values up to there and rebalances.
+# A reinvested dividend just buys more of the same stock at the ex-date close, which is the same as
+# holding units of a total-return index, so reinvestment doesn't add events either.
+#
+# The price store holds adjusted closes, which already have dividends folded in; pass dividend
+# histories to reinvest or collect them only alongside unadjusted prices, or they're counted twice.
+
+
+REBALANCE_FREQUENCIES = {'none': None, 'monthly': 'M', 'quarterly': 'Q', 'annual': 'Y'}
+DEFAULT_INITIAL_VALUE = 10_000.0
+BLOCK_ELEMENTS = 4_000_000
+MAX_BLOCK_DAYS = 252
+
+
+def _normalize_weights(frame):
+    frame = frame.fillna(0.0).astype('float64')
+    totals = frame.sum(axis=1)
+    if (totals <= 0).any():
+        raise ValueError("Every row of target weights needs a positive total.")
+    return frame.div(totals, axis=0)
+
+
+def read_target_weights(path_or_buffer):
+    """Target weights from a CSV, either `Ticker,Weight` rows or a `Date,<TICKER>,<TICKER>...` schedule.
+
+    A schedule row applies from its date until the next row. Weights are scaled to sum to one, so
+    percentages work as well as fractions.
+    """
+    table = pd.read_csv(path_or_buffer)
+    table.columns = table.columns.str.strip()
+    if 'Date' in table.columns:
+        table['Date'] = pd.to_datetime(table['Date'])
+        schedule = table.set_index('Date').sort_index()
+        schedule.columns = schedule.columns.str.strip().str.upper()
+        return _normalize_weights(schedule)
+    if {'Ticker', 'Weight'} <= set(table.columns):
+        weights = table.groupby(table['Ticker'].astype(str).str.strip().str.upper(), sort=False)['Weight'].sum()
+        return _normalize_weights(weights.to_frame().T).iloc[0]
+    raise ValueError("Target weights need 'Ticker' and 'Weight' columns, or a 'Date' column plus one column per ticker.")
+
+
+def is_target_weights_csv(path_or_buffer):
+    """True for a target weights file: a 'Weight' column, or a 'Date' schedule without lot or ledger columns.
+
+    Lot CSVs and transaction ledgers (which also have a 'Date' column) are left to analysis.load_portfolio.
+    """
+    header = set(pd.read_csv(path_or_buffer, nrows=0).columns.str.strip())
+    if hasattr(path_or_buffer, 'seek'):
+        path_or_buffer.seek(0)
+    return 'Weight' in header or ('Date' in header and not header & {'Ticker', 'Action'})
+
+
+class Strategy:
+    """One rebalancing policy.
+
+    `targets` is a Series of weights by ticker, or a (dates x tickers) schedule whose rows take over on
+    their dates (and trigger a rebalance). `rebalance` is one of REBALANCE_FREQUENCIES and rebalances on
+    the first trading day of each period; `band` also rebalances whenever any weight drifts more than
+    that far (0.05 = 5 percentage points) from its target. Every trade pays `cost_bps` of what changes
+    hands. With `reinvest_dividends=False` dividends pile up as cash until the next rebalance.
+    """
+
+    def __init__(self, targets, rebalance='none', band=None, cost_bps=0.0, reinvest_dividends=True, name=None):
+        if rebalance not in REBALANCE_FREQUENCIES:
+            raise ValueError(f"Unknown rebalance frequency '{rebalance}', expecting one of {sorted(REBALANCE_FREQUENCIES)}.")
+        if isinstance(targets, pd.Series):
+            targets = targets.to_frame().T
+            targets.index = pd.DatetimeIndex([pd.NaT])
+        self.targets = _normalize_weights(targets)
+        self.rebalance = rebalance
+        self.band = band
+        self.cost_bps = float(cost_bps)
+        self.reinvest_dividends = reinvest_dividends
+        self.name = name or '_'.join(filter(None, [
+            rebalance,
+            f'band{band:g}' if band else '',
+            f'{self.cost_bps:g}bps',
+            'drip' if reinvest_dividends else 'cash',
+        ]))
+
+
+def strategy_grid(targets, rebalance=('none', 'monthly', 'quarterly'), bands=(None,), costs_bps=(0.0,),
+                  reinvest_dividends=(True,)):
+    """Every combination of the given policy settings for one set of targets, as a list of Strategy."""
+    return [Strategy(targets, frequency, band, cost, reinvest)
+            for frequency, band, cost, reinvest in itertools.product(rebalance, bands, costs_bps, reinvest_dividends)]
+
+
+def _period_starts(calendar, frequency):
+    # True on the first trading day of every month / quarter / year (never on the backtest's first day).
+    starts = np.zeros(len(calendar), dtype=bool)
+    if frequency is not None and len(calendar) > 1:
+        periods = calendar.to_period(frequency).asi8
+        starts[1:] = periods[1:] != periods[:-1]
+    return starts
+
+
+def _dividend_matrix(calendar, assets, dividends):
+    # Cash per share paid on each day; an ex-date that isn't a trading day lands on the next one.
+    paid = np.zeros((len(calendar), len(assets)))
+    for column, ticker in enumerate(assets):
+        history = (dividends or {}).get(ticker)
+        if history is None or len(history) == 0:
+            continue
+        rows = calendar.searchsorted(pd.DatetimeIndex(history.index))
+        keep = (rows > 0) & (rows < len(calendar))
+        np.add.at(paid[:, column], rows[keep], np.asarray(history, dtype='float64')[keep])
+    return paid
+
+
+class BacktestResult:
+    """Daily values of every strategy (days x strategies), plus what each paid in costs and how often it traded."""
+
+    def __init__(self, strategies, values, costs, rebalances, initial_value=DEFAULT_INITIAL_VALUE):
+        self.strategies = strategies
+        self.initial_value = initial_value
+        self.values = values
+        self.costs = costs
+        self.rebalances = rebalances
+
+    def summary(self, prices=None, benchmarks=()):
+        """One row per strategy: the analyzer's CAGR, volatility and max drawdown (all in percent),
+        plus `{statistic}_vs_{benchmark}` columns for every benchmark when `prices` are given.
+        """
+        values = self.values.to_numpy(dtype='float64')
+        years = (self.values.index[-1] - self.values.index[0]).days / DAYS_PER_YEAR
+        growth = values[-1] / self.initial_value
+        with np.errstate(invalid='ignore', divide='ignore'):
+            daily = values[1:] / values[:-1] - 1
+            table = pd.DataFrame({
+                'final_value': values[-1],
+                'total_return': (growth - 1) * 100,
+                'cagr': (growth ** (1 / years) - 1) * 100 if years > 0 else (growth - 1) * 100,
+                'volatility': np.std(daily, axis=0, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR) * 100 if len(daily) > 1 else 0.0,
+                'max_drawdown': (np.min(values / np.maximum.accumulate(values, axis=0), axis=0) - 1) * 100,
+                'rebalances': self.rebalances,
+                'costs_paid': self.costs,
+            }, index=self.values.columns)
+
+        benchmarks = list(benchmarks)
+        if prices is not None and benchmarks:
+            levels = benchmark_levels(prices, benchmarks, self.values.index)
+            statistics = relative_statistics(self.values.pct_change(), levels.pct_change())
+            for spec in benchmarks:
+                table[f'benchmark_return_vs_{spec}'] = (levels[spec].iloc[-1] / levels[spec].iloc[0] - 1) * 100
+                for statistic, frame in statistics.items():
+                    table[f'{statistic}_vs_{spec}'] = frame[spec]
+        table.index.name = 'strategy'
+        return table
+
+
+def run_backtest(prices, strategies, dividends=None, initial_value=DEFAULT_INITIAL_VALUE, start=None, end=None,
+                 block_elements=BLOCK_ELEMENTS):
+    """Replay every strategy over `prices` (days x tickers) and return a BacktestResult.
+
+    All strategies start with `initial_value` in cash, buy their targets (paying costs) on the first day
+    every targeted ticker has a price, and are marked to market every day after that. `dividends` is
+    {ticker: cash per share by ex-date}, as the dividend cache returns it.
+    """
+    strategies = list(strategies)
+    if not strategies:
+        raise ValueError("Nothing to backtest: no strategies given.")
+    assets = list(dict.fromkeys(t for s in strategies for t in s.targets.columns[(s.targets > 0).any()]))
+    prices = prices.reindex(columns=assets).sort_index()
+    if start is not None:
+        prices = prices[prices.index >= pd.Timestamp(start)]
+    if end is not None:
+        prices = prices[prices.index <= pd.Timestamp(end)]
+    prices = prices.ffill().dropna()
+    if len(prices) < 2:
+        raise ValueError(f"Not enough days where all of {assets} have a price to backtest.")
+    calendar = prices.index
+    n_days, n_assets, n_strategies = len(calendar), len(assets), len(strategies)
+
+    # Per-share prices and the dividend cash per share collected so far (dividends in cash), and a
+    # total-return unit that keeps compounding its dividends back into the stock (dividends reinvested).
+    close = prices.to_numpy(dtype='float64')
+    paid = _dividend_matrix(calendar, assets, dividends)
+    unit_prices = np.stack([close, close * np.cumprod(1 + paid / close, axis=0)])
+    unit_cash = np.stack([np.cumsum(paid, axis=0), np.zeros_like(paid)])
+    source = np.array([s.reinvest_dividends for s in strategies], dtype=int)
+
+    frequencies = list(REBALANCE_FREQUENCIES)
+    calendar_events = np.stack([_period_starts(calendar, REBALANCE_FREQUENCIES[f]) for f in frequencies])
+    frequency = np.array([frequencies.index(s.rebalance) for s in strategies])
+    band = np.array([s.band if s.band else np.inf for s in strategies], dtype='float64')
+    cost_rate = np.array([s.cost_bps for s in strategies]) / 10_000
+
+    # Target schedules, padded to the longest one: the row in force and the day the next one takes over.
+    longest = max(len(s.targets) for s in strategies)
+    schedule_days = np.full((n_strategies, longest + 1), n_days)
+    schedule_weights = np.zeros((n_strategies, longest, n_assets))
+    for row, s in enumerate(strategies):
+        dates = s.targets.index
+        days = np.where(dates.isna(), 0, calendar.searchsorted(dates.fillna(calendar[0])))
+        schedule_days[row, :len(days)] = days
+        schedule_weights[row, :len(days)] = s.targets.reindex(columns=assets, fill_value=0.0).to_numpy()
+    schedule_days[:, 0] = 0
+    in_force = np.zeros(n_strategies, dtype=int)
+
+    units = np.zeros((n_strategies, n_assets))
+    cash = np.full(n_strategies, float(initial_value))
+    cash_basis = np.zeros((n_strategies, n_assets))
+    costs = np.zeros(n_strategies)
+    rebalances = np.zeros(n_strategies, dtype=int)
+    values = np.empty((n_days, n_strategies))
+
+    def rebalance(rows, days):
+        # Switch to the newest target schedule row that's in force, then trade to it, paying costs.
+        while True:
+            moving = schedule_days[rows, in_force[rows] + 1] <= days
+            if not moving.any():
+                break
+            in_force[rows[moving]] += 1
+        target = schedule_weights[rows, in_force[rows]]
+        unit_price = unit_prices[source[rows], days]
+        holdings = units[rows] * unit_price
+        value = holdings.sum(axis=1) + cash[rows] + np.einsum('ij,ij->i', units[rows], unit_cash[source[rows], days] - cash_basis[rows])
+        cost = cost_rate[rows] * np.abs(target * value[:, None] - holdings).sum(axis=1)
+        value = value - cost
+        units[rows] = target * value[:, None] / unit_price
+        cash[rows] = 0.0
+        cash_basis[rows] = unit_cash[source[rows], days]
+        costs[rows] += cost
+        values[days, rows] = value
+
+    everyone = np.arange(n_strategies)
+    rebalance(everyone, np.zeros(n_strategies, dtype=int))
+    day = np.zeros(n_strategies, dtype=int)
+    active = everyone
+    while len(active):
+        block = int(np.clip(block_elements // max(len(active) * n_assets, 1), 1, MAX_BLOCK_DAYS))
+        offsets = np.arange(1, block + 1)
+        days = day[active, None] + offsets
+        inside = days < n_days
+        days = np.minimum(days, n_days - 1)
+
+        sources = source[active, None]
+        holdings = units[active, None, :] * unit_prices[sources, days]
+        collected = np.einsum('ik,ijk->ij', units[active], unit_cash[sources, days] - cash_basis[active, None, :])
+        value = holdings.sum(axis=2) + cash[active, None] + collected
+
+        target = schedule_weights[active, in_force[active]]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            drift = np.abs(holdings / value[:, :, None] - target[:, None, :]).max(axis=2)
+        event = (calendar_events[frequency[active, None], days]
+                 | (days >= schedule_days[active, in_force[active] + 1][:, None])
+                 | (drift > band[active, None])) & inside
+
+        hit = event.any(axis=1)
+        last = np.where(hit, np.argmax(event, axis=1), inside.sum(axis=1) - 1)
+        record = offsets[None, :] <= (last + 1)[:, None]
+        values[days[record], np.broadcast_to(active[:, None], days.shape)[record]] = value[record]
+        day[active] = days[np.arange(len(active)), last]
+
+        if hit.any():
+            rebalance(active[hit], day[active[hit]])
+            rebalances[active[hit]] += 1
+        active = active[day[active] < n_days - 1]
+
+    names = [s.name for s in strategies]
+    return BacktestResult(strategies, pd.DataFrame(values, index=calendar, columns=names),
+                          pd.Series(costs, index=names, name='costs_paid'), pd.Series(rebalances, index=names, name='rebalances'), float(initial_value))
+
+
+def main(argv=None):
+    from analysis import fetch_dividends, load_portfolio, market_data_provider, open_data_stores
+
+    parser = argparse.ArgumentParser(description='Backtest rebalancing policies for a portfolio over its price history.')
+    parser.add_argument('csv', help="portfolio CSV or transaction ledger (its current allocation is the target), or a target weights CSV")
+    parser.add_argument('--targets', nargs='+', default=[], help="extra target weight files: 'Ticker,Weight' or a 'Date,<TICKER>...' schedule")
+    parser.add_argument('--rebalance', nargs='+', choices=list(REBALANCE_FREQUENCIES), default=['none', 'monthly', 'quarterly'])
+    parser.add_argument('--bands', nargs='+', type=float, default=[0.0], help='drift bands, e.g. 0.05 for 5 points (0 = no band)')
+    parser.add_argument('--costs-bps', nargs='+', type=float, default=[0.0, 10.0], help='transaction costs in basis points of turnover')
+    parser.add_argument('--dividends', choices=['none', 'reinvest', 'cash', 'both'], default='none',
+                        help="add dividend histories on top of the prices (only for unadjusted prices; the price store's are adjusted)")
+    parser.add_argument('--start', help='first day of the backtest (default: as far back as all targets have prices)')
+    parser.add_argument('--benchmarks', nargs='+', default=['VOO'], help="benchmark tickers or blends like 'SPY:0.6+AGG:0.4'")
+    parser.add_argument('--fixtures', default=os.environ.get('PORTFOLIO_FIXTURE_DIR'), help='read market data from a fixture directory instead of Yahoo')
+    parser.add_argument('-o', '--output', help='also write the summary table to this CSV')
+    args = parser.parse_args(argv)
+
+    price_store, dividend_cache = open_data_stores(market_data_provider(args.fixtures))
+    start = pd.Timestamp(args.start) if args.start else pd.Timestamp('1990-01-01')
+    today = pd.Timestamp.now()
+    try:
+        weight_sets = {}
+        if is_target_weights_csv(args.csv):
+            weight_sets[os.path.splitext(os.path.basename(args.csv))[0]] = read_target_weights(args.csv)
+        else:
+            lots, _ = load_portfolio(args.csv)
+            tickers = list(dict.fromkeys(lots.index))
+            latest = price_store.adjusted_close(tickers, start, today).ffill().iloc[-1]
+            current = (lots['shares'] * lots.index.map(latest).to_numpy()).groupby(level=0, sort=False).sum()
+            weight_sets['current'] = current / current.sum()
+        for path in args.targets:
+            weight_sets[os.path.splitext(os.path.basename(path))[0]] = read_target_weights(path)
+
+        reinvest = {'none': [True], 'reinvest': [True], 'cash': [False], 'both': [True, False]}[args.dividends]
+        strategies = []
+        for label, targets in weight_sets.items():
+            for s in strategy_grid(targets, args.rebalance, [b or None for b in args.bands], args.costs_bps, reinvest):
+                s.name = f'{label}_{s.name}' if len(weight_sets) > 1 else s.name
+                strategies.append(s)
+        tickers = list(dict.fromkeys(t for s in strategies for t in s.targets.columns))
+        prices = price_store.adjusted_close(tickers + benchmark_tickers(args.benchmarks), start, today)
+        dividends = fetch_dividends(dividend_cache, tickers)[0] if args.dividends != 'none' else None
+        result = run_backtest(prices, strategies, dividends, start=args.start)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    summary = result.summary(prices, args.benchmarks)
+    print(f"Backtested {len(strategies)} strategies from {result.values.index[0]:%Y-%m-%d} to {result.values.index[-1]:%Y-%m-%d}:")
+    print(summary[['final_value', 'cagr', 'volatility', 'max_drawdown', 'rebalances', 'costs_paid']
+                  + [f'alpha_vs_{args.benchmarks[0]}', f'beta_vs_{args.benchmarks[0]}']].to_string(float_format='{:,.2f}'.format))
+    if args.output:
+        summary.to_csv(args.output)
+        print(f"Full table (every benchmark statistic) is in {args.output}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+import argparse
+import glob
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from analysis import HISTORY_PADDING, compute_performance
+from benchmark_comparison import DEFAULT_BENCHMARKS, benchmark_levels, benchmark_tickers, relative_statistics
+from dividends import DividendCache, dividend_cash_by_day
+from market_data import FixtureProvider, YahooProvider
+from metrics import annualized_volatility, max_drawdown, total_return
+from portfolio_io import read_portfolio_csv
+from price_store import PriceStore
+from streaming import MetricsAccumulator
+from valuation import value_lots
+
+
+# Headless, nightly-sized runs: a folder (or manifest) full of portfolio CSVs in, one results table out.
+#
+# Market data for the union of every ticker is loaded once in the parent and parked in shared memory;
+# worker processes attach to it instead of each getting their own copy, then crunch portfolios in parallel.
+
+
+def find_portfolio_files(source):
+    """CSV paths from a directory, or from a manifest file listing one path per line."""
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, '*.csv')))
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+
+def portfolio_names(paths):
+    """A unique name per CSV: its path relative to the folder they all share, without the extension.
+
+    For a single directory that's just the file name; 'a/main.csv' and 'b/main.csv' from a manifest
+    become 'a/main' and 'b/main'. The same file listed twice gets a ' (2)' suffix.
+    """
+    if not paths:
+        return []
+    absolute = [os.path.abspath(path) for path in paths]
+    common = os.path.commonpath([os.path.dirname(path) for path in absolute])
+    names, seen = [], {}
+    for path in absolute:
+        name = os.path.splitext(os.path.relpath(path, common))[0].replace(os.sep, '/')
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f'{name} ({seen[name]})')
+    return names
+
+
+def _output_path(directory, name, extension):
+    # Names can carry subfolders ('a/main'), which get mirrored under the state / report directory.
+    path = os.path.join(directory, *name.split('/')) + extension
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def analyze_portfolio(lots, prices, latest_prices, dividend_histories, benchmark, as_of, state_path=None):
+    """Every summary number for one portfolio: (flat dict for the results table, daily value Series, lots with metrics).
+
+    `benchmark` is the primary benchmark's level Series on the price calendar (or None). With `state_path`,
+    the series metrics come from a checkpointed MetricsAccumulator that only sees new bars, and no daily
+    value Series is returned.
+    """
+    lots, row, _ = compute_performance(lots, prices, dividend_histories, as_of, latest_prices=latest_prices)
+
+    held_tickers = list(dict.fromkeys(lots.index))
+    daily_values = None
+    if state_path is None:
+        daily_values = value_lots(lots.index, lots['shares'], lots['purchase_date'], prices[held_tickers]).total
+        daily_values = daily_values[daily_values > 0]
+        row['volatility'] = annualized_volatility(daily_values)
+        row['max_drawdown'] = max_drawdown(daily_values)
+        row['benchmark_return'] = np.nan
+        if benchmark is not None and not daily_values.empty:
+            row['benchmark_return'] = total_return(benchmark, daily_values.index[0])
+    else:
+        accumulator = _update_checkpoint(state_path, lots, held_tickers, prices, dividend_histories, benchmark)
+        row['volatility'] = accumulator.volatility()
+        row['max_drawdown'] = accumulator.max_drawdown()
+        row['benchmark_return'] = accumulator.benchmark_return()
+    row['excess_return_with_dividends'] = row['percent_change_with_dividends'] - row['benchmark_return']
+    return row, daily_values, lots
+
+
+def _update_checkpoint(state_path, lots, held_tickers, prices, dividend_histories, benchmark):
+    # Resume from the saved accumulator and only value the bars it hasn't seen. If the lots changed
+    # since it was saved, or the prices it stopped at have since been re-adjusted, the history it
+    # summarizes is wrong, so start over.
+    fingerprint = hashlib.sha1(lots[['shares', 'purchase_date']].to_csv().encode()).hexdigest()
+    accumulator = MetricsAccumulator.load(state_path) if os.path.exists(state_path) else None
+    if accumulator is None or accumulator.fingerprint != fingerprint or not _same_basis(accumulator, held_tickers, prices, benchmark):
+        accumulator = MetricsAccumulator(fingerprint)
+    new_prices = prices[held_tickers]
+    if accumulator.last_date is not None:
+        new_prices = new_prices[new_prices.index > accumulator.last_date]
+
+    valuation = value_lots(lots.index, lots['shares'], lots['purchase_date'], new_prices)
+    dividend_cash = dividend_cash_by_day(valuation.calendar, valuation.holdings, valuation.tickers,
+                                         dividend_histories, after=accumulator.last_date)
+    accumulator.update_many(valuation.calendar, valuation.total.to_numpy(), dividend_cash,
+                            None if benchmark is None else benchmark.reindex(valuation.calendar).to_numpy())
+    if accumulator.last_date is not None:
+        accumulator.basis = _basis(accumulator.last_date, held_tickers, prices, benchmark).tolist()
+    accumulator.save(state_path)
+    return accumulator
+
+
+def _basis(date, held_tickers, prices, benchmark):
+    # The held closes and the benchmark level on `date`: what a checkpoint's last value was worked out from.
+    closes = prices[held_tickers].reindex([date]).to_numpy(dtype='float64')[0]
+    level = np.nan if benchmark is None else benchmark.reindex([date]).iloc[0]
+    return np.append(closes, level)
+
+
+def _same_basis(accumulator, held_tickers, prices, benchmark):
+    if accumulator.last_date is None:
+        return True
+    if accumulator.basis is None:
+        return False
+    saved = np.asarray(accumulator.basis, dtype='float64')
+    current = _basis(accumulator.last_date, held_tickers, prices, benchmark)
+    return saved.shape == current.shape and np.allclose(saved, current, rtol=1e-9, atol=0.0, equal_nan=True)
+
+
+def _share(arrays):
+    blocks, descriptors = [], {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        descriptors[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, descriptors
+
+
+def _attach(descriptors):
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in descriptors.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+_worker = {}
+
+
+def _start_worker(descriptors, tickers, dividend_tickers, benchmarks, as_of, state_dir, report_dir):
+    blocks, arrays = _attach(descriptors)
+    dates = pd.DatetimeIndex(arrays['dates'].view('datetime64[D]').astype('datetime64[ns]'))
+    prices = pd.DataFrame(arrays['prices'], index=dates, columns=tickers, copy=False)
+
+    histories = {}
+    bounds = arrays['dividend_offsets']
+    for code, ticker in enumerate(dividend_tickers):
+        lo, hi = bounds[code], bounds[code + 1]
+        event_dates = pd.DatetimeIndex(arrays['dividend_days'][lo:hi].view('datetime64[D]').astype('datetime64[ns]'))
+        histories[ticker] = pd.Series(arrays['dividend_amounts'][lo:hi], index=event_dates)
+
+    primary = pd.Series(arrays['benchmarks'][:, 0], index=dates) if benchmarks else None
+    _worker.update(blocks=blocks, prices=prices, latest_prices=pd.Series(arrays['latest'], index=tickers),
+                   histories=histories, benchmark=primary, benchmarks=benchmarks, as_of=as_of, state_dir=state_dir,
+                   report_dir=report_dir)
+    if report_dir is not None:
+        import matplotlib
+        matplotlib.use('Agg', force=True)
+
+
+def _run_one(job):
+    name, lots = job
+    state_path = None if _worker['state_dir'] is None else _output_path(_worker['state_dir'], name, '.json')
+    try:
+        row, daily_values, positions = analyze_portfolio(lots, _worker['prices'], _worker['latest_prices'], _worker['histories'],
+                                                         _worker['benchmark'], _worker['as_of'], state_path)
+        row['error'] = ''
+    except Exception as e:
+        return {'portfolio': name, 'error': f'{type(e).__name__}: {e}'}, None
+    if _worker['report_dir'] is not None:
+        row['report'] = _write_report(name, positions, row, daily_values)
+    if daily_values is not None:
+        # Send back the value history on the shared calendar so the parent can do every portfolio vs
+        # every benchmark in one go.
+        daily_values = daily_values.reindex(_worker['prices'].index).to_numpy(dtype='float64')
+    return {'portfolio': name, **row}, daily_values
+
+
+def _write_report(name, positions, row, daily_values):
+    # Rendered right here in the worker (Agg backend), so reports scale with the pool like everything else.
+    # Returns the report path, or the error if drawing failed; the numbers in `row` stand either way.
+    from analysis import compare_benchmarks, correlation_matrix
+    from report import report_payload, write_report
+
+    try:
+        path = _output_path(_worker['report_dir'], name, '.html')
+        values = pd.Series(dtype='float64') if daily_values is None else daily_values
+        normalized, table = compare_benchmarks(values, _worker['prices'], _worker['benchmarks'])
+        summary = {key: value for key, value in row.items() if key != 'error'}
+        correlation = correlation_matrix(_worker['prices'], positions.index)
+        return write_report(report_payload(name, positions, summary, values, normalized, table, correlation), path)
+    except Exception as e:
+        return f'report failed: {type(e).__name__}: {e}'
+
+
+def run_batch(paths, price_store, dividend_cache, benchmarks=DEFAULT_BENCHMARKS, workers=None, as_of=None, state_dir=None,
+              report_dir=None):
+    """Analyze every portfolio CSV in `paths` and return one results row per portfolio.
+
+    The first benchmark drives `benchmark_return`; every benchmark gets alpha / beta / tracking error /
+    information ratio / capture columns. With `state_dir`, each portfolio keeps a streaming checkpoint
+    there and only new bars get processed (the per-benchmark columns need full histories, so they're
+    left out in that mode). With `report_dir`, every portfolio also gets a self-contained HTML report
+    there, rendered off-screen by the same workers. Portfolios are named by `portfolio_names`, which
+    also keys their checkpoints and reports.
+    """
+    benchmarks = list(benchmarks)
+    for directory in (state_dir, report_dir):
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+    as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+    jobs, failed = [], []
+    for name, path in zip(portfolio_names(paths), paths):
+        try:
+            jobs.append((name, read_portfolio_csv(path)))
+        except Exception as e:
+            failed.append({'portfolio': name, 'error': f'{type(e).__name__}: {e}'})
+    if not jobs:
+        return pd.DataFrame(failed)
+
+    # Everyone's tickers get fetched together, once.
+    held_tickers = list(dict.fromkeys(t for _, lots in jobs for t in lots.index))
+    tickers = list(dict.fromkeys(held_tickers + benchmark_tickers(benchmarks)))
+    earliest = min(lots['purchase_date'].min() for _, lots in jobs)
+    prices = price_store.adjusted_close(tickers, earliest - HISTORY_PADDING, as_of)
+    histories, _ = dividend_cache.histories(held_tickers)
+
+    dividend_tickers = list(histories)
+    sizes = [len(histories[t]) for t in dividend_tickers]
+    levels = benchmark_levels(prices, benchmarks, prices.index)
+    arrays = {
+        'prices': prices.to_numpy(dtype='float64'),
+        'benchmarks': levels.to_numpy(dtype='float64'),
+        'dates': prices.index.values.astype('datetime64[D]').view('int64'),
+        'latest': prices.ffill().iloc[-1].to_numpy(dtype='float64') if len(prices) else np.full(len(tickers), np.nan),
+        'dividend_offsets': np.concatenate([[0], np.cumsum(sizes)]).astype('int64'),
+        'dividend_days': np.concatenate([histories[t].index.values.astype('datetime64[D]').view('int64') for t in dividend_tickers] + [np.empty(0, 'int64')]),
+        'dividend_amounts': np.concatenate([histories[t].to_numpy(dtype='float64') for t in dividend_tickers] + [np.empty(0)]),
+    }
+    blocks, descriptors = _share(arrays)
+    try:
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                                 initargs=(descriptors, tickers, dividend_tickers, benchmarks, as_of, state_dir, report_dir)) as pool:
+            outcomes = list(pool.map(_run_one, jobs, chunksize=max(1, len(jobs) // (workers * 8))))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    results = pd.DataFrame([row for row, _ in outcomes] + failed)
+    finished = [(row['portfolio'], values) for row, values in outcomes if values is not None]
+    if finished and benchmarks:
+        value_matrix = np.column_stack([values for _, values in finished])
+        value_matrix[~(value_matrix > 0)] = np.nan
+        portfolio_returns = pd.DataFrame(value_matrix[1:] / value_matrix[:-1] - 1, columns=[name for name, _ in finished])
+        benchmark_returns = pd.DataFrame(levels.to_numpy()[1:] / levels.to_numpy()[:-1] - 1, columns=benchmarks)
+        statistics = relative_statistics(portfolio_returns, benchmark_returns)
+        relative = pd.concat({f'{statistic}_vs_{spec}': table[spec]
+                              for statistic, table in statistics.items() for spec in benchmarks}, axis=1)
+        results = results.merge(relative, left_on='portfolio', right_index=True, how='left')
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze a directory (or manifest) of portfolio CSVs without any prompts.')
+    parser.add_argument('source', help="directory of CSVs, or a text file listing one CSV path per line")
+    parser.add_argument('-o', '--output', default='portfolio_results.csv', help='where to write the results table')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--benchmarks', nargs='+', default=list(DEFAULT_BENCHMARKS),
+                        help="benchmark tickers or blends like 'SPY:0.6+AGG:0.4'; the first one is the primary (default: VOO)")
+    parser.add_argument('--price-store', default=os.environ.get('PORTFOLIO_PRICE_STORE', '.price_store'))
+    parser.add_argument('--state-dir', default=None, help='keep per-portfolio streaming checkpoints here and only process new bars')
+    parser.add_argument('--report-dir', default=None, help='also write one self-contained HTML report per portfolio here')
+    parser.add_argument('--fixtures', default=os.environ.get('PORTFOLIO_FIXTURE_DIR'), help='read market data from a fixture directory instead of Yahoo')
+    args = parser.parse_args(argv)
+
+    provider = FixtureProvider(args.fixtures) if args.fixtures else YahooProvider()
+    price_store = PriceStore(args.price_store, provider)
+    dividend_cache = DividendCache(os.path.join(args.price_store, 'dividends'), provider)
+
+    paths = find_portfolio_files(args.source)
+    if not paths:
+        print(f"No portfolio CSVs found in {args.source}.", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    results = run_batch(paths, price_store, dividend_cache, args.benchmarks, args.workers, state_dir=args.state_dir,
+                        report_dir=args.report_dir)
+    elapsed = time.perf_counter() - started
+
+    results.to_csv(args.output, index=False)
+    failures = int((results['error'] != '').sum())
+    print(f"Analyzed {len(results)} portfolios in {elapsed:,.1f}s ({len(results) / max(elapsed, 1e-9):,.1f}/s), "
+          f"{failures} with errors. Results are in {args.output}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
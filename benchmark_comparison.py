@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from metrics import TRADING_DAYS_PER_YEAR
+
+
+# Comparing against more than one benchmark, including blends like 60/40.
+#
+# A benchmark spec is a ticker ('QQQ') or a weighted blend ('SPY:0.6+AGG:0.4', rebalanced daily). Their
+# component tickers get fetched with the holdings, and every benchmark is forward-filled onto the
+# portfolio's own calendar, so a portfolio that starts on a day the benchmark didn't trade still lines up.
+# The relative statistics are masked matrix products: every portfolio against every benchmark at once.
+
+
+DEFAULT_BENCHMARKS = ('VOO',)
+
+
+def parse_benchmark(spec):
+    """{ticker: weight} for 'VOO' or 'SPY:0.6+AGG:0.4'. Weights are normalized to sum to one."""
+    weights = {}
+    for part in spec.split('+'):
+        ticker, _, weight = part.strip().partition(':')
+        ticker = ticker.strip().upper()
+        if not ticker:
+            raise ValueError(f"Can't read benchmark '{spec}', expecting 'TICKER' or 'TICKER:weight+TICKER:weight'.")
+        weights[ticker] = weights.get(ticker, 0.0) + (float(weight) if weight else 1.0)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError(f"Benchmark '{spec}' needs positive weights.")
+    return {ticker: weight / total for ticker, weight in weights.items()}
+
+
+def benchmark_tickers(specs):
+    """Every component ticker the benchmarks need, so they can go into the same fetch as the holdings."""
+    return list(dict.fromkeys(t for spec in specs for t in parse_benchmark(spec)))
+
+
+def benchmark_levels(prices, specs, calendar):
+    """(calendar x benchmarks) index levels, each starting at 1 on its first available day.
+
+    Components are forward-filled onto `calendar` from the full price history, so a calendar day the
+    benchmark didn't trade just carries the previous close.
+    """
+    calendar = pd.DatetimeIndex(calendar)
+    components = benchmark_tickers(specs)
+    aligned = prices.reindex(columns=components).sort_index()
+    aligned = aligned.reindex(aligned.index.union(calendar)).ffill().reindex(calendar)
+
+    returns = aligned.to_numpy(dtype='float64')
+    returns = np.vstack([np.zeros((1, len(components))), returns[1:] / returns[:-1] - 1])
+    weights = np.zeros((len(components), len(specs)))
+    for column, spec in enumerate(specs):
+        for ticker, weight in parse_benchmark(spec).items():
+            weights[components.index(ticker), column] = weight
+
+    # A blend is rebalanced daily, so its return is just the weighted component returns. Days before
+    # every component has a price are NaN, then the level starts at 1.
+    blended = returns @ weights
+    started = np.isfinite(blended)
+    levels = np.where(started, np.cumprod(np.where(started, 1 + blended, 1.0), axis=0), np.nan)
+    first = np.argmax(started, axis=0)
+    base = levels[first, np.arange(len(specs))]
+    return pd.DataFrame(levels / base, index=calendar, columns=list(specs))
+
+
+def relative_statistics(portfolio_returns, benchmark_returns):
+    """Alpha, beta, tracking error, information ratio and up/down capture of every portfolio vs every benchmark.
+
+    Both inputs are daily return frames on the same calendar (days x portfolios, days x benchmarks); NaNs
+    are allowed and each pair only uses days where both have a return. Returns {statistic: DataFrame of
+    portfolios x benchmarks}. Alpha and tracking error are annualized percents, captures are percents.
+    """
+    rp = portfolio_returns.to_numpy(dtype='float64')
+    rb = benchmark_returns.to_numpy(dtype='float64')
+    mp, mb = np.isfinite(rp).astype('float64'), np.isfinite(rb).astype('float64')
+    rp, rb = np.where(mp > 0, rp, 0.0), np.where(mb > 0, rb, 0.0)
+
+    count = mp.T @ mb
+    sum_p, sum_b = rp.T @ mb, mp.T @ rb
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_p, mean_b = sum_p / count, sum_b / count
+        covariance = (rp.T @ rb - sum_p * mean_b) / (count - 1)
+        variance_p = ((rp * rp).T @ mb - sum_p * mean_p) / (count - 1)
+        variance_b = (mp.T @ (rb * rb) - sum_b * mean_b) / (count - 1)
+
+        beta = covariance / variance_b
+        alpha = (mean_p - beta * mean_b) * TRADING_DAYS_PER_YEAR * 100
+        active_variance = np.maximum(variance_p + variance_b - 2 * covariance, 0.0)
+        tracking_error = np.sqrt(active_variance * TRADING_DAYS_PER_YEAR)
+        information_ratio = (mean_p - mean_b) * TRADING_DAYS_PER_YEAR / tracking_error
+
+        up, down = (rb > 0) * mb, (rb < 0) * mb
+        up_capture = (rp.T @ up) / (mp.T @ (rb * up)) * 100
+        down_capture = (rp.T @ down) / (mp.T @ (rb * down)) * 100
+
+    def frame(values):
+        return pd.DataFrame(values, index=portfolio_returns.columns, columns=benchmark_returns.columns)
+
+    return {
+        'alpha': frame(alpha),
+        'beta': frame(beta),
+        'tracking_error': frame(tracking_error * 100),
+        'information_ratio': frame(information_ratio),
+        'up_capture': frame(up_capture),
+        'down_capture': frame(down_capture),
+    }
+
+
+def compare_to_benchmarks(portfolio_values, prices, specs=DEFAULT_BENCHMARKS):
+    """Everything the analyzer shows about one portfolio value Series vs a list of benchmarks.
+
+    Returns (normalized, table): benchmark values scaled to start at the portfolio's first value (for
+    charting), and one row per benchmark with its total return plus the relative statistics.
+    """
+    specs = list(specs)
+    levels = benchmark_levels(prices, specs, portfolio_values.index)
+    levels = levels / levels.iloc[0]
+    normalized = levels * portfolio_values.iloc[0]
+
+    portfolio_returns = portfolio_values.pct_change().to_frame()
+    statistics = relative_statistics(portfolio_returns, levels.pct_change())
+    table = pd.DataFrame({name: values.iloc[0] for name, values in statistics.items()})
+    table.insert(0, 'total_return', (levels.iloc[-1] - 1) * 100)
+    table.index.name = 'benchmark'
+    return normalized, table
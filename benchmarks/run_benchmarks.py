@@ -0,0 +1,259 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from synthetic import BENCHMARKS, SyntheticMarket
+
+
+# Times and memory-profiles each analyzer stage on synthetic markets of a few sizes, and saves the
+# numbers as JSON (one file per run, named after the time and git commit) so two versions can be compared:
+#
+#   python benchmarks/run_benchmarks.py --preset small medium
+#   python benchmarks/run_benchmarks.py --tickers 500 --days 5040 --lots 20000 --stage correlation
+#   python benchmarks/run_benchmarks.py --preset medium --compare benchmarks/results/<older run>.json
+#
+# Every stage gets its inputs built once up front, then is timed on its own: repeated until it has run
+# for about `--min-time` seconds (best and median reported), plus one separate run under tracemalloc for
+# the peak memory it allocates. Timing runs don't have tracemalloc on, since it slows numpy down.
+
+
+PRESETS = {
+    'small': (20, 1260, 50),
+    'medium': (200, 2520, 1000),
+    'large': (2000, 5040, 50000),
+}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+REGRESSION_THRESHOLD = 1.25
+
+STAGES = {}
+
+
+def stage(name):
+    """Register `setup(market) -> callable` as the benchmark for one stage."""
+    def register(setup):
+        STAGES[name] = setup
+        return setup
+    return register
+
+
+@stage('csv_load')
+def _csv_load(market):
+    from portfolio_io import read_portfolio_csv
+    text = market.portfolio_csv()
+    return lambda: read_portfolio_csv(io.StringIO(text))
+
+
+@stage('daily_value')
+def _daily_value(market):
+    from valuation import value_lots
+    lots, prices = market.lots, market.prices
+    return lambda: value_lots(lots.index, lots['shares'], lots['purchase_date'], prices).total
+
+
+@stage('dividend_attribution')
+def _dividend_attribution(market):
+    from dividends import dividends_since_purchase
+    lots, histories = market.lots, market.dividends
+    return lambda: dividends_since_purchase(histories, lots.index, lots['purchase_date'], market.prices.index[-1])
+
+
+def _portfolio_values(market):
+    from valuation import value_lots
+    values = value_lots(market.lots.index, market.lots['shares'], market.lots['purchase_date'], market.prices).total
+    return values[values > 0]
+
+
+@stage('drawdown')
+def _drawdown(market):
+    from metrics import max_drawdown
+    values = _portfolio_values(market)
+    return lambda: max_drawdown(values)
+
+
+@stage('volatility')
+def _volatility(market):
+    from metrics import annualized_volatility
+    values = _portfolio_values(market)
+    return lambda: annualized_volatility(values)
+
+
+@stage('correlation')
+def _correlation(market):
+    from analysis import correlation_matrix
+    tickers = list(dict.fromkeys(market.lots.index))
+    return lambda: correlation_matrix(market.prices, tickers)
+
+
+@stage('benchmark_normalization')
+def _benchmark_normalization(market):
+    from benchmark_comparison import compare_to_benchmarks
+    values = _portfolio_values(market)
+    return lambda: compare_to_benchmarks(values, market.prices, BENCHMARKS)
+
+
+@stage('efficient_frontier')
+def _efficient_frontier(market):
+    from optimization import PortfolioOptimizer
+    from rolling_risk import daily_returns
+    returns = pd.DataFrame(daily_returns(market.prices[market.tickers])[1:], columns=market.tickers)
+    return lambda: PortfolioOptimizer(returns, max_weight=max(0.05, 2 / len(market.tickers))).efficient_frontier(100)
+
+
+@stage('rebalancing_backtest')
+def _rebalancing_backtest(market):
+    from backtest import run_backtest, strategy_grid
+    targets = pd.Series(1.0, index=list(dict.fromkeys(market.lots.index)))
+    strategies = strategy_grid(targets, ('none', 'monthly', 'quarterly'), (None, 0.02, 0.05), (0.0, 10.0), (True, False))
+    return lambda: run_backtest(market.prices, strategies, market.dividends).summary(market.prices, BENCHMARKS)
+
+
+@stage('chart_rendering')
+def _chart_rendering(market):
+    from analysis import compute_performance, correlation_matrix
+    from benchmark_comparison import compare_to_benchmarks
+    from report import CHARTS, _render_chart, _use_agg, report_payload
+
+    _use_agg()
+    values = _portfolio_values(market)
+    positions, summary, _ = compute_performance(market.lots, market.prices, market.dividends, market.prices.index[-1])
+    normalized, table = compare_to_benchmarks(values, market.prices, BENCHMARKS)
+    payload = report_payload(market.label, positions, summary, values, normalized, table,
+                             correlation_matrix(market.prices, positions.index))
+    _render_chart(('allocation', payload))  # first draw pays for importing matplotlib / seaborn
+    return lambda: [_render_chart((chart, payload)) for chart in CHARTS]
+
+
+@stage('end_to_end')
+def _end_to_end(market):
+    # The whole non-drawing pipeline through the price store and dividend cache, on fixture files.
+    from analysis import analyze, load_portfolio, open_data_stores
+    from market_data import FixtureProvider
+
+    root = tempfile.mkdtemp(prefix='portfolio_bench_')
+    path = market.write_fixtures(os.path.join(root, 'fixtures'))
+    price_store, dividend_cache = open_data_stores(FixtureProvider(os.path.join(root, 'fixtures')), os.path.join(root, 'store'))
+    as_of = market.prices.index[-1] + pd.Timedelta(days=1)
+
+    def run():
+        lots, _ = load_portfolio(path)
+        return analyze(lots, price_store, dividend_cache, BENCHMARKS, as_of=as_of)
+    run()  # fill the store, so what's timed is the steady state of a repeat run
+    return run
+
+
+def measure(function, min_time=1.0, max_repeats=50):
+    """Best / median seconds over enough repeats to fill `min_time`, plus peak traced memory in MB."""
+    times = []
+    while len(times) < max_repeats and (not times or sum(times) < min_time):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'best_s': min(times), 'median_s': float(np.median(times)), 'repeats': len(times), 'peak_mb': peak / 1e6}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit or 'unknown',
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run_suite(sizes, stages, seed=0, min_time=1.0):
+    """Results for every (size, stage) as a list of flat dicts."""
+    rows = []
+    for n_tickers, n_days, n_lots in sizes:
+        market = SyntheticMarket(n_tickers, n_days, n_lots, seed)
+        for name in stages:
+            row = {'size': market.label, 'tickers': n_tickers, 'days': n_days, 'lots': n_lots, 'stage': name}
+            try:
+                row.update(measure(STAGES[name](market), min_time))
+            except Exception as e:
+                row['error'] = f'{type(e).__name__}: {e}'
+            rows.append(row)
+            print(f"{market.label:>20} {name:<24} " + (
+                f"best {row['best_s'] * 1000:10.2f} ms   median {row['median_s'] * 1000:10.2f} ms   peak {row['peak_mb']:9.1f} MB"
+                if 'error' not in row else row['error']), flush=True)
+    return rows
+
+
+def compare(rows, baseline_path, threshold=REGRESSION_THRESHOLD):
+    """Print new / old best times side by side and return the (size, stage) pairs that got slower than `threshold`."""
+    with open(baseline_path) as f:
+        baseline = {(r['size'], r['stage']): r for r in json.load(f)['results'] if 'best_s' in r}
+    slower = []
+    print(f"\nCompared with {baseline_path}:")
+    for row in rows:
+        old = baseline.get((row['size'], row['stage']))
+        if old is None or 'best_s' not in row:
+            continue
+        ratio = row['best_s'] / old['best_s']
+        flag = '  <-- slower' if ratio > threshold else ''
+        print(f"{row['size']:>20} {row['stage']:<24} {ratio:6.2f}x time   {row['peak_mb'] / max(old['peak_mb'], 1e-9):6.2f}x memory{flag}")
+        if ratio > threshold:
+            slower.append((row['size'], row['stage']))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time and memory-profile every analyzer stage on synthetic data.')
+    parser.add_argument('--preset', nargs='+', choices=sorted(PRESETS), default=None, help='named sizes (default: small medium)')
+    parser.add_argument('--tickers', nargs='+', type=int, help='ticker counts (combined with --days and --lots)')
+    parser.add_argument('--days', nargs='+', type=int, default=[2520], help='history lengths in trading days')
+    parser.add_argument('--lots', nargs='+', type=int, default=[1000], help='lot counts')
+    parser.add_argument('--stage', nargs='+', choices=sorted(STAGES), default=list(STAGES), help='stages to run (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds of repeats per stage')
+    parser.add_argument('-o', '--output', help=f'where to save the results JSON (default: a new file in {RESULTS_DIR})')
+    parser.add_argument('--compare', help='an earlier results JSON to compare against; exits 1 on a regression')
+    args = parser.parse_args(argv)
+    warnings.filterwarnings('ignore')
+
+    if args.tickers:
+        sizes = [(t, d, l) for t in args.tickers for d in args.days for l in args.lots]
+    else:
+        sizes = [PRESETS[name] for name in (args.preset or ['small', 'medium'])]
+
+    info = environment()
+    rows = run_suite(sizes, args.stage, args.seed, args.min_time)
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{info['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': info, 'seed': args.seed, 'results': rows}, f, indent=2)
+    print(f"\nSaved {len(rows)} results to {output}")
+
+    if args.compare and compare(rows, args.compare):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from market_data import write_dividend_fixtures, write_price_fixtures
+
+
+# Deterministic fake markets for the benchmarks: same seed and sizes, same prices, dividends and lots,
+# on any machine and any day (the calendar ends on a fixed date, not today).
+#
+# Prices are geometric random walks sharing one market factor, tickers list on staggered dates (NaN
+# before that, like real histories), about half of them pay quarterly dividends, and lots are bought at
+# the actual price on their purchase day. Two extra columns act as the equity and bond benchmarks.
+
+
+END_DATE = pd.Timestamp('2024-12-31')
+EQUITY_BENCHMARK = 'BENCH_EQ'
+BOND_BENCHMARK = 'BENCH_BD'
+BENCHMARKS = (EQUITY_BENCHMARK, f'{EQUITY_BENCHMARK}:0.6+{BOND_BENCHMARK}:0.4')
+
+
+class SyntheticMarket:
+    """Adjusted closes, dividend events and a portfolio for `n_tickers` x `n_days` with `n_lots` lots."""
+
+    def __init__(self, n_tickers=50, n_days=2520, n_lots=200, seed=0):
+        self.n_tickers = n_tickers
+        self.n_days = n_days
+        self.n_lots = n_lots
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+
+        calendar = pd.bdate_range(end=END_DATE, periods=n_days)
+        tickers = [f'T{i:05d}' for i in range(n_tickers)]
+        market = rng.normal(0.0003, 0.01, n_days)
+        betas = rng.uniform(0.5, 1.5, n_tickers)
+        log_returns = market[:, None] * betas + rng.normal(0.0001, 0.015, (n_days, n_tickers))
+        closes = 20 * np.exp(rng.normal(0, 1, n_tickers) + np.cumsum(log_returns, axis=0))
+        listed = rng.integers(0, n_days // 3, n_tickers)
+        listed[: max(1, n_tickers // 2)] = 0
+        closes[np.arange(n_days)[:, None] < listed] = np.nan
+
+        bond = 100 * np.exp(np.cumsum(rng.normal(0.0001, 0.003, n_days)))
+        index = 100 * np.exp(np.cumsum(market))
+        self.tickers = tickers
+        self.prices = pd.DataFrame(closes, index=calendar, columns=tickers)
+        self.prices[EQUITY_BENCHMARK] = index
+        self.prices[BOND_BENCHMARK] = bond
+
+        # Quarterly payers: every 63 trading days from a random phase, about 0.5% of the price each time.
+        self.dividends = {}
+        for column in np.flatnonzero(rng.random(n_tickers) < 0.5):
+            rows = np.arange(int(listed[column]) + rng.integers(0, 63), n_days, 63)
+            amounts = closes[rows, column] * rng.uniform(0.003, 0.007, len(rows))
+            self.dividends[tickers[column]] = pd.Series(amounts, index=calendar[rows])
+
+        lot_columns = rng.integers(0, n_tickers, n_lots)
+        lot_rows = listed[lot_columns] + (rng.random(n_lots) * (n_days - listed[lot_columns] - 1)).astype(int)
+        self.lots = pd.DataFrame({
+            'ticker': np.array(tickers)[lot_columns],
+            'shares': rng.integers(1, 200, n_lots).astype('float64'),
+            'purchase_date': calendar[lot_rows],
+            'purchase_price': closes[lot_rows, lot_columns].round(2),
+        }).set_index('ticker')
+
+    @property
+    def label(self):
+        return f'{self.n_tickers}t_{self.n_days}d_{self.n_lots}l'
+
+    def portfolio_csv(self):
+        """The lots as the analyzer's `Ticker,Shares,Purchase_Date,Purchase_Price` CSV text."""
+        lots = self.lots.reset_index()
+        lots['purchase_date'] = lots['purchase_date'].dt.strftime('%Y-%m-%d')
+        lots.columns = ['Ticker', 'Shares', 'Purchase_Date', 'Purchase_Price']
+        return lots.to_csv(index=False)
+
+    def write_fixtures(self, root):
+        """Prices, dividends and `portfolio.csv` in a FixtureProvider directory; returns the CSV path."""
+        write_price_fixtures(root, self.prices)
+        write_dividend_fixtures(root, self.dividends)
+        path = os.path.join(root, 'portfolio.csv')
+        with open(path, 'w') as f:
+            f.write(self.portfolio_csv())
+        return path
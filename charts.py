@@ -0,0 +1,68 @@
+# The analyzer's charts, one function per figure. Each returns the matplotlib Figure and leaves showing
+# or saving it to the caller; matplotlib is only imported when a chart is actually drawn.
+
+
+def allocation_pie(positions):
+    """Donut of what each lot is worth right now."""
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(10, 7))
+    plt.pie(positions['whatsItWorthNow'],
+            labels=positions.index,
+            autopct='%1.1f%%',
+            startangle=90,
+            pctdistance=0.85,
+            wedgeprops=dict(width=0.4))
+    plt.title('Where Your Money Is Right Now (Current Portfolio Allocation)', fontsize=16)
+    plt.axis('equal')
+    return figure
+
+
+def gain_bars(positions):
+    """Percent gain/loss (with dividends) per lot, losers in red."""
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(12, 6))
+    what_stock_gained_or_lost_sorted = positions.sort_values('percentGainLossIncludingDivs', ascending=True)
+    the_bar_colors = ['lightcoral' if x < 0 else 'lightgreen' for x in what_stock_gained_or_lost_sorted['percentGainLossIncludingDivs']]
+    plt.bar(what_stock_gained_or_lost_sorted.index, what_stock_gained_or_lost_sorted['percentGainLossIncludingDivs'], color=the_bar_colors)
+    plt.axhline(0, color='grey', linewidth=0.8)
+    plt.xlabel('Your Amazing Ticker Symbol', fontsize=12)
+    plt.ylabel('Percentage Gain/Loss (Including Dividends!) (%)', fontsize=12)
+    plt.title('How Each of Your Stocks Performed (Percentage Gain/Loss, Including Dividends)', fontsize=16)
+    plt.xticks(rotation=45, ha='right')
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    return figure
+
+
+def value_history(values):
+    """The portfolio's daily value over time."""
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(14, 7))
+    plt.plot(values.index, values.to_numpy(), label='Your Portfolio Value', color='blue', linewidth=2)
+    plt.xlabel('Date, My Friend', fontsize=12)
+    plt.ylabel('Value (In Dollars!) ($)', fontsize=12)
+    plt.title('The Historical Rollercoaster of Your Portfolio Value', fontsize=16)
+    plt.grid(True, linestyle='--', alpha=0.6)
+    plt.legend()
+    plt.tight_layout()
+    return figure
+
+
+def benchmark_lines(values, normalized):
+    """Portfolio value against every benchmark, scaled to start at the same value."""
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(14, 7))
+    plt.plot(values.index, values.to_numpy(), label='Your Amazing Portfolio Value', color='blue', linewidth=2)
+    for the_benchmark_name in normalized.columns:
+        plt.plot(normalized.index, normalized[the_benchmark_name].to_numpy(), label=f'{the_benchmark_name} (Normalized Benchmark)', linestyle='--', linewidth=2)
+    plt.xlabel('Date in Time', fontsize=12)
+    plt.ylabel('Value (Money!) ($)', fontsize=12)
+    plt.title('Your Portfolio\'s Grand Performance vs. The Market (Normalized)', fontsize=16)
+    plt.grid(True, linestyle='--', alpha=0.6)
+    plt.legend()
+    plt.tight_layout()
+    return figure
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+
+# Correlations for universes far too big to print or annotate cell by cell.
+#
+# Returns are centered and scaled once, then the matrix is filled in square blocks so temporaries stay
+# at block_size^2 no matter how many tickers there are. Gaps from staggered listing dates are handled
+# pairwise: each pair only uses the days both tickers traded, same answer as DataFrame.corr().
+
+
+DEFAULT_BLOCK_SIZE = 512
+ANNOTATE_LIMIT = 30
+HEATMAP_MAX_CELLS = 120
+
+
+def _standardize(returns, dtype):
+    values = np.asarray(returns, dtype='float64')
+    valid = np.isfinite(values)
+    # Plain sums rather than nanmean/nanstd, which warn on every ticker without a single price.
+    counts = np.maximum(valid.sum(axis=0), 1)
+    filled = np.where(valid, values, 0.0)
+    mean = filled.sum(axis=0) / counts
+    scale = np.sqrt(np.where(valid, (filled - mean) ** 2, 0.0).sum(axis=0) / counts)
+    scale[scale == 0] = 1.0
+    standardized = np.where(valid, (values - mean) / scale, 0.0).astype(dtype)
+    return standardized, valid.astype(dtype)
+
+
+def pairwise_correlation(returns, block_size=DEFAULT_BLOCK_SIZE, dtype='float64', min_periods=2):
+    """Pearson correlation of every column pair of a (days x tickers) returns frame, NaN-aware.
+
+    Works through the matrix in `block_size` squares; `dtype='float32'` halves memory and roughly
+    doubles matmul speed. Pairs with fewer than `min_periods` shared days come back NaN.
+    """
+    columns = returns.columns
+    z, mask = _standardize(returns, dtype)
+    n = z.shape[1]
+    corr = np.empty((n, n), dtype=dtype)
+    complete = bool(mask.all())
+
+    for i in range(0, n, block_size):
+        zi, mi = z[:, i:i + block_size], mask[:, i:i + block_size]
+        for j in range(i, n, block_size):
+            zj, mj = z[:, j:j + block_size], mask[:, j:j + block_size]
+            if complete:
+                # No gaps: the data is already standardized, so it's just an inner product.
+                block = zi.T @ zj / len(z)
+            else:
+                count = mi.T @ mj
+                sum_i, sum_j = zi.T @ mj, mi.T @ zj
+                squares_i, squares_j = (zi * zi).T @ mj, mi.T @ (zj * zj)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    block = (count * (zi.T @ zj) - sum_i * sum_j) / np.sqrt(
+                        (count * squares_i - sum_i * sum_i) * (count * squares_j - sum_j * sum_j))
+                block[count < min_periods] = np.nan
+            corr[i:i + block_size, j:j + block_size] = block
+            corr[j:j + block_size, i:i + block_size] = block.T
+
+    np.clip(corr, -1, 1, out=corr)
+    np.fill_diagonal(corr, 1)
+    return pd.DataFrame(corr, index=columns, columns=columns)
+
+
+def ledoit_wolf_intensity(returns, block_size=DEFAULT_BLOCK_SIZE):
+    """Ledoit-Wolf optimal shrinkage of the correlation matrix towards the identity (0 = none, 1 = all).
+
+    Days a ticker didn't trade count as an average day for it, which is fine for picking an intensity.
+    """
+    z, _ = _standardize(returns, 'float64')
+    days, n = z.shape
+    if days == 0 or n == 0:
+        return 0.0
+    sample_norm = 0.0
+    for i in range(0, n, block_size):
+        for j in range(0, n, block_size):
+            block = z[:, i:i + block_size].T @ z[:, j:j + block_size] / days
+            sample_norm += np.sum(block * block)
+    squared_row_norms = np.sum(z * z, axis=1)
+    average_variance = np.sum(squared_row_norms) / days / n
+    distance = (sample_norm - n * average_variance ** 2) / n
+    noise = (np.sum(squared_row_norms ** 2) / days - sample_norm) / (n * days)
+    return 0.0 if distance <= 0 else float(min(noise, distance) / distance)
+
+
+def shrink_correlation(corr, intensity, target='identity'):
+    """Blend a correlation matrix towards the identity or towards its average off-diagonal correlation."""
+    values = corr.to_numpy(dtype='float64')
+    if target == 'identity':
+        anchor = np.eye(len(values))
+    elif target == 'constant':
+        off_diagonal = values[~np.eye(len(values), dtype=bool)]
+        anchor = np.full(values.shape, np.nanmean(off_diagonal) if len(off_diagonal) else 0.0)
+        np.fill_diagonal(anchor, 1)
+    else:
+        raise ValueError(f"Unknown shrinkage target '{target}', expecting 'identity' or 'constant'.")
+    shrunk = (1 - intensity) * np.nan_to_num(values, nan=0.0) + intensity * anchor
+    return pd.DataFrame(shrunk.astype(corr.to_numpy().dtype), index=corr.index, columns=corr.columns)
+
+
+def top_pairs(corr, k=10, most=True):
+    """The k most (or least) correlated distinct pairs as a (ticker_a, ticker_b, correlation) frame."""
+    rows, cols = np.triu_indices(len(corr), 1)
+    values = corr.to_numpy()[rows, cols].astype('float64')
+    keep = np.isfinite(values)
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+    k = min(k, len(values))
+    if k == 0:
+        return pd.DataFrame(columns=['ticker_a', 'ticker_b', 'correlation'])
+    ranked = -values if most else values
+    best = np.argpartition(ranked, k - 1)[:k]
+    best = best[np.argsort(ranked[best], kind='stable')]
+    return pd.DataFrame({
+        'ticker_a': corr.index[rows[best]],
+        'ticker_b': corr.columns[cols[best]],
+        'correlation': values[best],
+    })
+
+
+def cluster_order(corr):
+    """Positions that put similar tickers next to each other.
+
+    Uses scipy's average-linkage clustering when scipy is installed, otherwise sorts by the angle in
+    the plane of the two leading eigenvectors, which gives a similar banded picture.
+    """
+    values = np.nan_to_num(corr.to_numpy(dtype='float64'), nan=0.0)
+    n = len(values)
+    if n < 3:
+        return np.arange(n)
+    try:
+        from scipy.cluster.hierarchy import leaves_list, linkage
+        from scipy.spatial.distance import squareform
+    except ImportError:
+        _, vectors = np.linalg.eigh(values)
+        return np.argsort(np.arctan2(vectors[:, -2], vectors[:, -1]), kind='stable')
+    distance = np.sqrt(np.clip(0.5 * (1 - values), 0, None))
+    np.fill_diagonal(distance, 0)
+    return leaves_list(linkage(squareform(distance, checks=False), method='average'))
+
+
+def heatmap_matrix(corr, max_cells=HEATMAP_MAX_CELLS, order=None):
+    """Clustered matrix ready to draw; above `max_cells` tickers, neighbours are averaged into groups."""
+    order = cluster_order(corr) if order is None else order
+    ordered = corr.iloc[order, order]
+    n = len(ordered)
+    if n <= max_cells:
+        return ordered
+    groups = np.arange(n) * max_cells // n
+    values = np.nan_to_num(ordered.to_numpy(dtype='float64'), nan=0.0)
+    counts = np.bincount(groups, minlength=max_cells).astype('float64')
+    membership = np.zeros((n, max_cells))
+    membership[np.arange(n), groups] = 1.0
+    averaged = membership.T @ values @ membership / np.outer(counts, counts)
+    labels = [f"{ordered.index[np.flatnonzero(groups == g)[0]]}..({int(counts[g])})" for g in range(max_cells)]
+    return pd.DataFrame(averaged, index=labels, columns=labels)
+
+
+def plot_correlation_heatmap(corr, title='How Your Stocks Dance Together (Correlation Heatmap)', max_cells=HEATMAP_MAX_CELLS):
+    """Draw the (clustered, possibly aggregated) heatmap and return the figure. Annotates small matrices only."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    matrix = heatmap_matrix(corr, max_cells)
+    size = len(matrix)
+    annotate = size <= ANNOTATE_LIMIT
+    figure = plt.figure(figsize=(min(max(size * 0.8, 6), 24), min(max(size * 0.7, 5), 21)))
+    sns.heatmap(matrix, annot=annotate, cmap='coolwarm', fmt=".2f", linewidths=.5 if annotate else 0,
+                vmin=-1, vmax=1, xticklabels=size <= 2 * ANNOTATE_LIMIT or 'auto', yticklabels=size <= 2 * ANNOTATE_LIMIT or 'auto')
+    plt.title(title, fontsize=16)
+    plt.xticks(rotation=45, ha='right')
+    plt.yticks(rotation=0)
+    plt.tight_layout()
+    return figure
@@ -0,0 +1,316 @@
+import numpy as np
+import pandas as pd
+
+from valuation import PortfolioValuation, holdings_matrix
+
+
+# Brokerage transaction ledgers: one row per buy, sell, split or dividend, millions of rows of them.
+#
+# The CSV is read in chunks with categorical tickers, and every chunk's tickers become integer codes
+# against one growing ticker list, so the whole ledger ends up as a few flat numpy columns. Rows are
+# sorted by (ticker, date, file order), splits are folded into today's share units, and the lot
+# accounting is running sums per ticker instead of a Python object per lot:
+#   fifo    - the k-th share sold is the k-th share bought, so a sale's cost is the cumulative-cost curve
+#             read across its range of cumulative shares sold (one np.interp for all tickers at once).
+#   lifo    - a buy's shares sit on the stack right above the position it started from, and the only thing
+#             that eats into them is the lowest the position falls afterwards: a reversed running minimum.
+#   average - sales don't change the average cost, buys blend into it, so the cost basis is a running
+#             sum scaled by the running product of (1 - fraction sold), kept in log space.
+
+
+LEDGER_COLUMNS = {
+    'Date': 'date',
+    'Ticker': 'ticker',
+    'Action': 'action',
+    'Quantity': 'quantity',
+    'Price': 'price',
+    'Fees': 'fees'
+}
+
+BUY, SELL, SPLIT, DIVIDEND, REINVEST = range(5)
+ACTIONS = {
+    'BUY': BUY, 'BOUGHT': BUY,
+    'SELL': SELL, 'SOLD': SELL,
+    'SPLIT': SPLIT,
+    'DIVIDEND': DIVIDEND, 'DIV': DIVIDEND,
+    'REINVEST': REINVEST, 'DRIP': REINVEST,
+}
+LOT_METHODS = ('fifo', 'lifo', 'average')
+DEFAULT_CHUNK_ROWS = 250_000
+SHARE_TOLERANCE = 1e-6
+LOG_REBASE = 300.0
+
+
+def is_ledger_csv(path_or_buffer):
+    """True if the CSV header looks like a transaction ledger (it has an 'Action' column)."""
+    header = pd.read_csv(path_or_buffer, nrows=0).columns.str.strip()
+    if hasattr(path_or_buffer, 'seek'):
+        path_or_buffer.seek(0)
+    return 'Action' in header
+
+
+def _running_total(values, starts):
+    # Cumulative sum that restarts wherever `starts` is True (rows are already grouped). A grouped cumsum
+    # rather than one global cumsum minus offsets, so a big ticker can't eat the precision of a small one.
+    return pd.Series(values).groupby(np.cumsum(starts)).cumsum().to_numpy()
+
+
+def _segment_last(values, starts):
+    # Each row gets the value on the last row of its segment.
+    segment = np.cumsum(starts) - 1
+    ends = np.append(np.flatnonzero(starts)[1:], len(values)) - 1
+    return values[ends][segment]
+
+
+class Ledger:
+    """A transaction ledger as flat arrays, sorted by (ticker, date, file order).
+
+    Quantities and prices are already in today's share units (split-adjusted), which is what adjusted
+    closes are quoted in. Split rows stay in the arrays but no longer move any shares.
+    """
+
+    def __init__(self, tickers, codes, days, actions, quantities, prices, fees, skipped_rows=0):
+        order = np.lexsort((np.arange(len(codes)), days, codes))
+        self.tickers = pd.Index(tickers)
+        self.codes = codes[order]
+        self.days = days[order]
+        self.actions = actions[order]
+        self.fees = fees[order]
+        self.skipped_rows = skipped_rows
+        self.starts = np.ones(len(order), dtype=bool)
+        self.starts[1:] = self.codes[1:] != self.codes[:-1]
+
+        # A split multiplies every share held before it, so scale each row by the product of the split
+        # ratios that come after it for the same ticker.
+        quantities, prices = quantities[order], prices[order]
+        is_split = (self.actions == SPLIT) & (quantities > 0)
+        log_ratio = np.where(is_split, np.log(np.where(is_split, quantities, 1.0)), 0.0)
+        splits_after = np.exp(_segment_last(_running_total(log_ratio, self.starts), self.starts)
+                              - _running_total(log_ratio, self.starts))
+        self.quantities = np.where(is_split, 0.0, quantities * splits_after)
+        self.prices = prices / splits_after
+
+        self.buys = (self.actions == BUY) | (self.actions == REINVEST)
+        self.sells = self.actions == SELL
+        self.share_changes = np.where(self.buys, self.quantities, np.where(self.sells, -self.quantities, 0.0))
+        self.positions = _running_total(self.share_changes, self.starts)
+        short = self.positions < -SHARE_TOLERANCE * (1 + _running_total(np.where(self.buys, self.quantities, 0.0), self.starts))
+        if short.any():
+            raise ValueError(f"The ledger sells more shares than it bought for: {sorted(set(self.tickers[self.codes[short]]))}.")
+        self.positions = np.maximum(self.positions, 0.0)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def dates(self):
+        return self.days.astype('datetime64[D]')
+
+    @property
+    def dividend_cash(self):
+        """Cash dividends per row: DIVIDEND rows, plus the cash behind REINVEST buys."""
+        paid = (self.actions == DIVIDEND) | (self.actions == REINVEST)
+        return np.where(paid, self.quantities * self.prices, 0.0)
+
+
+def read_ledger(path_or_buffer, chunksize=DEFAULT_CHUNK_ROWS):
+    """Stream a `Date,Ticker,Action,Quantity,Price[,Fees]` CSV into a Ledger.
+
+    Actions are BUY, SELL, SPLIT (Quantity is the ratio, 2 for 2-for-1), DIVIDEND (Quantity x Price is
+    the cash, e.g. shares held x amount per share) and REINVEST (a buy paid for with a dividend). Rows
+    with an unknown action, ticker or date are skipped and counted in `skipped_rows`; a missing column
+    raises ValueError.
+    """
+    ticker_codes = {}
+    parts = []
+    skipped_rows = 0
+    action_codes = pd.Series(ACTIONS)
+    reader = pd.read_csv(path_or_buffer, chunksize=chunksize, dtype={
+        'Ticker': 'category', 'Action': 'category', 'Quantity': 'float64', 'Price': 'float64', 'Fees': 'float32'})
+
+    for chunk in reader:
+        chunk.columns = chunk.columns.str.strip()
+        chunk = chunk.rename(columns=LEDGER_COLUMNS)
+        missing = [name for name in list(LEDGER_COLUMNS.values())[:5] if name not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing ledger columns: {missing}. Expecting 'Date', 'Ticker', 'Action', 'Quantity', 'Price' (and optionally 'Fees').")
+
+        # Only the chunk's distinct tickers go through Python; the rows themselves stay as integer codes.
+        tickers = chunk['ticker'].astype('category')
+        names = tickers.cat.categories.astype(str).str.strip().str.upper()
+        lookup = np.array([ticker_codes.setdefault(name, len(ticker_codes)) for name in names] + [-1], dtype='int32')
+        codes = lookup[tickers.cat.codes.to_numpy()]
+
+        actions = chunk['action'].astype('category')
+        kinds = action_codes.reindex(actions.cat.categories.astype(str).str.strip().str.upper()).fillna(-1).to_numpy()
+        kinds = np.append(kinds, -1).astype('int8')[actions.cat.codes.to_numpy()]
+
+        days = pd.to_datetime(chunk['date'], errors='coerce').to_numpy().astype('datetime64[D]')
+        quantities = pd.to_numeric(chunk['quantity'], errors='coerce').to_numpy(dtype='float64')
+        prices = pd.to_numeric(chunk['price'], errors='coerce').fillna(0.0).to_numpy(dtype='float64')
+        fees = pd.to_numeric(chunk['fees'], errors='coerce').fillna(0.0).to_numpy(dtype='float32') if 'fees' in chunk else np.zeros(len(chunk), dtype='float32')
+
+        keep = (codes >= 0) & (kinds >= 0) & ~np.isnat(days) & np.isfinite(quantities)
+        skipped_rows += int((~keep).sum())
+        parts.append((codes[keep], days[keep].astype('int32'), kinds[keep], np.abs(quantities[keep]), prices[keep], fees[keep]))
+
+    if not parts:
+        parts = [(np.array([], dtype='int32'), np.array([], dtype='int32'), np.array([], dtype='int8'),
+                  np.array([]), np.array([]), np.array([], dtype='float32'))]
+    return Ledger(list(ticker_codes), *(np.concatenate(column) for column in zip(*parts)), skipped_rows=skipped_rows)
+
+
+class LotAccounting:
+    """Result of running a ledger through FIFO / LIFO / average-cost lot accounting.
+
+    `open_lots` is the analyzer's usual lot frame (indexed by ticker; shares, purchase_date, purchase_price)
+    for whatever is still held. `positions` has one row per ticker: shares, cost_basis, proceeds,
+    realized_cost, realized_pnl and dividends.
+    """
+
+    def __init__(self, method, ledger, open_lots, positions):
+        self.method = method
+        self.ledger = ledger
+        self.open_lots = open_lots
+        self.positions = positions
+
+    @property
+    def realized_pnl(self):
+        return self.positions['realized_pnl'].sum()
+
+    def unrealized_pnl(self, latest_prices):
+        """Per-ticker gain on what's still held, at `latest_prices` (a Series by ticker)."""
+        return self.positions['shares'] * latest_prices.reindex(self.positions.index) - self.positions['cost_basis']
+
+    def dividends_per_share(self, lots=None):
+        """Recorded dividend cash of each ticker, spread evenly over the shares still held in `lots`."""
+        lots = self.open_lots if lots is None else lots
+        per_share = (self.positions['dividends'] / self.positions['shares']).replace([np.inf, -np.inf], 0.0).fillna(0.0)
+        return lots.index.map(per_share).to_numpy(dtype='float64')
+
+
+def _average_cost_basis(buy_cost, log_keep, runs):
+    # basis_t = kept_t * sum(cost_i / kept_i) where kept is the running product of (1 - fraction sold).
+    # Long runs of partial sales would push those products out of float range, so each run is cut into
+    # pieces spanning at most LOG_REBASE of log(kept); pieces are exact on their own and only the basis
+    # carried from one piece into the next needs a (short) Python loop.
+    log_kept = _running_total(log_keep, runs)
+    bucket = np.floor(-log_kept / LOG_REBASE)
+    pieces = runs.copy()
+    pieces[1:] |= bucket[1:] != bucket[:-1]
+    relative = _running_total(log_keep, pieces)
+    partial = np.exp(relative) * _running_total(buy_cost * np.exp(-relative), pieces)
+
+    piece_starts = np.flatnonzero(pieces)
+    carried = np.zeros(len(piece_starts))
+    for p in np.flatnonzero(~runs[piece_starts]):
+        end = piece_starts[p] - 1
+        carried[p] = np.exp(relative[end]) * carried[p - 1] + partial[end]
+    return np.exp(relative) * carried[np.cumsum(pieces) - 1] + partial
+
+
+def _fifo_remaining(ledger, bought_after, sold_total):
+    # A buy still holds whatever part of its [bought before, bought after] range lies past everything sold.
+    return np.where(ledger.buys, np.clip(bought_after - np.maximum(bought_after - ledger.quantities, sold_total), 0.0, None), 0.0)
+
+
+def account_lots(ledger, method='fifo'):
+    """Cost basis, realized P&L and the lots still held, under `method` ('fifo', 'lifo' or 'average')."""
+    if method not in LOT_METHODS:
+        raise ValueError(f"Unknown lot method '{method}', expecting one of {LOT_METHODS}.")
+    starts, group = ledger.starts, np.cumsum(ledger.starts) - 1
+    n_groups = int(starts.sum())
+    bought = np.where(ledger.buys, ledger.quantities, 0.0)
+    sold = np.where(ledger.sells, ledger.quantities, 0.0)
+    buy_cost = np.where(ledger.buys, ledger.quantities * ledger.prices + ledger.fees, 0.0)
+    proceeds = np.where(ledger.sells, ledger.quantities * ledger.prices - ledger.fees, 0.0)
+    bought_after = _running_total(bought, starts)
+    sold_after = _running_total(sold, starts)
+    sold_total = _segment_last(sold_after, starts)
+    fifo_remaining = _fifo_remaining(ledger, bought_after, sold_total)
+    unit_cost = np.divide(buy_cost, ledger.quantities, out=np.zeros(len(ledger)), where=ledger.quantities > 0)
+
+    if method == 'fifo':
+        # Lay every ticker's cumulative (shares bought, cost) curve end to end, each starting at its own
+        # offset, and read off each sale's cost between its cumulative-sold before and after.
+        bought_total = _segment_last(bought_after, starts)[starts]
+        offsets = np.concatenate([[0.0], np.cumsum(bought_total + 1)[:-1]])
+        curve = ledger.buys & (ledger.quantities > 0)
+        x = np.concatenate([offsets, offsets[group[curve]] + bought_after[curve]])
+        y = np.concatenate([np.zeros(n_groups), _running_total(buy_cost, starts)[curve]])
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+        limit = bought_total[group]
+        sale_cost = (np.interp(offsets[group] + np.minimum(sold_after, limit), x, y)
+                     - np.interp(offsets[group] + np.minimum(sold_after - sold, limit), x, y))
+        realized_cost = np.where(ledger.sells, sale_cost, 0.0)
+        remaining = fifo_remaining
+        remaining_cost = remaining * unit_cost
+        lot_prices = unit_cost
+    elif method == 'lifo':
+        # Suffix minimum of the position within each ticker; tickers are offset so one can't leak into the next.
+        peaks = np.maximum.reduceat(ledger.positions, np.flatnonzero(starts)) if len(ledger) else np.array([])
+        offsets = np.concatenate([[0.0], np.cumsum(peaks + 1)[:-1]])
+        shifted = ledger.positions + offsets[group]
+        lowest_after = np.minimum.accumulate(shifted[::-1])[::-1] - offsets[group]
+        remaining = np.where(ledger.buys, np.clip(lowest_after - (ledger.positions - ledger.quantities), 0.0, ledger.quantities), 0.0)
+        remaining_cost = remaining * unit_cost
+        realized_cost = np.zeros(len(ledger))
+        # Per-sale cost isn't pinned down without replaying the stack, but the total is: whatever was bought
+        # and isn't left anymore. Booked on each ticker's last row.
+        ends = np.append(np.flatnonzero(starts)[1:], len(ledger)) - 1
+        realized_cost[ends] = np.bincount(group, buy_cost - remaining_cost, minlength=n_groups)
+        lot_prices = unit_cost
+    else:
+        # A new averaging run starts whenever a position has been fully closed out.
+        closed = ledger.positions <= SHARE_TOLERANCE
+        runs = starts.copy()
+        runs[1:] |= closed[:-1]
+        before = ledger.positions - ledger.share_changes
+        fraction = np.divide(sold, before, out=np.zeros(len(ledger)), where=before > 0)
+        keep = np.log(np.where(fraction < 1, 1 - np.minimum(fraction, 1), 1.0))
+        basis = np.where(closed, 0.0, _average_cost_basis(buy_cost, keep, runs))
+        basis_before = np.where(runs, 0.0, np.concatenate([[0.0], basis[:-1]]))
+        realized_cost = np.where(ledger.sells, basis_before * np.minimum(fraction, 1), 0.0)
+        remaining = fifo_remaining
+        average = np.divide(basis, ledger.positions, out=np.zeros(len(ledger)), where=ledger.positions > SHARE_TOLERANCE)
+        lot_prices = _segment_last(average, starts)
+        remaining_cost = remaining * lot_prices
+
+    held = remaining > SHARE_TOLERANCE
+    open_lots = pd.DataFrame({
+        'shares': remaining[held],
+        'purchase_date': pd.DatetimeIndex(ledger.dates[held]).as_unit('ns'),
+        'purchase_price': lot_prices[held],
+    }, index=pd.Index(ledger.tickers[ledger.codes[held]], name='ticker'))
+
+    def per_ticker(values):
+        return np.bincount(group, values, minlength=n_groups)
+
+    realized_cost_by_ticker = per_ticker(realized_cost)
+    proceeds_by_ticker = per_ticker(proceeds)
+    positions = pd.DataFrame({
+        'shares': per_ticker(remaining),
+        'cost_basis': per_ticker(remaining_cost),
+        'proceeds': proceeds_by_ticker,
+        'realized_cost': realized_cost_by_ticker,
+        'realized_pnl': proceeds_by_ticker - realized_cost_by_ticker,
+        'dividends': per_ticker(ledger.dividend_cash),
+    }, index=pd.Index(ledger.tickers[ledger.codes[starts]], name='ticker'))
+    return LotAccounting(method, ledger, open_lots, positions)
+
+
+def value_ledger(accounting, prices):
+    """Daily value of everything the ledger held, sells included, against `prices` (trading days x tickers)."""
+    ledger = accounting.ledger
+    calendar = pd.DatetimeIndex(prices.index)
+    trades = ledger.buys | ledger.sells
+    price_matrix = np.nan_to_num(prices.reindex(columns=ledger.tickers).to_numpy(dtype='float64'))
+    holdings = holdings_matrix(calendar, len(ledger.tickers), ledger.codes[trades], ledger.dates[trades],
+                               ledger.share_changes[trades])
+
+    lots = accounting.open_lots
+    lot_start_rows = np.searchsorted(
+        calendar.values, pd.DatetimeIndex(lots['purchase_date']).values.astype(calendar.values.dtype), side='left')
+    return PortfolioValuation(calendar, ledger.tickers, holdings, price_matrix, ledger.tickers.get_indexer(lots.index),
+                              lot_start_rows, lots['shares'].to_numpy(dtype='float64'))
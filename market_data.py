@@ -0,0 +1,131 @@
+import os
+import re
+import time
+
+import pandas as pd
+
+
+# Where the raw market data comes from. The price store (and everything built on top of it)
+# only ever talks to one of these, so swapping Yahoo for a folder of CSVs is a one-liner.
+
+
+def safe_file_name(ticker):
+    # Tickers like 'BRK-B' are fine on disk, but '^GSPC' or 'EUR=X' are not everywhere.
+    return re.sub(r'[^A-Za-z0-9.\-]', lambda m: '_%02X' % ord(m.group(0)), ticker)
+
+
+class MarketDataProvider:
+    """Base class for market data sources."""
+
+    def fetch_prices(self, tickers, start, end):
+        """Adjusted closes for `tickers` in [start, end) as a DataFrame (dates x tickers)."""
+        raise NotImplementedError
+
+    def fetch_dividends(self, ticker):
+        """Full dividend history for one ticker as a Series of cash per share indexed by ex-date."""
+        raise NotImplementedError
+
+
+class YahooProvider(MarketDataProvider):
+    """Live data from Yahoo Finance. yfinance is only imported when we actually go online."""
+
+    def fetch_prices(self, tickers, start, end):
+        import yfinance as yf
+
+        tickers = list(tickers)
+        raw = yf.download(tickers, start=start, end=end, auto_adjust=False, progress=False)
+        if raw.empty:
+            return pd.DataFrame()
+        adjusted = raw['Adj Close']
+        if isinstance(adjusted, pd.Series):
+            adjusted = adjusted.to_frame(tickers[0])
+        adjusted.index = pd.DatetimeIndex(adjusted.index).tz_localize(None).normalize()
+        return adjusted
+
+    def fetch_dividends(self, ticker):
+        import yfinance as yf
+
+        dividends = yf.Ticker(ticker).dividends
+        dividends.index = pd.DatetimeIndex(dividends.index).tz_localize(None).normalize()
+        return dividends
+
+
+class FixtureProvider(MarketDataProvider):
+    """Offline, deterministic data read from a directory of CSVs.
+
+    Layout is `<root>/prices/<TICKER>.csv` with `Date,Adj Close` columns and `<root>/dividends/<TICKER>.csv`
+    with `Date,Dividends` (see `write_price_fixtures` / `write_dividend_fixtures`). Tickers without a file
+    simply come back missing, same as an unknown symbol on Yahoo.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _read(self, kind, ticker):
+        path = os.path.join(self.root, kind, safe_file_name(ticker) + '.csv')
+        if not os.path.exists(path):
+            return None
+        return pd.read_csv(path, index_col=0, parse_dates=True).iloc[:, 0]
+
+    def fetch_prices(self, tickers, start, end):
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        columns = {}
+        for ticker in tickers:
+            series = self._read('prices', ticker)
+            if series is None:
+                continue
+            columns[ticker] = series[(series.index >= start) & (series.index < end)]
+        if not columns:
+            return pd.DataFrame()
+        return pd.DataFrame(columns).sort_index()
+
+    def fetch_dividends(self, ticker):
+        dividends = self._read('dividends', ticker)
+        if dividends is None:
+            return pd.Series(dtype='float64', index=pd.DatetimeIndex([]), name='Dividends')
+        return dividends
+
+
+class InMemoryProvider(MarketDataProvider):
+    """Market data straight from a (dates x tickers) price frame and a {ticker: dividend Series} dict.
+
+    Meant as a stub for tests and benchmarks: `price_calls` and `dividend_calls` count the requests it got,
+    and `delay_seconds` makes every request take that long, like a slow network would.
+    """
+
+    def __init__(self, prices, dividends=None, delay_seconds=0.0):
+        self.prices = prices.sort_index()
+        self.dividends = dividends or {}
+        self.delay_seconds = delay_seconds
+        self.price_calls = 0
+        self.dividend_calls = 0
+
+    def fetch_prices(self, tickers, start, end):
+        self.price_calls += 1
+        time.sleep(self.delay_seconds)
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        window = self.prices[(self.prices.index >= start) & (self.prices.index < end)]
+        return window[[t for t in tickers if t in window.columns]].dropna(how='all')
+
+    def fetch_dividends(self, ticker):
+        self.dividend_calls += 1
+        time.sleep(self.delay_seconds)
+        return self.dividends.get(ticker, pd.Series(dtype='float64', index=pd.DatetimeIndex([]), name='Dividends'))
+
+
+def write_price_fixtures(root, prices):
+    """Dump a (dates x tickers) DataFrame of adjusted closes into a FixtureProvider directory."""
+    os.makedirs(os.path.join(root, 'prices'), exist_ok=True)
+    for ticker in prices.columns:
+        series = prices[ticker].dropna()
+        series.index.name = 'Date'
+        series.rename('Adj Close').to_csv(os.path.join(root, 'prices', safe_file_name(ticker) + '.csv'))
+
+
+def write_dividend_fixtures(root, dividends):
+    """Dump a {ticker: Series of cash per share by ex-date} mapping into a FixtureProvider directory."""
+    os.makedirs(os.path.join(root, 'dividends'), exist_ok=True)
+    for ticker, series in dividends.items():
+        series = series.copy()
+        series.index.name = 'Date'
+        series.rename('Dividends').to_csv(os.path.join(root, 'dividends', safe_file_name(ticker) + '.csv'))
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+# The numbers the analyzer reports, as plain functions so the interactive script and the batch runner
+# agree on every formula.
+
+
+TRADING_DAYS_PER_YEAR = 252
+DAYS_PER_YEAR = 365.25
+
+
+def add_position_metrics(portfolio, as_of):
+    """Fill in invested / worth-now / change / CAGR columns for each lot (needs `current_price`)."""
+    portfolio['totalAmountInvested'] = portfolio['shares'] * portfolio['purchase_price']
+    portfolio['whatsItWorthNow'] = portfolio['shares'] * portfolio['current_price']
+    portfolio['dollarChange'] = portfolio['whatsItWorthNow'] - portfolio['totalAmountInvested']
+    portfolio['percentChange'] = (portfolio['dollarChange'] / portfolio['totalAmountInvested']) * 100
+
+    portfolio['howLongYouHeldItYears'] = (as_of - portfolio['purchase_date']).dt.days / DAYS_PER_YEAR
+    portfolio['yearlyGrowthPercent'] = np.where(
+        portfolio['howLongYouHeldItYears'] > 0,
+        ((1 + (portfolio['percentChange'] / 100))**(1 / portfolio['howLongYouHeldItYears']) - 1) * 100,
+        portfolio['percentChange']
+    )
+    return portfolio
+
+
+def add_dividend_metrics(portfolio, dividends_per_share):
+    """Fill in the dividend columns from cash-per-share received by each lot."""
+    portfolio['allMyDividendsReceived'] = np.asarray(dividends_per_share) * portfolio['shares'].values
+    portfolio['whatsItWorthNowPlusDividends'] = portfolio['whatsItWorthNow'] + portfolio['allMyDividendsReceived']
+    portfolio['totalGainLossIncludingDivs'] = portfolio['whatsItWorthNowPlusDividends'] - portfolio['totalAmountInvested']
+    portfolio['percentGainLossIncludingDivs'] = (portfolio['totalGainLossIncludingDivs'] / portfolio['totalAmountInvested']) * 100
+    return portfolio
+
+
+def _growth_rate(end_value, start_value, years, fallback):
+    if years > 0 and start_value > 0:
+        return ((end_value / start_value)**(1 / years) - 1) * 100
+    elif start_value > 0:
+        return fallback
+    return 0
+
+
+def portfolio_summary(portfolio, as_of):
+    """Whole-portfolio totals, percent changes and CAGRs from a frame with position and dividend metrics."""
+    invested = portfolio['totalAmountInvested'].sum()
+    current_value = portfolio['whatsItWorthNow'].sum()
+    value_with_dividends = portfolio['whatsItWorthNowPlusDividends'].sum()
+    dollar_change = current_value - invested
+    dollar_change_with_dividends = portfolio['totalGainLossIncludingDivs'].sum()
+    percent_change = (dollar_change / invested) * 100 if invested > 0 else 0
+    percent_change_with_dividends = (dollar_change_with_dividends / invested) * 100 if invested > 0 else 0
+    years_held = (as_of - portfolio['purchase_date'].min()).days / DAYS_PER_YEAR
+    return {
+        'total_invested': invested,
+        'current_value': current_value,
+        'dividends': portfolio['allMyDividendsReceived'].sum(),
+        'value_with_dividends': value_with_dividends,
+        'dollar_change': dollar_change,
+        'percent_change': percent_change,
+        'dollar_change_with_dividends': dollar_change_with_dividends,
+        'percent_change_with_dividends': percent_change_with_dividends,
+        'years_held': years_held,
+        'cagr': _growth_rate(current_value, invested, years_held, percent_change),
+        'cagr_with_dividends': _growth_rate(value_with_dividends, invested, years_held, percent_change_with_dividends),
+    }
+
+
+def max_drawdown(values):
+    """Deepest peak-to-trough drop of a value series, in percent (0 for an empty series)."""
+    values = np.asarray(values, dtype='float64')
+    if len(values) == 0:
+        return 0
+    return (np.min(values / np.maximum.accumulate(values)) - 1) * 100
+
+
+def annualized_volatility(values):
+    """Annualized standard deviation of daily percent changes, in percent."""
+    values = np.asarray(values, dtype='float64')
+    if len(values) < 3:
+        return 0
+    daily_changes = values[1:] / values[:-1] - 1
+    return np.std(daily_changes, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR) * 100
+
+
+def total_return(prices, start):
+    """Percent change of a price series from its first bar on or after `start` to its last bar."""
+    prices = prices.dropna()
+    prices = prices[prices.index >= pd.Timestamp(start)]
+    if prices.empty:
+        return np.nan
+    return ((prices.iloc[-1] / prices.iloc[0]) - 1) * 100
@@ -0,0 +1,169 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# Forward-looking risk: simulate where today's holdings could be in a month, a quarter, a year.
+#
+# Paths are generated chunk by chunk, so memory is (chunk x assets) no matter how many paths you ask
+# for. Every chunk gets its own child of one SeedSequence, which makes a run reproducible from its seed
+# and gives the same answer whether the chunks run here or spread over a process pool.
+
+
+DEFAULT_HORIZONS = (21, 63, 252)
+DEFAULT_CONFIDENCE_LEVELS = (0.95, 0.99)
+DEFAULT_CHUNK_SIZE = 10_000
+MIN_COMPLETE_DAYS = 60
+
+
+def _clean_returns(returns):
+    # Prefer days where every asset traded; if staggered listings leave too few, fill gaps with the asset's
+    # average day instead of throwing history away.
+    values = np.asarray(returns, dtype='float64')
+    complete = values[np.isfinite(values).all(axis=1)]
+    if len(complete) >= MIN_COMPLETE_DAYS:
+        return complete
+    means = np.nan_to_num(np.nanmean(np.where(np.isfinite(values), values, np.nan), axis=0))
+    return np.where(np.isfinite(values), values, means)
+
+
+def _cholesky(covariance):
+    jitter = 0.0
+    scale = np.mean(np.diag(covariance)) if len(covariance) else 1.0
+    for _ in range(10):
+        try:
+            return np.linalg.cholesky(covariance + jitter * np.eye(len(covariance)))
+        except np.linalg.LinAlgError:
+            jitter = max(jitter * 10, scale * 1e-10)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    return eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+
+_simulation = {}
+
+
+def _start_simulation(horizons, method, model, weights, block_length):
+    # Everything but the seed and path count is the same for every chunk, so each process gets it once
+    # (as the pool initializer) rather than with every job; a bootstrap model is the whole history.
+    _simulation.update(horizons=horizons, method=method, model=model, weights=weights, block_length=block_length)
+
+
+def _simulate_chunk(job):
+    seed, n_paths = job
+    horizons, method, model = _simulation['horizons'], _simulation['method'], _simulation['model']
+    weights, block_length = _simulation['weights'], _simulation['block_length']
+    rng = np.random.default_rng(seed)
+    values = np.empty((len(horizons), n_paths))
+    # Buy and hold only needs each asset's cumulative log return at each horizon, not every day of the path.
+    cumulative = np.zeros((n_paths, len(weights)))
+
+    if method == 'bootstrap':
+        # Circular block bootstrap: stitch together runs of `block_length` consecutive historical days.
+        # Running sums over the (wrapped) history make any run's total a single subtraction.
+        running = model
+        n_days = len(running) // 2
+        elapsed = 0
+        for _ in range(-(-max(horizons) // block_length)):
+            starts = rng.integers(0, n_days, size=n_paths)
+            for slot, horizon in enumerate(horizons):
+                if elapsed < horizon <= elapsed + block_length:
+                    partial = cumulative + running[starts + horizon - elapsed] - running[starts]
+                    values[slot] = np.exp(partial) @ weights
+            cumulative += running[starts + block_length] - running[starts]
+            elapsed += block_length
+    else:
+        # Normal daily log returns add up to a normal over any stretch, so one draw per horizon step is exact.
+        mean, factor = model
+        elapsed = 0
+        for slot, horizon in enumerate(horizons):
+            steps = horizon - elapsed
+            shocks = rng.standard_normal((n_paths, len(weights))) @ factor.T
+            cumulative += steps * mean + np.sqrt(steps) * shocks
+            values[slot] = np.exp(cumulative) @ weights
+            elapsed = horizon
+    return values
+
+
+class SimulationResult:
+    """Simulated portfolio values per horizon, plus VaR / CVaR summaries."""
+
+    def __init__(self, initial_value, horizons, terminal_values, confidence_levels):
+        self.initial_value = initial_value
+        self.horizons = horizons
+        self.terminal_values = terminal_values
+        self.confidence_levels = confidence_levels
+
+    def value_at_risk(self, horizon, confidence):
+        """Loss (in dollars) that's only exceeded with probability 1 - confidence."""
+        return self.initial_value - np.quantile(self.terminal_values[horizon], 1 - confidence)
+
+    def conditional_value_at_risk(self, horizon, confidence):
+        """Average loss (in dollars) in the worst 1 - confidence of paths."""
+        values = self.terminal_values[horizon]
+        cutoff = np.quantile(values, 1 - confidence)
+        return self.initial_value - values[values <= cutoff].mean()
+
+    def summary(self):
+        rows = []
+        for horizon in self.horizons:
+            values = self.terminal_values[horizon]
+            row = {
+                'horizon_days': horizon,
+                'mean_value': values.mean(),
+                'median_value': np.median(values),
+                'p05_value': np.quantile(values, 0.05),
+                'p95_value': np.quantile(values, 0.95),
+                'chance_of_loss_percent': (values < self.initial_value).mean() * 100,
+            }
+            for confidence in self.confidence_levels:
+                label = f'{confidence * 100:g}'
+                row[f'VaR_{label}'] = self.value_at_risk(horizon, confidence)
+                row[f'CVaR_{label}'] = self.conditional_value_at_risk(horizon, confidence)
+            rows.append(row)
+        return pd.DataFrame(rows).set_index('horizon_days')
+
+
+def simulate_portfolio(returns, holding_values, horizons=DEFAULT_HORIZONS, n_paths=100_000, method='parametric',
+                       block_length=10, chunk_size=DEFAULT_CHUNK_SIZE, seed=None,
+                       confidence_levels=DEFAULT_CONFIDENCE_LEVELS, workers=1):
+    """Monte Carlo buy-and-hold simulation of the current holdings.
+
+    `returns` is the (days x assets) historical daily returns matrix and `holding_values` the dollars in
+    each of those assets today. `method='parametric'` draws correlated normal log returns from the historical
+    mean and covariance (via Cholesky); `method='bootstrap'` resamples blocks of real historical days,
+    keeping fat tails and volatility clustering. With `workers > 1` the chunks run on a process pool.
+
+    Since nothing is rebalanced, a path's value at a horizon depends only on each asset's total log return
+    up to then, so the work per path scales with the number of horizons (or blocks), not days.
+    """
+    if method not in ('parametric', 'bootstrap'):
+        raise ValueError(f"Unknown simulation method '{method}', expecting 'parametric' or 'bootstrap'.")
+    horizons = tuple(sorted(set(int(h) for h in horizons)))
+    history = _clean_returns(returns)
+    holding_values = np.asarray(holding_values, dtype='float64')
+    initial_value = holding_values.sum()
+
+    log_returns = np.log1p(np.maximum(history, -0.999999))
+    if method == 'bootstrap':
+        wrapped = np.concatenate([log_returns, log_returns])
+        model = np.concatenate([np.zeros((1, wrapped.shape[1])), np.cumsum(wrapped, axis=0)])
+        block_length = min(block_length, len(log_returns))
+    else:
+        model = (log_returns.mean(axis=0), _cholesky(np.atleast_2d(np.cov(log_returns, rowvar=False))))
+
+    chunk_sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    jobs = list(zip(seeds, chunk_sizes))
+    shared = (horizons, method, model, holding_values, block_length)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_start_simulation, initargs=shared) as pool:
+            chunks = list(pool.map(_simulate_chunk, jobs))
+    else:
+        _start_simulation(*shared)
+        chunks = [_simulate_chunk(job) for job in jobs]
+
+    all_values = np.concatenate(chunks, axis=1)
+    terminal_values = {horizon: all_values[slot] for slot, horizon in enumerate(horizons)}
+    return SimulationResult(initial_value, horizons, terminal_values, confidence_levels)
@@ -0,0 +1,327 @@
+import numpy as np
+import pandas as pd
+
+from correlation import ledoit_wolf_intensity, pairwise_correlation, shrink_correlation
+from metrics import TRADING_DAYS_PER_YEAR
+
+
+# Where the money could go instead: minimum-variance, maximum-Sharpe, risk-parity and target-volatility
+# weights, plus the efficient frontier, from the same daily returns matrix the rest of the analyzer uses.
+#
+# Everything is solved without an external solver. Mean-variance problems (min w'Cw/2 - t mu'w with the
+# weights summing to 1 between a floor and a cap) go through accelerated projected gradient, batched: one
+# row of a (problems x assets) weights matrix per risk-aversion setting, so a whole frontier costs one
+# (problems x assets) @ (assets x assets) product per iteration. Risk parity is a small Newton solve.
+# Returns and volatilities come out in percent, like metrics.py.
+
+
+MIN_OBSERVATIONS = 20
+DEFAULT_FRONTIER_POINTS = 50
+REFINE_POINTS = 32
+TARGET_ROUNDS = 3
+MAX_ITERATIONS = 5000
+TOLERANCE = 1e-8
+GAP_TOLERANCE = 1e-7
+
+
+def annualized_covariance(returns, shrinkage='ledoit-wolf', target='constant'):
+    """Annualized covariance of a (days x assets) daily returns frame, with the correlations shrunk.
+
+    `shrinkage` is 'ledoit-wolf' (the optimal intensity), a number between 0 and 1, or None for the
+    plain sample estimate; `target` is what the correlations are shrunk towards (see
+    correlation.shrink_correlation). Gaps from staggered listings are handled pairwise, and the result
+    is nudged to the nearest positive semi-definite matrix when the pairwise estimate isn't one.
+    """
+    returns = pd.DataFrame(returns)
+    values = returns.to_numpy(dtype='float64')
+    valid = np.isfinite(values)
+    counts = valid.sum(axis=0)
+    filled = np.where(valid, values, 0.0)
+    means = filled.sum(axis=0) / np.maximum(counts, 1)
+    deviations = np.where(valid, filled - means, 0.0)
+    volatility = np.sqrt((deviations ** 2).sum(axis=0) / np.maximum(counts - 1, 1) * TRADING_DAYS_PER_YEAR)
+
+    if shrinkage == 'ledoit-wolf':
+        intensity = ledoit_wolf_intensity(returns)
+    else:
+        intensity = float(shrinkage or 0.0)
+    correlations = shrink_correlation(pairwise_correlation(returns), intensity, target).to_numpy()
+    covariance = _positive_semidefinite(np.nan_to_num(correlations) * np.outer(volatility, volatility))
+    return pd.DataFrame(covariance, index=returns.columns, columns=returns.columns)
+
+
+def _positive_semidefinite(matrix):
+    matrix = (matrix + matrix.T) / 2
+    try:
+        np.linalg.cholesky(matrix + 1e-12 * np.mean(np.diag(matrix)) * np.eye(len(matrix)))
+        return matrix
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(matrix)
+        repaired = (eigenvectors * np.clip(eigenvalues, 0, None)) @ eigenvectors.T
+        return (repaired + repaired.T) / 2
+
+
+def annualized_mean_returns(returns):
+    """Average daily return of each column, annualized (arithmetic), ignoring gaps."""
+    values = pd.DataFrame(returns).to_numpy(dtype='float64')
+    valid = np.isfinite(values)
+    means = np.where(valid, values, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    return pd.Series(means * TRADING_DAYS_PER_YEAR, index=pd.DataFrame(returns).columns)
+
+
+def evaluate_weights(weights, expected_returns, covariance, risk_free_rate=0.0):
+    """Expected return, volatility (both in percent) and Sharpe ratio of many weight vectors at once.
+
+    `weights` is (candidates x assets), a frame or array, in the same asset order as `expected_returns`
+    and `covariance`. Each statistic is one matrix product over all candidates.
+    """
+    index = weights.index if isinstance(weights, pd.DataFrame) else None
+    weights = np.atleast_2d(np.asarray(weights, dtype='float64'))
+    mu = np.asarray(expected_returns, dtype='float64')
+    sigma = np.asarray(covariance, dtype='float64')
+    expected = weights @ mu
+    volatility = np.sqrt(np.maximum(np.einsum('ij,ij->i', weights @ sigma, weights), 0.0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sharpe = np.where(volatility > 0, (expected - risk_free_rate) / volatility, np.nan)
+    return pd.DataFrame({'expected_return': expected * 100, 'volatility': volatility * 100, 'sharpe': sharpe}, index=index)
+
+
+def _project(v, lower, upper, tau=None, iterations=60):
+    # Euclidean projection of every row of v onto {lower <= w <= upper, sum(w) = 1}: w = clip(v - tau)
+    # for the row's tau. The sum is piecewise linear and decreasing in tau, so a Newton step on it (kept
+    # inside a bisection bracket) lands on the exact tau in a few steps, fewer still from a warm start.
+    low = (v - upper).min(axis=1)
+    high = (v - lower).max(axis=1)
+    tau = (low + high) / 2 if tau is None else np.clip(tau, low, high)
+    for _ in range(iterations):
+        w = np.clip(v - tau[:, None], lower, upper)
+        excess = w.sum(axis=1) - 1
+        if np.all(np.abs(excess) < 1e-12):
+            break
+        low = np.where(excess > 0, tau, low)
+        high = np.where(excess < 0, tau, high)
+        free = ((v - tau[:, None] > lower) & (v - tau[:, None] < upper)).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = tau + excess / free
+        inside = (free > 0) & (step > low) & (step < high)
+        tau = np.where(inside, step, (low + high) / 2)
+    return np.clip(v - tau[:, None], lower, upper), tau
+
+
+def _duality_gap(w, gradient, lower, upper):
+    # Frank-Wolfe gap g'(w - s), with s the weights minimizing g's over the capped simplex: fill the
+    # lowest-gradient assets up to the cap first. For a convex objective it bounds how far above the
+    # optimum w still is.
+    n = w.shape[1]
+    fill = np.clip(1 - n * lower - (upper - lower) * np.arange(n), 0.0, upper - lower)
+    best = lower * gradient.sum(axis=1) + np.sort(gradient, axis=1) @ fill
+    return np.einsum('ij,ij->i', gradient, w) - best
+
+
+def _solve_mean_variance(mu, sigma, aversions, lower, upper, start=None, lipschitz=None):
+    # Row k minimizes w'Cw/2 - aversions[k] mu'w over the capped simplex: FISTA with adaptive restart.
+    # Rows that have converged drop out, so the batch shrinks as it goes. A row that has stopped moving
+    # only counts as converged once its duality gap is small next to the objective's own terms: on an
+    # ill-conditioned covariance the steps can get tiny well before the optimum.
+    lipschitz = lipschitz or float(np.linalg.eigvalsh(sigma)[-1])
+    step = 1.0 / max(lipschitz, 1e-18)
+    aversions = np.asarray(aversions, dtype='float64')[:, None]
+    if start is None:
+        start = np.full((len(aversions), len(mu)), 1.0 / len(mu))
+    w, tau = _project(np.array(start, dtype='float64'), lower, upper)
+    y, momentum = w.copy(), np.ones(len(w))
+    active = np.arange(len(w))
+    for _ in range(MAX_ITERATIONS):
+        gradient = y[active] @ sigma - aversions[active] * mu
+        w_next, tau[active] = _project(y[active] - step * gradient, lower, upper, tau[active])
+        change = w_next - w[active]
+        w[active] = w_next
+        done = np.max(np.abs(change), axis=1) < TOLERANCE
+        if done.any():
+            settled, reward = w_next[done], aversions[active[done], 0] * (w_next[done] @ mu)
+            settled_gradient = settled @ sigma - aversions[active[done]] * mu
+            risk = np.einsum('ij,ij->i', settled_gradient, settled) + reward
+            gap = _duality_gap(settled, settled_gradient, lower, upper)
+            done[done] = gap <= GAP_TOLERANCE * (np.abs(risk) + np.abs(reward) + 1e-18)
+        # Restart the momentum of any row that just moved uphill.
+        uphill = np.einsum('ij,ij->i', gradient, change) > 0
+        momentum_next = np.where(uphill, 1.0, (1 + np.sqrt(1 + 4 * momentum[active] ** 2)) / 2)
+        y[active] = w_next + np.where(uphill, 0.0, (momentum[active] - 1) / momentum_next)[:, None] * change
+        momentum[active] = momentum_next
+        active = active[~done]
+        if len(active) == 0:
+            break
+    return w
+
+
+def _risk_parity(sigma, iterations=100):
+    # Equal risk contributions: minimize y'Cy/2 - mean(log y) over y > 0 by damped Newton, then w = y / sum(y).
+    n = len(sigma)
+    budget = np.full(n, 1.0 / n)
+    y = 1.0 / np.sqrt(np.maximum(np.diag(sigma), 1e-18))
+    y *= np.sqrt(1.0 / max(y @ sigma @ y, 1e-18))
+
+    def objective(point):
+        return point @ sigma @ point / 2 - budget @ np.log(point)
+
+    for _ in range(iterations):
+        gradient = sigma @ y - budget / y
+        hessian = sigma + np.diag(budget / (y * y))
+        direction = np.linalg.solve(hessian, -gradient)
+        if -gradient @ direction < 1e-20:
+            break
+        t = 1.0
+        while np.any(y + t * direction <= 0) or objective(y + t * direction) > objective(y) + 0.25 * t * gradient @ direction:
+            t /= 2
+            if t < 1e-12:
+                break
+        y = y + t * direction
+    return y / y.sum()
+
+
+class PortfolioOptimizer:
+    """Optimal weights for the assets of a (days x assets) daily returns frame.
+
+    `long_only=True` keeps every weight between 0 and `max_weight`; with `long_only=False` weights can go
+    down to -max_weight (short). Assets with fewer than MIN_OBSERVATIONS returns are left out (weight 0,
+    listed in `excluded`). Every method returns weights as a Series over all the original columns.
+    """
+
+    def __init__(self, returns, shrinkage='ledoit-wolf', long_only=True, max_weight=1.0, risk_free_rate=0.0,
+                 shrinkage_target='constant'):
+        returns = pd.DataFrame(returns)
+        observed = np.isfinite(returns.to_numpy(dtype='float64')).sum(axis=0)
+        self.columns = returns.columns
+        self.assets = returns.columns[observed >= MIN_OBSERVATIONS]
+        self.excluded = list(returns.columns[observed < MIN_OBSERVATIONS])
+        if len(self.assets) == 0:
+            raise ValueError(f"Need at least {MIN_OBSERVATIONS} daily returns for some asset to optimize.")
+        if max_weight * len(self.assets) < 1:
+            raise ValueError(f"A cap of {max_weight:.2%} can't be met with only {len(self.assets)} assets.")
+        self.long_only = long_only
+        self.max_weight = float(max_weight)
+        self.lower = 0.0 if long_only else -self.max_weight
+        self.risk_free_rate = risk_free_rate
+        self.expected_returns = annualized_mean_returns(returns[self.assets])
+        self.covariance = annualized_covariance(returns[self.assets], shrinkage, shrinkage_target)
+        self._mu = self.expected_returns.to_numpy()
+        self._sigma = self.covariance.to_numpy()
+        self._lipschitz = float(np.linalg.eigvalsh(self._sigma)[-1])
+        # Risk aversions that span the frontier, from all-variance to practically all-return.
+        self._aversion_scale = self._lipschitz / max(np.ptp(self._mu), 1e-12)
+
+    def _weights(self, values, name=None):
+        return pd.Series(values, index=self.assets, name=name).reindex(self.columns, fill_value=0.0)
+
+    def _solve(self, aversions, start=None):
+        return _solve_mean_variance(self._mu, self._sigma, aversions, self.lower, self.max_weight,
+                                    start, self._lipschitz)
+
+    def evaluate(self, weights):
+        """evaluate_weights() against this optimizer's expected returns and covariance.
+
+        `weights` is (candidates x assets) over either all the original columns or just `assets`.
+        """
+        if isinstance(weights, pd.DataFrame):
+            weights = weights.reindex(columns=self.assets, fill_value=0.0)
+        elif isinstance(weights, pd.Series):
+            weights = weights.reindex(self.assets, fill_value=0.0).to_frame().T
+        else:
+            weights = np.atleast_2d(np.asarray(weights, dtype='float64'))
+            if weights.shape[1] == len(self.columns) and len(self.columns) != len(self.assets):
+                weights = weights[:, self.columns.get_indexer(self.assets)]
+        return evaluate_weights(weights, self._mu, self._sigma, self.risk_free_rate)
+
+    def min_variance(self):
+        return self._weights(self._solve([0.0])[0], 'min_variance')
+
+    def _path(self, n_points):
+        # Solutions along a geometric grid of risk aversions (plus 0), warm-started from the min-variance weights.
+        aversions = np.concatenate([[0.0], self._aversion_scale * np.geomspace(1e-3, 1e3, n_points - 1)])
+        start = np.repeat(self._solve([0.0]), len(aversions), axis=0)
+        return aversions, self._solve(aversions, start)
+
+    def _refine(self, aversions, weights, best, score):
+        # Re-solve on a finer grid between the neighbours of row `best` and keep the highest `score`.
+        low, high = aversions[max(best - 1, 0)], aversions[min(best + 1, len(aversions) - 1)]
+        finer = np.linspace(low, high, REFINE_POINTS)
+        candidates = self._solve(finer, np.repeat(weights[best:best + 1], REFINE_POINTS, axis=0))
+        candidates = np.vstack([weights[best:best + 1], candidates])
+        return candidates[int(np.nanargmax(score(self.evaluate(candidates))))]
+
+    def max_sharpe(self, n_points=DEFAULT_FRONTIER_POINTS):
+        """The tangency portfolio: highest (return - risk free) / volatility on the frontier."""
+        aversions, weights = self._path(n_points)
+        best = int(np.nanargmax(self.evaluate(weights)['sharpe'].fillna(-np.inf)))
+        return self._weights(self._refine(aversions, weights, best, lambda stats: stats['sharpe'].fillna(-np.inf)),
+                             'max_sharpe')
+
+    def target_volatility(self, target, n_points=DEFAULT_FRONTIER_POINTS):
+        """Highest expected return with volatility at most `target` (in percent, like 15 for 15%).
+
+        Below the minimum-variance volatility you get the minimum-variance portfolio.
+        """
+        aversions, weights = self._path(n_points)
+        volatility = self.evaluate(weights)['volatility'].to_numpy()
+        allowed = np.flatnonzero(volatility <= target)
+        if len(allowed) == 0:
+            return self._weights(weights[0], 'target_volatility')
+        # Volatility and return both rise with risk aversion along the frontier, so narrow down the
+        # aversion bracket around the target with a couple of finer batched grids.
+        best = int(allowed[-1])
+        low, high, chosen = aversions[best], aversions[min(best + 1, len(aversions) - 1)], weights[best]
+        for _ in range(TARGET_ROUNDS):
+            finer = np.linspace(low, high, REFINE_POINTS)
+            candidates = self._solve(finer, np.repeat(chosen[None, :], REFINE_POINTS, axis=0))
+            allowed = np.flatnonzero(self.evaluate(candidates)['volatility'].to_numpy() <= target)
+            if len(allowed) == 0:
+                break
+            best = int(allowed[-1])
+            low, high, chosen = finer[best], finer[min(best + 1, REFINE_POINTS - 1)], candidates[best]
+        return self._weights(chosen, 'target_volatility')
+
+    def risk_parity(self):
+        """Every asset contributes the same share of portfolio variance (long only).
+
+        The cap is applied afterwards by projecting onto the capped weights, so with a tight cap the
+        risk contributions are only approximately equal.
+        """
+        weights = _risk_parity(self._sigma)
+        if weights.max() > self.max_weight:
+            weights = _project(weights[None, :], 0.0, self.max_weight)[0][0]
+        return self._weights(weights, 'risk_parity')
+
+    def efficient_frontier(self, n_points=DEFAULT_FRONTIER_POINTS):
+        """(points, weights): `n_points` frontier portfolios spread roughly evenly in expected return.
+
+        `points` has expected_return, volatility and sharpe per point; `weights` is points x assets.
+        The path is first solved on a risk-aversion grid, then re-solved at the aversions that hit
+        evenly spaced returns between the minimum-variance and the highest-return portfolio.
+        """
+        aversions, weights = self._path(n_points)
+        returns = self.evaluate(weights)['expected_return'].to_numpy()
+        returns = np.maximum.accumulate(returns)
+        targets = np.linspace(returns[0], returns[-1], n_points)
+        spread = np.interp(targets, returns, aversions)
+        nearest = np.clip(np.searchsorted(returns, targets), 0, len(returns) - 1)
+        weights = self._solve(spread, weights[nearest])
+        frame = pd.DataFrame(weights, columns=self.assets).reindex(columns=self.columns, fill_value=0.0)
+        frame.index.name = 'point'
+        return self.evaluate(weights), frame
+
+    def summary(self, current_weights=None, target_volatility=None):
+        """Weights of each optimized portfolio side by side (plus `current_weights` if given), and their stats.
+
+        With `target_volatility` (percent), the target_volatility() portfolio is included too.
+        """
+        portfolios = {
+            'min_variance': self.min_variance(),
+            'max_sharpe': self.max_sharpe(),
+            'risk_parity': self.risk_parity(),
+        }
+        if target_volatility is not None:
+            portfolios['target_volatility'] = self.target_volatility(target_volatility)
+        if current_weights is not None:
+            portfolios = {'current': current_weights.reindex(self.columns, fill_value=0.0), **portfolios}
+        weights = pd.DataFrame(portfolios)
+        return weights, self.evaluate(weights.T)
@@ -9,392 +9,258 @@
 # ]
 # python = "3.9" # Recommended Python version. You can change this as needed.
 # ///
-import pandas as pd
-import yfinance as yf
-import matplotlib.pyplot as plt
-import numpy as np
-import seaborn as sns
-from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import sys
 import warnings
+from datetime import datetime
 
-warnings.filterwarnings("ignore")
+import pandas as pd
 
-print("Initializing analysis components.")
+from analysis import (
+    ANALYZER_BENCHMARKS, POSITION_COLUMNS, analyze, compare_benchmarks, compute_performance, correlation_matrix,
+    fetch_dividends, fetch_prices, history_start, latest_rolling_risk, load_portfolio, lots_from_entries,
+    market_data_provider, open_data_stores, risk_summary, value_history,
+)
+from correlation import ANNOTATE_LIMIT, top_pairs
+from ledger import LOT_METHODS
+from rolling_risk import DEFAULT_WINDOWS, daily_returns
+
+warnings.filterwarnings("ignore")
 
 # Added: Dividends, volatility, max drawdown, stock correlation matrix with visualization - took like 4 hours and a lot of troubleshooting but I got it done
 
+# Everything runs from main() now, so `import portfolio_analyzer` is safe and the stages themselves live
+# in analysis.py. matplotlib only gets imported once we're actually about to draw something, which means
+# `--json` never pays for the plotting stack.
 
-print("\nAlright, let's get our tools in order to start this financial journey!")
-print("\nHow do you want to tell me about your stocks?")
-print("1. Give me a CSV file (it should have 'Ticker', 'Shares', 'Purchase_Date', 'Purchase_Price' columns, with dates in YYYY-MM-DD format).")
-print("2. I'll type them in one by one, like a personal dictation!")
 
-your_choice_of_input = input("Please type '1' or '2' for your preferred method: ").strip()
+def _show(figure):
+    # Blocks until the window is closed, then frees the figure so charts don't pile up in pyplot
+    # (or get shown again by the next chart's plt.show()).
+    import matplotlib.pyplot as plt
+    plt.figure(figure.number)
+    plt.show()
+    plt.close(figure)
 
-portfolio_data = pd.DataFrame()
 
+def get_portfolio_from_user(csv_path=None, lot_method='fifo'):
+    """Ask how the portfolio comes in (CSV upload or typed in) and return (lots, lot accounting or None)."""
+    if csv_path:
+        print(f"\nReading your investments from '{csv_path}'.")
+        try:
+            portfolio_data, the_lot_accounting = load_portfolio(csv_path, lot_method)
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return _check_loaded(portfolio_data, the_lot_accounting)
 
-if your_choice_of_input == '1':
-    print("\nMarvelous choice! Let's get that CSV file uploaded.")
-    print("Just a friendly reminder: Your CSV needs these exact column names: 'Ticker', 'Shares', 'Purchase_Date', 'Purchase_Price'.")
-    print("And dates should look like this: YYYY-MM-DD. Got it?")
+    print("\nAlright, let's get our tools in order to start this financial journey!")
+    print("\nHow do you want to tell me about your stocks?")
+    print("1. Give me a CSV file (it should have 'Ticker', 'Shares', 'Purchase_Date', 'Purchase_Price' columns, with dates in YYYY-MM-DD format).")
+    print("   A brokerage transaction ledger works too: 'Date', 'Ticker', 'Action' (BUY/SELL/SPLIT/DIVIDEND/REINVEST), 'Quantity', 'Price' and optionally 'Fees'.")
+    print("2. I'll type them in one by one, like a personal dictation!")
 
-    try:
-        from google.colab import files
-        the_file_you_gave_me = files.upload()
+    your_choice_of_input = input("Please type '1' or '2' for your preferred method: ").strip()
+
+    if your_choice_of_input == '1':
+        print("\nMarvelous choice! Let's get that CSV file uploaded.")
+        print("Just a friendly reminder: Your CSV needs these exact column names: 'Ticker', 'Shares', 'Purchase_Date', 'Purchase_Price'.")
+        print("And dates should look like this: YYYY-MM-DD. Got it?")
 
+        try:
+            from google.colab import files
+        except ImportError:
+            print("\nError: 'google.colab' not found. This feature only works in Google Colab.")
+            print("Please run this script in Colab, pass the CSV path on the command line, or choose option 2 for manual input.")
+            sys.exit(1)
+
+        the_file_you_gave_me = files.upload()
         if not the_file_you_gave_me:
             print("\nOh dear, it seems no file was selected. That's okay, maybe next time!")
             print("We can't proceed without your data, so I'll gracefully bow out for now.")
-            exit()
+            sys.exit(1)
 
         the_name_of_the_file = next(iter(the_file_you_gave_me))
         print(f"Fantastic! I've received your file: '{the_name_of_the_file}'. Let's process it!")
 
-        your_investment_details = pd.read_csv(the_name_of_the_file)
-        your_investment_details.columns = your_investment_details.columns.str.strip()
-        your_investment_details.rename(columns={
-            'Ticker': 'ticker',
-            'Shares': 'shares',
-            'Purchase_Date': 'purchase_date',
-            'Purchase_Price': 'purchase_price'
-        }, inplace=True)
-
-        your_investment_details['purchase_date'] = pd.to_datetime(your_investment_details['purchase_date'], errors='coerce')
-        your_investment_details['purchase_date'].fillna(pd.to_datetime('today'), inplace=True)
-        your_investment_details.set_index('ticker', inplace=True)
-
-        required_cols_for_csv = ['shares', 'purchase_date', 'purchase_price']
-        if not all(col in your_investment_details.columns for col in required_cols_for_csv):
-            print("Error: Missing CSV columns. Expecting 'shares', 'purchase_date', and 'purchase_price'.")
-            exit()
-
-        portfolio_data = your_investment_details
-        print("\nWonderful! Your investment details from the CSV are all loaded up!")
-    except ImportError:
-        print("\nError: 'google.colab' not found. This feature only works in Google Colab.")
-        print("Please run this script in Colab, or choose option 2 for manual input.")
-        exit()
-
-
-elif your_choice_of_input == '2':
-    print("\nFantastic! Let's enter your stock details together, one by one.")
-    your_personal_investment_list = []
-    while True:
-        the_stock_symbol = input("First, tell me the Ticker Symbol (e.g., AAPL for Apple): ").strip().upper()
-        
         try:
-            how_many_shares = float(input(f"Great! Now, how many shares of {the_stock_symbol} do you own?: "))
-            date_of_purchase_text = input(f"And when did you buy {the_stock_symbol}? (Please use YYYY-MM-DD format, like 2020-01-15): ").strip()
-            date_of_purchase = datetime.strptime(date_of_purchase_text, '%Y-%m-%d')
-            price_per_share_paid = float(input(f"And what was the price you paid per share for {the_stock_symbol}?: "))
-        except ValueError:
-            print("Invalid input. Please ensure shares and price are numbers, and date is YYYY-MM-DD.")
-            continue
-
-
-        your_personal_investment_list.append({
-            'ticker': the_stock_symbol,
-            'shares': how_many_shares,
-            'purchase_date': date_of_purchase,
-            'purchase_price': price_per_share_paid
-        })
-
-        another_one = input("Do you have another stock to add? (Type 'yes' or 'no'): ").strip().lower()
-        if another_one != 'yes':
-            break
-
-    if not your_personal_investment_list:
-        print("\nOh dear, it seems we didn't get any investment data. I'm afraid I can't analyze an empty portfolio!")
-        exit()
-
-    portfolio_data = pd.DataFrame(your_personal_investment_list)
-    portfolio_data.set_index('ticker', inplace=True)
-    print("\nFantastic! All your investments are carefully noted down!")
-
-else:
-    print("\nInvalid input choice. Program terminated.")
-    exit()
-
-print("\nHere's a quick look at your initial portfolio data:")
-print(portfolio_data)
-print("\n")
-portfolio_data.info()
-print("\n")
-
-print("\nExcellent! Now, let's connect to the vast ocean of market data!")
-all_my_tickers = portfolio_data.index.tolist()
-print(f"I'm going to search for data on these amazing companies: {all_my_tickers}")
-
-the_earliest_buy_date = portfolio_data['purchase_date'].min()
-data_grab_start_date = the_earliest_buy_date - timedelta(days=60)
-todays_date = datetime.now()
-
-print(f"I'm downloading all the daily worth info from {data_grab_start_date.strftime('%Y-%m-%d')} right up to this very moment, {todays_date.strftime('%Y-%m-%d')}.")
-
-all_historical_market_data_raw = yf.download(all_my_tickers, start=data_grab_start_date, end=todays_date)
-if all_historical_market_data_raw.empty:
-    print("Could not download historical data. Exiting.")
-    exit()
-
-if len(all_my_tickers) > 1:
-    all_historical_market_data = all_historical_market_data_raw['Adj Close']
-else:
-    all_historical_market_data = all_historical_market_data_raw[['Adj Close']]
-    all_historical_market_data.columns = [all_my_tickers[0]]
-
-
-print("\nWonderful news! All the historical market data has been successfully downloaded.")
-print("Here's a little peek at the most recent data I fetched:")
-print(all_historical_market_data.tail())
+            portfolio_data, the_lot_accounting = load_portfolio(the_name_of_the_file, lot_method)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return _check_loaded(portfolio_data, the_lot_accounting)
+
+    elif your_choice_of_input == '2':
+        print("\nFantastic! Let's enter your stock details together, one by one.")
+        your_personal_investment_list = []
+        while True:
+            the_stock_symbol = input("First, tell me the Ticker Symbol (e.g., AAPL for Apple): ").strip().upper()
+
+            try:
+                how_many_shares = float(input(f"Great! Now, how many shares of {the_stock_symbol} do you own?: "))
+                date_of_purchase_text = input(f"And when did you buy {the_stock_symbol}? (Please use YYYY-MM-DD format, like 2020-01-15): ").strip()
+                date_of_purchase = datetime.strptime(date_of_purchase_text, '%Y-%m-%d')
+                price_per_share_paid = float(input(f"And what was the price you paid per share for {the_stock_symbol}?: "))
+            except ValueError:
+                print("Invalid input. Please ensure shares and price are numbers, and date is YYYY-MM-DD.")
+                continue
+
+            your_personal_investment_list.append({
+                'ticker': the_stock_symbol,
+                'shares': how_many_shares,
+                'purchase_date': date_of_purchase,
+                'purchase_price': price_per_share_paid
+            })
+
+            another_one = input("Do you have another stock to add? (Type 'yes' or 'no'): ").strip().lower()
+            if another_one != 'yes':
+                break
+
+        if not your_personal_investment_list:
+            print("\nOh dear, it seems we didn't get any investment data. I'm afraid I can't analyze an empty portfolio!")
+            sys.exit(1)
+
+        print("\nFantastic! All your investments are carefully noted down!")
+        return lots_from_entries(your_personal_investment_list), None
 
-the_very_latest_prices = all_historical_market_data.iloc[-1]
-portfolio_data['current_price'] = portfolio_data.index.map(the_very_latest_prices)
-
-if portfolio_data['current_price'].isnull().any():
-    print("\nOh dear, a tiny challenge! Missing prices for some tickers.")
-    portfolio_data['current_price'].fillna(portfolio_data['purchase_price'], inplace=True)
+    print("\nInvalid input choice. Program terminated.")
+    sys.exit(1)
 
-print("\nHere's how your investment details look now, with their fresh current prices:")
-print(portfolio_data)
 
+def _check_loaded(portfolio_data, the_lot_accounting):
+    if the_lot_accounting is not None:
+        the_transaction_ledger = the_lot_accounting.ledger
+        print(f"That's a transaction ledger with {len(the_transaction_ledger):,} transactions ({the_transaction_ledger.skipped_rows:,} rows I couldn't read).")
+        if portfolio_data.empty:
+            print("Everything in that ledger has been sold, so there's nothing left to analyze!")
+            sys.exit(1)
+    print("\nWonderful! Your investment details from the CSV are all loaded up!")
+    return portfolio_data, the_lot_accounting
 
-print("\n--- Performance Calculation ---")
-print("Computing portfolio performance metrics.")
 
-portfolio_data['totalAmountInvested'] = portfolio_data['shares'] * portfolio_data['purchase_price']
-portfolio_data['whatsItWorthNow'] = portfolio_data['shares'] * portfolio_data['current_price']
-portfolio_data['dollarChange'] = portfolio_data['whatsItWorthNow'] - portfolio_data['totalAmountInvested']
-portfolio_data['percentChange'] = (portfolio_data['dollarChange'] / portfolio_data['totalAmountInvested']) * 100
+def show_performance(portfolio_data, the_lot_accounting, all_historical_market_data, the_dividend_cache, todays_date):
+    """The per-stock table, dividends and (for ledgers) realized vs unrealized. Returns (positions, summary)."""
+    all_my_tickers = list(dict.fromkeys(portfolio_data.index))
 
-portfolio_data['howLongYouHeldItYears'] = (todays_date - portfolio_data['purchase_date']).dt.days / 365.25
-portfolio_data['yearlyGrowthPercent'] = np.where(
-    portfolio_data['howLongYouHeldItYears'] > 0,
-    ((1 + (portfolio_data['percentChange'] / 100))**(1 / portfolio_data['howLongYouHeldItYears']) - 1) * 100,
-    portfolio_data['percentChange']
-)
+    print("\n--- Performance Calculation ---")
+    print("Computing portfolio performance metrics.")
 
-print("\n--- Dividend Income Calculation ---")
-portfolio_data['allMyDividendsReceived'] = 0.0
-for the_stock_ticker in portfolio_data.index:
-    try:
-        the_stock_info = yf.Ticker(the_stock_ticker)
-        the_dividends_history = the_stock_info.dividends
-        if not the_dividends_history.empty:
-            purchase_date_for_ticker = portfolio_data.loc[the_stock_ticker, 'purchase_date']
-            the_relevant_dividends = the_dividends_history[(the_dividends_history.index >= purchase_date_for_ticker) & (the_dividends_history.index <= todays_date)]
-            total_dividends_per_share = the_relevant_dividends.sum()
-            portfolio_data.loc[the_stock_ticker, 'allMyDividendsReceived'] = total_dividends_per_share * portfolio_data.loc[the_stock_ticker, 'shares']
-            print(f"Dividends for {the_stock_ticker} are all tallied up!")
-        else:
+    print("\n--- Dividend Income Calculation ---")
+    the_dividend_histories, the_dividend_errors = fetch_dividends(the_dividend_cache, all_my_tickers)
+    for the_stock_ticker, the_dividends_history in the_dividend_histories.items():
+        if the_stock_ticker in the_dividend_errors:
+            print(f"Oops! Had trouble getting dividends for {the_stock_ticker}. Error: {the_dividend_errors[the_stock_ticker]}")
+        elif the_dividends_history.empty:
             print(f"Hmm, no dividend history found for {the_stock_ticker}. Maybe it's not a dividend payer, or I couldn't find the info!")
-    except Exception as e:
-        print(f"Oops! Had trouble getting dividends for {the_stock_ticker}. Error: {e}")
-        portfolio_data.loc[the_stock_ticker, 'allMyDividendsReceived'] = 0.0
-
-portfolio_data['whatsItWorthNowPlusDividends'] = portfolio_data['whatsItWorthNow'] + portfolio_data['allMyDividendsReceived']
-portfolio_data['totalGainLossIncludingDivs'] = portfolio_data['whatsItWorthNowPlusDividends'] - portfolio_data['totalAmountInvested']
-portfolio_data['percentGainLossIncludingDivs'] = (portfolio_data['totalGainLossIncludingDivs'] / portfolio_data['totalAmountInvested']) * 100
-
-
-print("\nHere are the detailed performance numbers for EACH of your amazing stocks:")
-pd.set_option('display.float_format', lambda x: '%.2f' % x)
-print(portfolio_data[[
-    'shares',
-    'purchase_price',
-    'totalAmountInvested',
-    'current_price',
-    'whatsItWorthNow',
-    'allMyDividendsReceived',
-    'whatsItWorthNowPlusDividends',
-    'dollarChange',
-    'percentChange',
-    'totalGainLossIncludingDivs',
-    'percentGainLossIncludingDivs',
-    'howLongYouHeldItYears',
-    'yearlyGrowthPercent'
-]])
-pd.reset_option('display.float_format')
-
-total_money_started_with = portfolio_data['totalAmountInvested'].sum()
-current_total_value_of_portfolio = portfolio_data['whatsItWorthNow'].sum()
-overall_money_change = current_total_value_of_portfolio - total_money_started_with
-if total_money_started_with > 0:
-    overall_percent_change = (overall_money_change / total_money_started_with) * 100
-else:
-    overall_percent_change = 0
-
-overall_money_change_with_divs = portfolio_data['totalGainLossIncludingDivs'].sum()
-if total_money_started_with > 0:
-    overall_percent_change_with_divs = (overall_money_change_with_divs / total_money_started_with) * 100
-else:
-    overall_percent_change_with_divs = 0
-
-
-how_many_years_portfolio_held = (todays_date - portfolio_data['purchase_date'].min()).days / 365.25
-
-overall_average_yearly_growth = 0
-if how_many_years_portfolio_held > 0 and total_money_started_with > 0:
-    overall_average_yearly_growth = ((current_total_value_of_portfolio / total_money_started_with)**(1 / how_many_years_portfolio_held) - 1) * 100
-elif total_money_started_with > 0:
-    overall_average_yearly_growth = overall_percent_change
-
-overall_average_yearly_growth_with_divs = 0
-if how_many_years_portfolio_held > 0 and total_money_started_with > 0:
-    overall_average_yearly_growth_with_divs = ((portfolio_data['whatsItWorthNowPlusDividends'].sum() / total_money_started_with)**(1 / how_many_years_portfolio_held) - 1) * 100
-elif total_money_started_with > 0:
-    overall_average_yearly_growth_with_divs = overall_percent_change_with_divs
-
-
-full_date_range_of_history = pd.date_range(start=the_earliest_buy_date, end=todays_date)
-daily_value_of_portfolio = pd.DataFrame(index=full_date_range_of_history)
-daily_value_of_portfolio['Portfolio Value'] = 0.0
-
-for this_stock_symbol in portfolio_data.index:
-    how_many_shares_you_hold = portfolio_data.loc[this_stock_symbol, 'shares']
-    when_you_bought_it = portfolio_data.loc[this_stock_symbol, 'purchase_date']
-
-    this_stocks_past_prices = all_historical_market_data[this_stock_symbol].loc[all_historical_market_data.index >= when_you_bought_it]
-
-    this_stocks_daily_worth = this_stocks_past_prices * how_many_shares_you_hold
-
-    daily_value_of_portfolio['Portfolio Value'] = daily_value_of_portfolio['Portfolio Value'].add(this_stocks_daily_worth, fill_value=0)
-
-daily_value_of_portfolio = daily_value_of_portfolio[daily_value_of_portfolio['Portfolio Value'] > 0]
-
-
-print("\n--- Maximum Drawdown Calculation ---")
-if not daily_value_of_portfolio.empty:
-    peak_value_over_time = daily_value_of_portfolio['Portfolio Value'].expanding(min_periods=1).max()
-    the_drawdown = (daily_value_of_portfolio['Portfolio Value'] / peak_value_over_time - 1) * 100
-    the_biggest_drawdown = the_drawdown.min()
-    print(f"Your Portfolio's Maximum Historical Drawdown: {the_biggest_drawdown:,.2f}%")
-else:
-    print("Oh dear, can't calculate max drawdown, not enough history!")
-    the_biggest_drawdown = 0
-
-
-print("\n--- Stock Correlation Matrix ---")
-if len(all_my_tickers) > 1 and not all_historical_market_data.empty:
-    daily_returns_for_all_stocks = all_historical_market_data[all_my_tickers].pct_change().dropna()
-    how_stocks_move_together_matrix = daily_returns_for_all_stocks.corr()
-    print("\nHere's how your stocks like to move together (correlation matrix):")
-    print(how_stocks_move_together_matrix.to_string(float_format="%.2f"))
-
-    plt.figure(figsize=(len(all_my_tickers)*0.8, len(all_my_tickers)*0.7))
-    sns.heatmap(how_stocks_move_together_matrix, annot=True, cmap='coolwarm', fmt=".2f", linewidths=.5)
-    plt.title('How Your Stocks Dance Together (Correlation Heatmap)', fontsize=16)
-    plt.xticks(rotation=45, ha='right')
-    plt.yticks(rotation=0)
-    plt.tight_layout()
-    plt.show()
-else:
-    print("Can't show you the correlation dance, need more than one stock, or no historical data!")
-
-
-print("\n--- Portfolio Volatility Calculation ---")
-if not daily_value_of_portfolio.empty:
-    daily_portfolio_changes = daily_value_of_portfolio['Portfolio Value'].pct_change().dropna()
-    how_bumpy_the_ride_is = daily_portfolio_changes.std() * np.sqrt(252) * 100
-else:
-    how_bumpy_the_ride_is = 0
-
-
-print("\n--- Your Grand Overall Portfolio Summary ---")
-print(f"The total money you started with: ${total_money_started_with:,.2f}")
-print(f"What your portfolio is worth right now (just market value): ${current_total_value_of_portfolio:,.2f}")
-print(f"All the lovely dividends you've received: ${portfolio_data['allMyDividendsReceived'].sum():,.2f}")
-print(f"What your portfolio is worth (market value + dividends!): ${portfolio_data['whatsItWorthNowPlusDividends'].sum():,.2f}")
-print(f"Overall money change (just market value): ${overall_money_change:,.2f}")
-print(f"Overall percentage change (just market value): {overall_percent_change:,.2f}%")
-print(f"Overall money change (including those sweet dividends!): ${overall_money_change_with_divs:,.2f}")
-print(f"Overall percentage change (including those sweet dividends!): {overall_percent_change_with_divs:,.2f}%")
-print(f"Your average yearly growth (CAGR, market only): {overall_average_yearly_growth:,.2f}%")
-print(f"Your average yearly growth (CAGR, including dividends!): {overall_average_yearly_growth_with_divs:,.2f}%")
-print(f"How bumpy your portfolio's ride has been (Annualized Volatility): {how_bumpy_the_ride_is:,.2f}%")
-if 'the_biggest_drawdown' in locals():
-    print(f"The biggest dip your portfolio has seen (Max Drawdown): {the_biggest_drawdown:,.2f}%")
-print("---------------------------------------------")
-
-
-print("\n--- Let's draw some pictures of your money! ---")
-print("Generating charts to visualize your allocation and performance!")
-
-if not portfolio_data.empty:
-    plt.figure(figsize=(10, 7))
-    plt.pie(portfolio_data['whatsItWorthNow'],
-            labels=portfolio_data.index,
-            autopct='%1.1f%%',
-            startangle=90,
-            pctdistance=0.85,
-            wedgeprops=dict(width=0.4))
-    plt.title('Where Your Money Is Right Now (Current Portfolio Allocation)', fontsize=16)
-    plt.axis('equal')
-    plt.show()
-
-    plt.figure(figsize=(12, 6))
-    what_stock_gained_or_lost_sorted = portfolio_data.sort_values('percentGainLossIncludingDivs', ascending=True)
-    the_bar_colors = ['lightcoral' if x < 0 else 'lightgreen' for x in what_stock_gained_or_lost_sorted['percentGainLossIncludingDivs']]
-    plt.bar(what_stock_gained_or_lost_sorted.index, what_stock_gained_or_lost_sorted['percentGainLossIncludingDivs'], color=the_bar_colors)
-    plt.axhline(0, color='grey', linewidth=0.8)
-    plt.xlabel('Your Amazing Ticker Symbol', fontsize=12)
-    plt.ylabel('Percentage Gain/Loss (Including Dividends!) (%)', fontsize=12)
-    plt.title('How Each of Your Stocks Performed (Percentage Gain/Loss, Including Dividends)', fontsize=16)
-    plt.xticks(rotation=45, ha='right')
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
-    plt.tight_layout()
-    plt.show()
-
-print("\nLet's see the historical journey of your portfolio's worth!")
-
-if not daily_value_of_portfolio.empty:
-    plt.figure(figsize=(14, 7))
-    plt.plot(daily_value_of_portfolio.index, daily_value_of_portfolio['Portfolio Value'], label='Your Portfolio Value', color='blue', linewidth=2)
-    plt.xlabel('Date, My Friend', fontsize=12)
-    plt.ylabel('Value (In Dollars!) ($)', fontsize=12)
-    plt.title('The Historical Rollercoaster of Your Portfolio Value', fontsize=16)
-    plt.grid(True, linestyle='--', alpha=0.6)
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
-
-
-print("\n--- Time for a grand comparison! ---")
-print("Let's see how your portfolio stacks up against the mighty S&P 500 benchmark (VOO)!")
-
-the_market_benchmark_ticker = 'VOO'
-try:
-    benchmark_past_data = yf.download(the_market_benchmark_ticker, start=data_grab_start_date, end=todays_date)['Adj Close']
-    print(f"Benchmark data for {the_market_benchmark_ticker} has been successfully retrieved!")
-except Exception as e:
-    print(f"Oh dear, couldn't get benchmark data for {the_market_benchmark_ticker}. Error: {e}")
-    print("No worries, we'll just skip the comparison for now.")
-    benchmark_past_data = pd.Series()
-
-if not benchmark_past_data.empty and not daily_value_of_portfolio.empty:
-    your_portfolio_start_value = daily_value_of_portfolio.iloc[0]['Portfolio Value']
-
-    # We're normalizing the benchmark so it starts at the same value as your portfolio for a fair fight!
-    normalized_benchmark_values = (benchmark_past_data / benchmark_past_data.loc[daily_value_of_portfolio.index[0]]) * your_portfolio_start_value
-    normalized_benchmark_values = normalized_benchmark_values.reindex(daily_value_of_portfolio.index, method='ffill')
-
-    plt.figure(figsize=(14, 7))
-    plt.plot(daily_value_of_portfolio.index, daily_value_of_portfolio['Portfolio Value'], label='Your Amazing Portfolio Value', color='blue', linewidth=2)
-    plt.plot(normalized_benchmark_values.index, normalized_benchmark_values, label=f'{the_market_benchmark_ticker} (Normalized Market Benchmark)', color='orange', linestyle='--', linewidth=2)
-    plt.xlabel('Date in Time', fontsize=12)
-    plt.ylabel('Value (Money!) ($)', fontsize=12)
-    plt.title('Your Portfolio\'s Grand Performance vs. The Market (Normalized)', fontsize=16)
-    plt.grid(True, linestyle='--', alpha=0.6)
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
+        else:
+            print(f"Dividends for {the_stock_ticker} are all tallied up!")
 
-    benchmark_start_value_actual = benchmark_past_data.loc[daily_value_of_portfolio.index[0]]
-    benchmark_end_value_actual = benchmark_past_data.iloc[-1]
-    benchmark_overall_gain_percent = ((benchmark_end_value_actual / benchmark_start_value_actual) - 1) * 100
+    portfolio_data, the_overall_summary, the_missing_prices = compute_performance(
+        portfolio_data, all_historical_market_data, the_dividend_histories, todays_date, the_lot_accounting)
+    if the_missing_prices:
+        print(f"\nOh dear, a tiny challenge! Missing prices for some tickers: {the_missing_prices}. Using what you paid instead.")
+
+    print("\nHere's how your investment details look now, with their fresh current prices:")
+    print(portfolio_data[['shares', 'purchase_date', 'purchase_price', 'current_price']])
+
+    print("\nHere are the detailed performance numbers for EACH of your amazing stocks:")
+    pd.set_option('display.float_format', lambda x: '%.2f' % x)
+    print(portfolio_data[POSITION_COLUMNS])
+    pd.reset_option('display.float_format')
+
+    if the_lot_accounting is not None:
+        the_very_latest_prices = all_historical_market_data.ffill().iloc[-1]
+        print(f"\n--- Realized vs Unrealized ({the_lot_accounting.method.upper()} lots) ---")
+        the_realized_and_unrealized = the_lot_accounting.positions[['shares', 'cost_basis', 'proceeds', 'realized_pnl', 'dividends']].copy()
+        the_realized_and_unrealized['unrealized_pnl'] = the_lot_accounting.unrealized_pnl(the_very_latest_prices).fillna(0)
+        print(the_realized_and_unrealized.to_string(float_format="{:,.2f}".format))
+        print(f"Gains you've already locked in by selling (realized): ${the_lot_accounting.realized_pnl:,.2f}")
+        print(f"Gains still riding on what you hold (unrealized): ${the_realized_and_unrealized['unrealized_pnl'].sum():,.2f}")
+    return portfolio_data, the_overall_summary
+
+
+def show_correlation(all_historical_market_data, all_my_tickers, draw=True):
+    print("\n--- Stock Correlation Matrix ---")
+    # Pairwise, so a stock that listed later doesn't throw away everyone else's older history.
+    how_stocks_move_together_matrix = correlation_matrix(all_historical_market_data, all_my_tickers)
+    if how_stocks_move_together_matrix is None:
+        print("Can't show you the correlation dance, need more than one stock, or no historical data!")
+        return None
+
+    if len(all_my_tickers) <= ANNOTATE_LIMIT:
+        print("\nHere's how your stocks like to move together (correlation matrix):")
+        print(how_stocks_move_together_matrix.to_string(float_format="%.2f"))
+    else:
+        print(f"\nThat's {len(all_my_tickers)} stocks, way too many to print every pair. Here are the highlights:")
+        print("\nThe pairs that move together the most:")
+        print(top_pairs(how_stocks_move_together_matrix, 10).to_string(index=False, float_format="%.2f"))
+        print("\nThe pairs that move together the least:")
+        print(top_pairs(how_stocks_move_together_matrix, 10, most=False).to_string(index=False, float_format="%.2f"))
+
+    if draw:
+        from correlation import plot_correlation_heatmap
+        _show(plot_correlation_heatmap(how_stocks_move_together_matrix))
+    return how_stocks_move_together_matrix
+
+
+def show_summary(portfolio_data, the_overall_summary):
+    print("\n--- Your Grand Overall Portfolio Summary ---")
+    print(f"The total money you started with: ${the_overall_summary['total_invested']:,.2f}")
+    print(f"What your portfolio is worth right now (just market value): ${the_overall_summary['current_value']:,.2f}")
+    print(f"All the lovely dividends you've received: ${portfolio_data['allMyDividendsReceived'].sum():,.2f}")
+    print(f"What your portfolio is worth (market value + dividends!): ${portfolio_data['whatsItWorthNowPlusDividends'].sum():,.2f}")
+    print(f"Overall money change (just market value): ${the_overall_summary['dollar_change']:,.2f}")
+    print(f"Overall percentage change (just market value): {the_overall_summary['percent_change']:,.2f}%")
+    print(f"Overall money change (including those sweet dividends!): ${the_overall_summary['dollar_change_with_dividends']:,.2f}")
+    print(f"Overall percentage change (including those sweet dividends!): {the_overall_summary['percent_change_with_dividends']:,.2f}%")
+    print(f"Your average yearly growth (CAGR, market only): {the_overall_summary['cagr']:,.2f}%")
+    print(f"Your average yearly growth (CAGR, including dividends!): {the_overall_summary['cagr_with_dividends']:,.2f}%")
+    print(f"How bumpy your portfolio's ride has been (Annualized Volatility): {the_overall_summary['volatility']:,.2f}%")
+    print(f"The biggest dip your portfolio has seen (Max Drawdown): {the_overall_summary['max_drawdown']:,.2f}%")
+    print("---------------------------------------------")
+
+
+def show_charts(portfolio_data, daily_value_of_portfolio):
+    import charts
+
+    print("\n--- Let's draw some pictures of your money! ---")
+    print("Generating charts to visualize your allocation and performance!")
+    if not portfolio_data.empty:
+        _show(charts.allocation_pie(portfolio_data))
+        _show(charts.gain_bars(portfolio_data))
+
+    print("\nLet's see the historical journey of your portfolio's worth!")
+    if not daily_value_of_portfolio.empty:
+        _show(charts.value_history(daily_value_of_portfolio))
+
+
+def show_benchmarks(daily_value_of_portfolio, all_historical_market_data, the_market_benchmarks, the_overall_summary, draw=True):
+    """Benchmark chart and table. Returns (primary benchmark scaled to the portfolio, every benchmark scaled, table)."""
+    print("\n--- Time for a grand comparison! ---")
+    print(f"Let's see how your portfolio stacks up against {', '.join(the_market_benchmarks)}!")
+
+    the_market_benchmark_ticker = the_market_benchmarks[0]
+    # Benchmarks came down with your stocks and get lined up on your portfolio's own days.
+    normalized_benchmark_values, the_benchmark_table = compare_benchmarks(
+        daily_value_of_portfolio, all_historical_market_data, the_market_benchmarks)
+    if normalized_benchmark_values is None or normalized_benchmark_values[the_market_benchmark_ticker].dropna().empty:
+        print("Sorry, my friend, I can't generate the benchmark comparison chart. Data was missing or incomplete.")
+        return pd.Series(dtype='float64'), None, None
+
+    if draw:
+        import charts
+        _show(charts.benchmark_lines(daily_value_of_portfolio, normalized_benchmark_values))
+
+    benchmark_overall_gain_percent = the_benchmark_table.loc[the_market_benchmark_ticker, 'total_return']
+    overall_percent_change = the_overall_summary['percent_change']
+    overall_percent_change_with_divs = the_overall_summary['percent_change_with_dividends']
 
     print("\n--- Benchmark Performance Summary ---")
-    print(f"The mighty {the_market_benchmark_ticker} had an overall return of: {benchmark_overall_gain_percent:,.2f}%")
+    print(the_benchmark_table.to_string(float_format="%.2f"))
+    print("(alpha and tracking error are annualized %, captures are % of the benchmark's up/down days)")
+    print(f"\nThe mighty {the_market_benchmark_ticker} had an overall return of: {benchmark_overall_gain_percent:,.2f}%")
     print(f"Your portfolio's overall return (market value only): {overall_percent_change:,.2f}%")
     print(f"Your portfolio's overall return (INCLUDING those wonderful dividends!): {overall_percent_change_with_divs:,.2f}%")
     if overall_percent_change_with_divs > benchmark_overall_gain_percent:
@@ -402,9 +268,170 @@ if not benchmark_past_data.empty and not daily_value_of_portfolio.empty:
     else:
         print("It seems the market had a slight edge this time. Keep learning, you'll get there!")
     print("-------------------------------------")
+    return normalized_benchmark_values[the_market_benchmark_ticker].dropna(), normalized_benchmark_values, the_benchmark_table
+
+
+def show_rolling_risk(daily_value_of_portfolio, all_historical_market_data, all_my_tickers, benchmark_past_data, the_market_benchmark_ticker):
+    print("\n--- Rolling Risk (how things look lately) ---")
+    if benchmark_past_data.empty or daily_value_of_portfolio.empty:
+        print("Not enough history (or no benchmark) for rolling risk numbers.")
+        return
+    the_latest_rolling_numbers = latest_rolling_risk(
+        daily_value_of_portfolio, all_historical_market_data, all_my_tickers, benchmark_past_data, DEFAULT_WINDOWS)
+    print(f"Latest numbers over the trailing {', '.join(str(w) for w in DEFAULT_WINDOWS)} trading days (vs. {the_market_benchmark_ticker}):")
+    print(the_latest_rolling_numbers.to_string(float_format="%.2f"))
+
+
+def show_monte_carlo(portfolio_data, all_historical_market_data, all_my_tickers):
+    from monte_carlo import simulate_portfolio
+
+    print("\n--- Looking Ahead: Monte Carlo Risk ---")
+    if len(all_historical_market_data) <= 2:
+        print("Not enough price history to simulate the future, sorry!")
+        return
+    the_current_holding_values = portfolio_data.groupby(level=0, sort=False)['whatsItWorthNow'].sum().reindex(all_my_tickers, fill_value=0.0)
+    the_simulation = simulate_portfolio(
+        daily_returns(all_historical_market_data[all_my_tickers])[1:], the_current_holding_values, n_paths=100_000)
+    print(f"I simulated 100,000 possible futures for your current ${the_simulation.initial_value:,.2f} of holdings.")
+    print("Here's the range of outcomes (VaR / CVaR are dollar losses at that confidence level):")
+    print(the_simulation.summary().to_string(float_format="{:,.2f}".format))
+
+
+def show_optimization(portfolio_data, all_historical_market_data, all_my_tickers):
+    from optimization import PortfolioOptimizer
+
+    print("\n--- What If: Optimized Allocations ---")
+    if len(all_my_tickers) < 2:
+        print("You need at least two different stocks before there's anything to optimize!")
+        return
+    the_daily_returns = pd.DataFrame(daily_returns(all_historical_market_data[all_my_tickers])[1:], columns=all_my_tickers)
+    try:
+        the_optimizer = PortfolioOptimizer(the_daily_returns)
+    except ValueError as e:
+        print(f"Can't optimize this portfolio: {e}")
+        return
+    the_current_holding_values = portfolio_data.groupby(level=0, sort=False)['whatsItWorthNow'].sum().reindex(all_my_tickers, fill_value=0.0)
+    the_current_weights = the_current_holding_values / the_current_holding_values.sum()
+    # 'target_volatility' is the best expected return for the same volatility you're carrying right now.
+    the_current_volatility = the_optimizer.evaluate(the_current_weights)['volatility'].iloc[0]
+    the_optimized_weights, the_optimized_stats = the_optimizer.summary(the_current_weights, the_current_volatility)
+    print("How your money could be split instead (long only, % of the portfolio), based on the same price history:")
+    print((the_optimized_weights * 100).to_string(float_format="%.2f"))
+    print("\nExpected yearly return and volatility (%) of each allocation, from history (not a promise!):")
+    print(the_optimized_stats.to_string(float_format="%.2f"))
+
+
+def run_interactive(csv_path, lot_method, the_market_benchmarks, fixture_dir=None, report_path=None):
+    print("Initializing analysis components.")
+    portfolio_data, the_lot_accounting = get_portfolio_from_user(csv_path, lot_method)
+
+    print("\nHere's a quick look at your initial portfolio data:")
+    print(portfolio_data)
+    print("\n")
+    portfolio_data.info()
+    print("\n")
+
+    print("\nExcellent! Now, let's connect to the vast ocean of market data!")
+    all_my_tickers = list(dict.fromkeys(portfolio_data.index))
+    print(f"I'm going to search for data on these amazing companies: {all_my_tickers}")
+
+    todays_date = datetime.now()
+    data_grab_start_date = history_start(portfolio_data, the_lot_accounting)
+    print(f"I'm downloading all the daily worth info from {data_grab_start_date.strftime('%Y-%m-%d')} right up to this very moment, {todays_date.strftime('%Y-%m-%d')}.")
+
+    # Prices live in a local store so we only download the bars we haven't seen before, and benchmarks
+    # (a ticker or a blend like 'SPY:0.6+AGG:0.4') come down in the same batch as your stocks.
+    # Point PORTFOLIO_FIXTURE_DIR (or --fixtures) at a folder of CSVs to run the whole thing offline.
+    the_price_store, the_dividend_cache = open_data_stores(market_data_provider(fixture_dir))
+    all_historical_market_data = fetch_prices(the_price_store, portfolio_data, the_market_benchmarks, todays_date, the_lot_accounting)
+    if all_historical_market_data.reindex(columns=all_my_tickers).dropna(how='all').empty:
+        print("Could not download historical data. Exiting.")
+        sys.exit(1)
+
+    print("\nWonderful news! All the historical market data has been successfully downloaded.")
+    print("Here's a little peek at the most recent data I fetched:")
+    print(all_historical_market_data[all_my_tickers].tail())
+
+    portfolio_data, the_overall_summary = show_performance(
+        portfolio_data, the_lot_accounting, all_historical_market_data, the_dividend_cache, todays_date)
+
+    # Every lot (even a second buy of the same stock) is valued in one shot against the price matrix.
+    daily_value_of_portfolio = value_history(portfolio_data, all_historical_market_data, the_lot_accounting)
+    the_overall_summary.update(risk_summary(daily_value_of_portfolio))
+
+    print("\n--- Maximum Drawdown Calculation ---")
+    if not daily_value_of_portfolio.empty:
+        print(f"Your Portfolio's Maximum Historical Drawdown: {the_overall_summary['max_drawdown']:,.2f}%")
+    else:
+        print("Oh dear, can't calculate max drawdown, not enough history!")
+
+    # With --report the charts go into one HTML file at the end instead of popping up one at a time.
+    how_stocks_move_together_matrix = show_correlation(all_historical_market_data, all_my_tickers, draw=report_path is None)
+
+    print("\n--- Portfolio Volatility Calculation ---")
+    show_summary(portfolio_data, the_overall_summary)
+    if report_path is None:
+        show_charts(portfolio_data, daily_value_of_portfolio)
+    benchmark_past_data, normalized_benchmark_values, the_benchmark_table = show_benchmarks(
+        daily_value_of_portfolio, all_historical_market_data, the_market_benchmarks, the_overall_summary, draw=report_path is None)
+    show_rolling_risk(daily_value_of_portfolio, all_historical_market_data, all_my_tickers, benchmark_past_data, the_market_benchmarks[0])
+    show_monte_carlo(portfolio_data, all_historical_market_data, all_my_tickers)
+    show_optimization(portfolio_data, all_historical_market_data, all_my_tickers)
+
+    if report_path is not None:
+        from report import render_report, report_payload
+        render_report(report_payload(_report_name(csv_path), portfolio_data, the_overall_summary, daily_value_of_portfolio,
+                                     normalized_benchmark_values, the_benchmark_table, how_stocks_move_together_matrix), report_path)
+        print(f"\nAll the charts (and tables) are saved in your report: {report_path}")
+
+    print("\nAnalysis complete. Thank you for using your friendly financial assistant!")
+    print("I hope this helped you understand your investments better. Until next time!")
+
+
+def _report_name(csv_path):
+    return os.path.splitext(os.path.basename(csv_path))[0] if csv_path else 'portfolio'
+
+
+def run_json(csv_path, lot_method, the_market_benchmarks, fixture_dir=None, report_path=None):
+    """Summary and per-position table as JSON on stdout; no prompts and no matplotlib unless a report is asked for."""
+    lots, lot_accounting = load_portfolio(csv_path, lot_method)
+    price_store, dividend_cache = open_data_stores(market_data_provider(fixture_dir))
+    result = analyze(lots, price_store, dividend_cache, the_market_benchmarks, lot_accounting=lot_accounting,
+                     correlation=report_path is not None)
+    json.dump(result.to_dict(), sys.stdout, indent=2)
+    print()
+    if report_path is not None:
+        from report import payload_from_result, render_report
+        render_report(payload_from_result(_report_name(csv_path), result), report_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze a stock portfolio: performance, dividends, risk and benchmarks.')
+    parser.add_argument('csv', nargs='?', help='portfolio CSV or transaction ledger (asks interactively when left out)')
+    parser.add_argument('--json', action='store_true', help='print the summary and per-position table as JSON and skip the charts')
+    parser.add_argument('--lot-method', choices=LOT_METHODS, default=os.environ.get('PORTFOLIO_LOT_METHOD', 'fifo'),
+                        help='how a transaction ledger matches sells to buys (default: fifo)')
+    parser.add_argument('--benchmarks', default=os.environ.get('PORTFOLIO_BENCHMARKS', ','.join(ANALYZER_BENCHMARKS)),
+                        help="comma-separated benchmark tickers or blends like 'SPY:0.6+AGG:0.4'; the first one is the primary")
+    parser.add_argument('--fixtures', help='read market data from this fixture folder instead of Yahoo Finance')
+    parser.add_argument('--report', metavar='HTML', help='render every chart off-screen into this self-contained HTML report instead of showing them')
+    args = parser.parse_args(argv)
+    benchmarks = [spec.strip() for spec in args.benchmarks.split(',') if spec.strip()]
+
+    if args.json:
+        if not args.csv:
+            parser.error('--json needs the path of a portfolio CSV')
+        try:
+            run_json(args.csv, args.lot_method, benchmarks, args.fixtures, args.report)
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+
+    run_interactive(args.csv, args.lot_method, benchmarks, args.fixtures, args.report)
+    return 0
 
-else:
-    print("Sorry, my friend, I can't generate the benchmark comparison chart. Data was missing or incomplete.")
 
-print("\nAnalysis complete. Thank you for using your friendly financial assistant!") 
-print("I hope this helped you understand your investments better. Until next time!")
+if __name__ == '__main__':
+    # In a notebook, sys.argv is the kernel's own command line, not ours.
+    sys.exit(main([] if 'ipykernel' in sys.modules else None))
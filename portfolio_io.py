@@ -0,0 +1,28 @@
+import pandas as pd
+
+
+CSV_COLUMNS = {
+    'Ticker': 'ticker',
+    'Shares': 'shares',
+    'Purchase_Date': 'purchase_date',
+    'Purchase_Price': 'purchase_price'
+}
+
+
+def read_portfolio_csv(path_or_buffer):
+    """Load a `Ticker,Shares,Purchase_Date,Purchase_Price` CSV into the analyzer's lot frame.
+
+    Returns a frame indexed by ticker (one row per lot). Unparseable dates count as bought today,
+    and a missing column raises ValueError.
+    """
+    lots = pd.read_csv(path_or_buffer)
+    lots.columns = lots.columns.str.strip()
+    lots = lots.rename(columns=CSV_COLUMNS)
+
+    missing = [name for name in CSV_COLUMNS.values() if name not in lots.columns]
+    if missing:
+        raise ValueError(f"Missing CSV columns: {missing}. Expecting 'Ticker', 'Shares', 'Purchase_Date' and 'Purchase_Price'.")
+
+    lots['ticker'] = lots['ticker'].astype(str).str.strip().str.upper()
+    lots['purchase_date'] = pd.to_datetime(lots['purchase_date'], errors='coerce').fillna(pd.to_datetime('today').normalize())
+    return lots.set_index('ticker')
@@ -0,0 +1,154 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from market_data import safe_file_name
+
+
+# A little on-disk price database so we stop re-downloading decades of bars on every run.
+#
+# Each ticker is two flat .npy files (trading days as int64 day numbers, adjusted closes as float64)
+# that get memory-mapped on read, plus one coverage.json recording which date range we've already
+# asked the provider for. A run only fetches what's missing: history before the covered start, and
+# the new bars since the last one we stored.
+
+
+ADJUSTMENT_TOLERANCE = 1e-9
+
+
+def _to_day(when):
+    return np.datetime64(pd.Timestamp(when).normalize().date(), 'D')
+
+
+class PriceStore:
+    """Adjusted-close cache backed by memory-mapped per-ticker arrays."""
+
+    def __init__(self, root, provider):
+        self.root = root
+        self.provider = provider
+        os.makedirs(root, exist_ok=True)
+        self._coverage_path = os.path.join(root, 'coverage.json')
+        if os.path.exists(self._coverage_path):
+            with open(self._coverage_path) as f:
+                self.coverage = json.load(f)
+        else:
+            self.coverage = {}
+
+    def _paths(self, ticker):
+        base = os.path.join(self.root, safe_file_name(ticker))
+        return base + '.dates.npy', base + '.close.npy'
+
+    def _load(self, ticker):
+        dates_path, close_path = self._paths(ticker)
+        if not os.path.exists(dates_path):
+            return np.empty(0, dtype='datetime64[D]'), np.empty(0)
+        dates = np.load(dates_path, mmap_mode='r').view('datetime64[D]')
+        closes = np.load(close_path, mmap_mode='r')
+        return dates, closes
+
+    def _save(self, ticker, dates, closes):
+        for path, values in zip(self._paths(ticker), (dates.view('int64'), closes)):
+            temp_path = path + '.tmp.npy'
+            np.save(temp_path, np.ascontiguousarray(values))
+            os.replace(temp_path, path)
+
+    def _save_coverage(self):
+        temp_path = self._coverage_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.coverage, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self._coverage_path)
+
+    def _merge(self, ticker, fetched):
+        fetched = fetched.dropna()
+        old_dates, old_closes = self._load(ticker)
+        new_dates = fetched.index.values.astype('datetime64[D]')
+        new_closes = fetched.values.astype('float64')
+
+        old_closes = np.array(old_closes)
+        if len(old_dates) and len(new_dates):
+            # Adjusted closes get rescaled back through history whenever a new dividend or split
+            # lands, so if the overlapping bar changed, bring the stored bars onto the new basis.
+            _, old_at, new_at = np.intersect1d(old_dates, new_dates, return_indices=True)
+            if len(old_at):
+                ratio = new_closes[new_at[-1]] / old_closes[old_at[-1]]
+                if np.isfinite(ratio) and abs(ratio - 1) > ADJUSTMENT_TOLERANCE:
+                    old_closes *= ratio
+
+        keep_old = ~np.isin(old_dates, new_dates)
+        dates = np.concatenate([np.asarray(old_dates)[keep_old], new_dates])
+        closes = np.concatenate([old_closes[keep_old], new_closes])
+        order = np.argsort(dates, kind='stable')
+        self._save(ticker, dates[order], closes[order])
+
+    def _missing_ranges(self, ticker, start, end, covered_until):
+        known = self.coverage.get(ticker)
+        if known is None:
+            return [(start, end, 'all')]
+        ranges = []
+        known_start = np.datetime64(known['start'], 'D')
+        known_end = np.datetime64(known['end'], 'D')
+        stored_dates, _ = self._load(ticker)
+        if start < known_start:
+            # Run one bar into what we already have so the merge can spot a re-adjustment.
+            head_end = stored_dates[0] + 1 if len(stored_dates) else known_start
+            ranges.append((start, head_end, 'head'))
+        if known_end < min(end, covered_until):
+            tail_start = min(stored_dates[-1], known_end) if len(stored_dates) else known_end
+            ranges.append((tail_start, end, 'tail'))
+        return ranges
+
+    def update(self, tickers, start, end):
+        """Make sure every ticker is stored for [start, end), fetching only the gaps."""
+        start, end = _to_day(start), _to_day(end)
+        # Today's bar is still moving, so it never counts as covered and gets refetched next run.
+        covered_until = _to_day(pd.Timestamp.today())
+
+        wanted_by_range = {}
+        for ticker in dict.fromkeys(tickers):
+            for range_start, range_end, kind in self._missing_ranges(ticker, start, end, covered_until):
+                wanted_by_range.setdefault((range_start, range_end), []).append((ticker, kind))
+
+        # Tickers that are missing the same window (usually "everything since yesterday") share one request.
+        for (range_start, range_end), wanted in wanted_by_range.items():
+            fetched = self.provider.fetch_prices([t for t, _ in wanted], pd.Timestamp(range_start), pd.Timestamp(range_end))
+            for ticker, kind in wanted:
+                if ticker in fetched.columns:
+                    self._merge(ticker, fetched[ticker])
+                # A ticker we've never seen coming back without a single bar might be a typo or a failed
+                # symbol in an otherwise fine batch, so that isn't recorded and it gets asked for in full
+                # next run. An empty head range is just history from before the listing and won't change,
+                # so it counts as covered and doesn't get asked for again.
+                if kind == 'all' and (ticker not in fetched.columns or fetched[ticker].dropna().empty):
+                    continue
+                known = self.coverage.get(ticker, {'start': str(range_start), 'end': str(range_start)})
+                self.coverage[ticker] = {
+                    'start': str(min(np.datetime64(known['start'], 'D'), range_start)),
+                    'end': str(max(np.datetime64(known['end'], 'D'), min(range_end, covered_until))),
+                }
+        self._save_coverage()
+
+    def series(self, ticker):
+        """Stored adjusted closes for one ticker; the values are a read-only view of the memory map."""
+        dates, closes = self._load(ticker)
+        return pd.Series(closes, index=pd.DatetimeIndex(dates.astype('datetime64[ns]')), name=ticker, copy=False)
+
+    def adjusted_close(self, tickers, start, end, refresh=True):
+        """(trading days x tickers) adjusted-close matrix for [start, end), NaN where a ticker has no bar."""
+        tickers = list(dict.fromkeys(tickers))
+        if refresh:
+            self.update(tickers, start, end)
+        start, end = _to_day(start), _to_day(end)
+
+        stored = []
+        for ticker in tickers:
+            dates, closes = self._load(ticker)
+            lo, hi = np.searchsorted(dates, [start, end])
+            stored.append((dates[lo:hi], closes[lo:hi]))
+
+        all_dates = np.unique(np.concatenate([d for d, _ in stored])) if stored else np.empty(0, dtype='datetime64[D]')
+        matrix = np.full((len(all_dates), len(tickers)), np.nan)
+        for column, (dates, closes) in enumerate(stored):
+            matrix[np.searchsorted(all_dates, dates), column] = closes
+        return pd.DataFrame(matrix, index=pd.DatetimeIndex(all_dates.astype('datetime64[ns]')), columns=tickers)
@@ -0,0 +1,161 @@
+import base64
+import html
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# Off-screen reports: every chart rendered with the Agg backend into a PNG and embedded in one
+# self-contained HTML file per portfolio, so nothing ever waits on plt.show() or needs a display.
+#
+# The worker processes only get a small "payload" per portfolio: tables plus value histories already
+# decimated to a couple of thousand points (each bucket keeps its lowest and highest value, so spikes and
+# drawdowns survive) and the correlation matrix already reduced to what the heatmap draws. batch.py
+# writes many reports from its own worker pool, one per portfolio; a single report can spread its
+# charts over processes instead.
+
+
+DEFAULT_MAX_POINTS = 2000
+CHARTS = ('allocation', 'gains', 'value_history', 'benchmarks', 'correlation')
+CHART_TITLES = {
+    'allocation': 'Current Allocation',
+    'gains': 'Gain/Loss per Position',
+    'value_history': 'Portfolio Value',
+    'benchmarks': 'Portfolio vs. Benchmarks',
+    'correlation': 'Correlation Heatmap',
+}
+REPORT_POSITION_COLUMNS = ['shares', 'purchase_date', 'purchase_price', 'current_price', 'whatsItWorthNow',
+                           'allMyDividendsReceived', 'percentGainLossIncludingDivs', 'yearlyGrowthPercent']
+
+
+def decimate(values, max_points=DEFAULT_MAX_POINTS):
+    """Downsample a Series or DataFrame to about `max_points` rows with min/max decimation.
+
+    The rows are cut into max_points / 2 equal buckets and each bucket keeps the rows holding its lowest
+    and highest value (for a DataFrame, per column, so a few more rows can survive). Shorter input comes
+    back unchanged.
+    """
+    n = len(values)
+    if n <= max_points:
+        return values
+    matrix = values.to_numpy(dtype='float64').reshape(n, -1)
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)
+    padded = np.full((buckets * size, matrix.shape[1]), np.nan)
+    padded[:n] = matrix
+    padded = padded.reshape(buckets, size, -1)
+    missing = np.isnan(padded)
+    lows = np.argmin(np.where(missing, np.inf, padded), axis=1)
+    highs = np.argmax(np.where(missing, -np.inf, padded), axis=1)
+    starts = (np.arange(buckets) * size)[:, None]
+    keep = np.unique(np.concatenate([(starts + lows).ravel(), (starts + highs).ravel(), [0, n - 1]]))
+    return values.iloc[keep[keep < n]]
+
+
+def report_payload(name, positions, summary, values, benchmarks=None, benchmark_table=None, correlation=None,
+                   max_points=DEFAULT_MAX_POINTS):
+    """Everything a report needs, trimmed down to something cheap to send to a worker process."""
+    from correlation import heatmap_matrix
+
+    return {
+        'name': name,
+        'summary': dict(summary),
+        'positions': positions[[c for c in REPORT_POSITION_COLUMNS if c in positions.columns]].copy(),
+        'allocation': positions[['whatsItWorthNow', 'percentGainLossIncludingDivs']].copy(),
+        'values': decimate(values, max_points),
+        'benchmarks': None if benchmarks is None else decimate(benchmarks, max_points),
+        'benchmark_table': benchmark_table,
+        'correlation': None if correlation is None else heatmap_matrix(correlation),
+    }
+
+
+def payload_from_result(name, result, max_points=DEFAULT_MAX_POINTS):
+    """report_payload() for an analysis.AnalysisResult."""
+    return report_payload(name, result.positions, result.summary, result.values, result.benchmarks,
+                          result.benchmark_table, result.correlation, max_points)
+
+
+def _use_agg():
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+
+def _render_chart(job):
+    # One chart of one payload to PNG bytes (None when there's nothing to draw).
+    chart, payload = job
+    _use_agg()
+    import matplotlib.pyplot as plt
+
+    import charts
+    from correlation import plot_correlation_heatmap
+
+    positions, values = payload['allocation'], payload['values']
+    if chart == 'allocation' and not positions.empty and (positions['whatsItWorthNow'] > 0).any():
+        figure = charts.allocation_pie(positions.clip(lower=0))
+    elif chart == 'gains' and not positions.empty:
+        figure = charts.gain_bars(positions)
+    elif chart == 'value_history' and not values.empty:
+        figure = charts.value_history(values)
+    elif chart == 'benchmarks' and payload['benchmarks'] is not None and not values.empty:
+        figure = charts.benchmark_lines(values, payload['benchmarks'])
+    elif chart == 'correlation' and payload['correlation'] is not None:
+        figure = plot_correlation_heatmap(payload['correlation'])
+    else:
+        return None
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', dpi=80)
+    plt.close(figure)
+    return buffer.getvalue()
+
+
+def _table(frame, float_format='{:,.2f}'.format):
+    return frame.to_html(float_format=float_format, border=0, classes='table', na_rep='')
+
+
+def report_html(payload, images):
+    """The self-contained HTML page for a payload and its {chart: PNG bytes}."""
+    name = html.escape(str(payload['name']))
+    summary = pd.DataFrame({'value': pd.Series(payload['summary'], dtype='float64')})
+    parts = [
+        '<!DOCTYPE html>',
+        f'<html><head><meta charset="utf-8"><title>Portfolio report: {name}</title>',
+        '<style>body{font-family:sans-serif;margin:2em;color:#222}.table{border-collapse:collapse;margin-bottom:1.5em}'
+        '.table td,.table th{padding:3px 10px;text-align:right;border-bottom:1px solid #ddd}img{max-width:100%}</style>',
+        f'</head><body><h1>Portfolio report: {name}</h1>',
+        '<h2>Summary</h2>', _table(summary),
+        '<h2>Positions</h2>', _table(payload['positions']),
+    ]
+    if payload['benchmark_table'] is not None:
+        parts += ['<h2>Benchmarks</h2>', _table(payload['benchmark_table'])]
+    for chart in CHARTS:
+        if images.get(chart):
+            encoded = base64.b64encode(images[chart]).decode('ascii')
+            parts += [f'<h2>{CHART_TITLES[chart]}</h2>', f'<img alt="{CHART_TITLES[chart]}" src="data:image/png;base64,{encoded}">']
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+def _write(path, payload, images):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(report_html(payload, images))
+    os.replace(temp_path, path)
+    return path
+
+
+def write_report(payload, path):
+    """Render every chart of one payload in this process and write the HTML report to `path`."""
+    return _write(path, payload, {chart: _render_chart((chart, payload)) for chart in CHARTS})
+
+
+def render_report(payload, path, workers=None):
+    """write_report(), with the charts drawn concurrently on a process pool."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        return write_report(payload, path)
+    with ProcessPoolExecutor(max_workers=min(workers, len(CHARTS)), initializer=_use_agg) as pool:
+        images = dict(zip(CHARTS, pool.map(_render_chart, [(chart, payload) for chart in CHARTS])))
+    return _write(path, payload, images)
@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+from metrics import TRADING_DAYS_PER_YEAR
+
+
+# Rolling-window risk for the portfolio and every holding, without a per-window pandas .apply.
+#
+# Everything except drawdown is built from windowed sums, which are one cumsum and one subtraction
+# per column. Rolling max drawdown uses the block trick: chop the series into blocks of `window` days,
+# so every window is a suffix of one block plus a prefix of the next, and both can be precomputed
+# with running max/min accumulations. Columns are processed in blocks to keep temporaries bounded.
+
+
+DEFAULT_WINDOWS = (21, 63, 252)
+COLUMN_BLOCK = 256
+
+
+def daily_returns(values):
+    """Simple daily returns of a (days x series) array, first row NaN."""
+    values = np.asarray(values, dtype='float64')
+    returns = np.full(values.shape, np.nan)
+    returns[1:] = values[1:] / values[:-1] - 1
+    return returns
+
+
+def _rolling_sum(x, window):
+    # Windowed sums along axis 0 ending at each row; rows without a full window are NaN.
+    totals = np.full(x.shape, np.nan)
+    if len(x) >= window:
+        running = np.cumsum(x, axis=0)
+        totals[window - 1] = running[window - 1]
+        totals[window:] = running[window:] - running[:-window]
+    return totals
+
+
+def _windowed(x, window):
+    # Shared prep: zero-filled data plus a mask of rows whose window has no gaps.
+    valid = np.isfinite(x)
+    complete = _rolling_sum(valid.astype('float64'), window) == window
+    return np.where(valid, x, 0.0), complete
+
+
+def _moments(x, window):
+    valid = np.isfinite(x)
+    complete = _rolling_sum(valid.astype('float64'), window) == window
+    # Centering on the column mean first keeps the sum-of-squares subtraction from losing precision.
+    with np.errstate(invalid='ignore'):
+        center = np.nan_to_num(np.nanmean(np.where(valid, x, np.nan), axis=0)) if valid.any() else np.zeros(x.shape[1])
+    centered = np.where(valid, x - center, 0.0)
+    sums = _rolling_sum(centered, window)
+    squares = _rolling_sum(centered * centered, window)
+    mean = sums / window + center
+    variance = (squares - sums * sums / window) / (window - 1)
+    return np.where(complete, mean, np.nan), np.where(complete, np.maximum(variance, 0.0), np.nan)
+
+
+def _by_column_blocks(function, x, *args, column_block=COLUMN_BLOCK):
+    x = np.asarray(x, dtype='float64')
+    if x.ndim == 1:
+        return function(x[:, None], *args)[:, 0]
+    out = np.empty(x.shape)
+    for lo in range(0, x.shape[1], column_block):
+        out[:, lo:lo + column_block] = function(x[:, lo:lo + column_block], *args)
+    return out
+
+
+def _volatility(returns, window):
+    _, variance = _moments(returns, window)
+    return np.sqrt(variance) * np.sqrt(TRADING_DAYS_PER_YEAR) * 100
+
+
+def _sharpe(returns, window, daily_risk_free):
+    mean, variance = _moments(returns, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (mean - daily_risk_free) / np.sqrt(variance) * np.sqrt(TRADING_DAYS_PER_YEAR)
+
+
+def _sortino(returns, window, daily_risk_free):
+    filled, complete = _windowed(returns, window)
+    excess = _rolling_sum(filled, window) / window - daily_risk_free
+    shortfall = np.minimum(filled - daily_risk_free, 0.0)
+    downside = np.sqrt(_rolling_sum(shortfall * shortfall, window) / window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = excess / downside * np.sqrt(TRADING_DAYS_PER_YEAR)
+    return np.where(complete, ratio, np.nan)
+
+
+def _beta_and_correlation(returns, benchmark, window):
+    both = np.isfinite(returns) & np.isfinite(benchmark)[:, None]
+    complete = _rolling_sum(both.astype('float64'), window) == window
+    x = np.where(both, returns, 0.0)
+    y = np.where(both, benchmark[:, None], 0.0)
+    sx, sy = _rolling_sum(x, window), _rolling_sum(y, window)
+    covariance = _rolling_sum(x * y, window) - sx * sy / window
+    x_variance = _rolling_sum(x * x, window) - sx * sx / window
+    y_variance = _rolling_sum(y * y, window) - sy * sy / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = covariance / y_variance
+        correlation = covariance / np.sqrt(x_variance * y_variance)
+    return np.where(complete, beta, np.nan), np.where(complete, correlation, np.nan)
+
+
+def _max_drawdown(values, window):
+    days, columns = values.shape
+    result = np.full(values.shape, np.nan)
+    if days < window:
+        return result
+    with np.errstate(divide='ignore', invalid='ignore'):
+        levels = np.log(values)
+    blocks = -(-days // window)
+    padded = np.pad(levels, ((0, blocks * window - days), (0, 0)), mode='edge').reshape(blocks, window, columns)
+
+    # Within each block: running max/min from the block start (prefix) and towards the block end (suffix),
+    # and the deepest peak-to-trough drop inside that prefix / suffix.
+    prefix_max = np.maximum.accumulate(padded, axis=1)
+    prefix_min = np.minimum.accumulate(padded, axis=1)
+    prefix_drop = np.maximum.accumulate(prefix_max - padded, axis=1)
+    flipped = padded[:, ::-1]
+    suffix_min = np.minimum.accumulate(flipped, axis=1)
+    suffix_max = np.maximum.accumulate(flipped, axis=1)[:, ::-1]
+    suffix_drop = np.maximum.accumulate(flipped - suffix_min, axis=1)[:, ::-1]
+
+    prefix_max, prefix_min, prefix_drop, suffix_max, suffix_drop = (
+        a.reshape(-1, columns)[:days] for a in (prefix_max, prefix_min, prefix_drop, suffix_max, suffix_drop))
+
+    ends = np.arange(window - 1, days)
+    starts = ends - window + 1
+    aligned = starts % window == 0
+    worst = np.where(
+        aligned[:, None],
+        prefix_drop[ends],
+        np.maximum(np.maximum(suffix_drop[starts], prefix_drop[ends]), suffix_max[starts] - prefix_min[ends]))
+    result[window - 1:] = (np.exp(-worst) - 1) * 100
+
+    complete = _rolling_sum(np.isfinite(levels).astype('float64'), window) == window
+    return np.where(complete, result, np.nan)
+
+
+def rolling_volatility(returns, window, column_block=COLUMN_BLOCK):
+    """Annualized rolling volatility of daily returns, in percent."""
+    return _by_column_blocks(_volatility, returns, window, column_block=column_block)
+
+
+def rolling_sharpe(returns, window, risk_free_rate=0.0, column_block=COLUMN_BLOCK):
+    """Annualized rolling Sharpe ratio; `risk_free_rate` is annual (0.04 = 4%)."""
+    return _by_column_blocks(_sharpe, returns, window, risk_free_rate / TRADING_DAYS_PER_YEAR, column_block=column_block)
+
+
+def rolling_sortino(returns, window, risk_free_rate=0.0, column_block=COLUMN_BLOCK):
+    """Annualized rolling Sortino ratio (downside deviation below the risk-free rate)."""
+    return _by_column_blocks(_sortino, returns, window, risk_free_rate / TRADING_DAYS_PER_YEAR, column_block=column_block)
+
+
+def rolling_beta_and_correlation(returns, benchmark_returns, window, column_block=COLUMN_BLOCK):
+    """Rolling beta and correlation of every column against the benchmark's daily returns."""
+    returns = np.asarray(returns, dtype='float64')
+    benchmark_returns = np.asarray(benchmark_returns, dtype='float64')
+    squeeze = returns.ndim == 1
+    returns = returns[:, None] if squeeze else returns
+    beta, correlation = np.empty(returns.shape), np.empty(returns.shape)
+    for lo in range(0, returns.shape[1], column_block):
+        beta[:, lo:lo + column_block], correlation[:, lo:lo + column_block] = _beta_and_correlation(
+            returns[:, lo:lo + column_block], benchmark_returns, window)
+    return (beta[:, 0], correlation[:, 0]) if squeeze else (beta, correlation)
+
+
+def rolling_max_drawdown(values, window, column_block=COLUMN_BLOCK):
+    """Deepest peak-to-trough drop inside each trailing window of a value/price series, in percent."""
+    return _by_column_blocks(_max_drawdown, values, window, column_block=column_block)
+
+
+def rolling_risk(values, benchmark, windows=DEFAULT_WINDOWS, risk_free_rate=0.0, column_block=COLUMN_BLOCK):
+    """Every rolling metric for every column of `values` (days x series of prices or values).
+
+    Returns {window: {metric: DataFrame}} with metrics 'volatility', 'beta', 'correlation', 'sharpe',
+    'sortino' and 'max_drawdown', all indexed like `values`. `benchmark` is a price Series; it's
+    forward-filled onto the same calendar.
+    """
+    values = values.astype('float64')
+    benchmark_values = benchmark.reindex(values.index, method='ffill').to_numpy(dtype='float64')
+    returns = daily_returns(values.to_numpy())
+    benchmark_returns = daily_returns(benchmark_values)
+
+    def frame(array):
+        return pd.DataFrame(array, index=values.index, columns=values.columns)
+
+    report = {}
+    for window in windows:
+        beta, correlation = rolling_beta_and_correlation(returns, benchmark_returns, window, column_block)
+        report[window] = {
+            'volatility': frame(rolling_volatility(returns, window, column_block)),
+            'beta': frame(beta),
+            'correlation': frame(correlation),
+            'sharpe': frame(rolling_sharpe(returns, window, risk_free_rate, column_block)),
+            'sortino': frame(rolling_sortino(returns, window, risk_free_rate, column_block)),
+            'max_drawdown': frame(rolling_max_drawdown(values.to_numpy(), window, column_block)),
+        }
+    return report
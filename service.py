@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import pandas as pd
+
+from analysis import (
+    ANALYZER_BENCHMARKS, analyze_prices, history_start, load_portfolio, lots_from_entries, market_data_provider,
+    open_data_stores,
+)
+from benchmark_comparison import benchmark_tickers
+
+
+# The analyzer as a long-running local HTTP service, so dashboards don't pay for imports, downloads and
+# a cold start on every call:
+#
+#   python service.py --port 8765
+#   curl -X POST --data-binary @portfolio.csv http://127.0.0.1:8765/analyze
+#   curl -X POST -H 'Content-Type: application/json' -d '{"lots": [...], "benchmarks": ["VOO"]}' http://127.0.0.1:8765/analyze
+#
+# Price and dividend histories stay in memory in an LRU keyed by ticker and date range (the start is
+# rounded down to the year, so portfolios bought around the same time share entries). Requests that
+# need the same missing data at the same moment wait on one fetch instead of each starting their own,
+# and whatever is missing for a request goes out as one batch. Fetching runs on a single background
+# thread, since the price store on disk isn't made for concurrent writers; the analysis itself runs on
+# a separate pool so the event loop keeps answering while it computes. It's plain asyncio and the
+# standard library's HTTP status table, nothing to install.
+
+
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_ENTRIES = 4096
+MAX_BODY_BYTES = 10 * 1024 * 1024
+MAX_HEADER_LINES = 100
+
+
+class LRUCache:
+    """A dict that forgets its least recently used entries beyond `max_entries`, with hit/miss counts."""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'entries': len(self.entries), 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses}
+
+
+class MarketDataCache:
+    """In-memory, coalescing front for the price store and dividend cache.
+
+    Only touched from the event loop, so it needs no locks: a key is either cached, already being fetched
+    (everyone awaits the same future), or fetched now together with the request's other missing keys.
+    """
+
+    def __init__(self, price_store, dividend_cache, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.price_store = price_store
+        self.dividend_cache = dividend_cache
+        self.cache = LRUCache(max_entries)
+        self.in_flight = {}
+        self.fetches = 0
+        self.coalesced = 0
+        self._tasks = set()
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='market-data')
+
+    async def _get(self, keys, fetch, cacheable=None):
+        # {key: value} for every key; the missing ones go to `fetch(missing keys) -> {key: value}` as one batch.
+        # Values `cacheable(value)` turns down are handed to whoever asked but not kept for the next request.
+        found, waiting, missing = {}, {}, []
+        for key in dict.fromkeys(keys):
+            value = self.cache.get(key)
+            if value is not None:
+                found[key] = value
+            elif key in self.in_flight:
+                self.coalesced += 1
+                waiting[key] = self.in_flight[key]
+            else:
+                missing.append(key)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            self.in_flight.update(futures)
+            waiting.update(futures)
+            # The fetch is its own task, so a caller that goes away doesn't strand everyone waiting on it.
+            task = loop.create_task(self._fetch_into(missing, fetch, futures, cacheable))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        for key, future in waiting.items():
+            # Shielded: a cancelled request stops waiting, but the shared future stays live for the others.
+            found[key] = await asyncio.shield(future)
+        return found
+
+    async def _fetch_into(self, keys, fetch, futures, cacheable=None):
+        self.fetches += 1
+        try:
+            fetched = await asyncio.get_running_loop().run_in_executor(self._io, fetch, keys)
+        except asyncio.CancelledError:
+            for future in futures.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for key, future in futures.items():
+                if cacheable is None or cacheable(fetched[key]):
+                    self.cache.put(key, fetched[key])
+                if not future.done():
+                    future.set_result(fetched[key])
+        finally:
+            for key in keys:
+                self.in_flight.pop(key, None)
+
+    def _fetch_prices(self, keys):
+        # Keys are (ticker, start, end); one store call per distinct range.
+        fetched = {}
+        for start, end in dict.fromkeys((start, end) for _, start, end in keys):
+            tickers = [ticker for ticker, s, e in keys if (s, e) == (start, end)]
+            prices = self.price_store.adjusted_close(tickers, start, end)
+            for ticker in tickers:
+                series = prices[ticker].dropna() if ticker in prices.columns else pd.Series(dtype='float64')
+                fetched[(ticker, start, end)] = series.copy()
+        return fetched
+
+    def _fetch_dividends(self, keys):
+        # Keys are (ticker, day); the day makes them refresh daily, the dividend cache does the rest.
+        histories, errors = self.dividend_cache.histories([ticker for ticker, _ in keys])
+        return {(ticker, day): (histories[ticker], errors.get(ticker)) for ticker, day in keys}
+
+    async def prices(self, tickers, start, end):
+        """(days x tickers) adjusted closes for [start of start's year, end)."""
+        start = pd.Timestamp(year=pd.Timestamp(start).year, month=1, day=1)
+        end = pd.Timestamp(end).normalize()
+        keys = [(ticker, start, end) for ticker in tickers]
+        found = await self._get(keys, self._fetch_prices)
+        columns = {ticker: found[(ticker, start, end)] for ticker in dict.fromkeys(tickers)}
+        return pd.DataFrame(columns).sort_index() if columns else pd.DataFrame()
+
+    async def dividends(self, tickers, day):
+        """({ticker: dividend history}, {ticker: error}) as of `day`."""
+        day = pd.Timestamp(day).normalize()
+        # A ticker that failed isn't kept, so the next request tries it again.
+        found = await self._get([(ticker, day) for ticker in tickers], self._fetch_dividends,
+                                cacheable=lambda entry: entry[1] is None)
+        histories = {ticker: found[(ticker, day)][0] for ticker in dict.fromkeys(tickers)}
+        errors = {ticker: found[(ticker, day)][1] for ticker in histories if found[(ticker, day)][1] is not None}
+        return histories, errors
+
+    def stats(self):
+        return {**self.cache.stats(), 'fetches': self.fetches, 'coalesced': self.coalesced, 'in_flight': len(self.in_flight)}
+
+    def close(self):
+        self._io.shutdown(wait=False)
+
+
+def parse_portfolio(body, content_type=''):
+    """(lots, lot accounting or None, options) from a request body.
+
+    A JSON body is {"lots": [{"ticker", "shares", "purchase_date", "purchase_price"}, ...]} plus optional
+    "benchmarks" and "as_of"; anything else is read as the CSV the script takes (lots or a ledger).
+    """
+    text = body.decode('utf-8-sig')
+    if 'json' in content_type or text.lstrip().startswith('{'):
+        request = json.loads(text)
+        entries = [{key.lower(): value for key, value in entry.items()} for entry in request.get('lots', [])]
+        if not entries:
+            raise ValueError("The request has no lots.")
+        lots = lots_from_entries(entries)
+        lots.index = lots.index.astype(str).str.strip().str.upper()
+        lots['shares'] = lots['shares'].astype('float64')
+        lots['purchase_price'] = lots['purchase_price'].astype('float64')
+        return lots, None, request
+    lots, accounting = load_portfolio(io.StringIO(text), os.environ.get('PORTFOLIO_LOT_METHOD', 'fifo'))
+    if lots.empty:
+        raise ValueError("The portfolio has no lots.")
+    return lots, accounting, {}
+
+
+def request_benchmarks(options):
+    """The request's "benchmarks" as a list of specs, or None to use the service's own; a lone string is one spec."""
+    benchmarks = options.get('benchmarks')
+    if benchmarks is None:
+        return None
+    if isinstance(benchmarks, str):
+        benchmarks = [benchmarks]
+    if not isinstance(benchmarks, list) or not all(isinstance(spec, str) and spec.strip() for spec in benchmarks):
+        raise ValueError('"benchmarks" must be a list of benchmark specs such as ["VOO", "SPY:0.6+AGG:0.4"].')
+    return [spec.strip() for spec in benchmarks]
+
+
+class AnalysisService:
+    """Portfolio analysis against a shared MarketDataCache, with the number crunching on an executor."""
+
+    def __init__(self, provider=None, store_root=None, benchmarks=ANALYZER_BENCHMARKS, cache_entries=DEFAULT_CACHE_ENTRIES,
+                 workers=None, correlation=False):
+        price_store, dividend_cache = open_data_stores(provider, store_root)
+        self.market_data = MarketDataCache(price_store, dividend_cache, cache_entries)
+        self.benchmarks = list(benchmarks)
+        self.correlation = correlation
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix='analysis')
+        self.requests = 0
+        self.started = time.time()
+
+    async def analyze(self, lots, lot_accounting=None, benchmarks=None, as_of=None):
+        """AnalysisResult.to_dict() for one portfolio."""
+        self.requests += 1
+        benchmarks = [benchmarks] if isinstance(benchmarks, str) else list(benchmarks or self.benchmarks)
+        as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp.now()
+        tickers = list(dict.fromkeys(lots.index))
+        if lot_accounting is not None:
+            tickers = list(dict.fromkeys(tickers + list(lot_accounting.ledger.tickers)))
+        end = as_of.normalize()  # same [start, as_of day) window the price store gives analyze()
+        prices, (histories, errors) = await asyncio.gather(
+            self.market_data.prices(tickers + benchmark_tickers(benchmarks), history_start(lots, lot_accounting), end),
+            self.market_data.dividends(list(dict.fromkeys(lots.index)), as_of),
+        )
+        loop = asyncio.get_running_loop()
+
+        def run():
+            return analyze_prices(lots, prices, histories, benchmarks, as_of, lot_accounting, self.correlation, errors).to_dict()
+        return await loop.run_in_executor(self.executor, run)
+
+    async def handle(self, method, path, headers, body):
+        """(HTTP status, JSON-ready payload) for one request."""
+        if path == '/health':
+            return HTTPStatus.OK, {'status': 'ok', 'requests': self.requests, 'uptime_seconds': time.time() - self.started,
+                                   'cache': self.market_data.stats()}
+        if path != '/analyze':
+            return HTTPStatus.NOT_FOUND, {'error': f'No such endpoint: {path}'}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'POST a portfolio CSV or JSON to /analyze.'}
+        try:
+            lots, accounting, options = parse_portfolio(body, headers.get('content-type', ''))
+            return HTTPStatus.OK, await self.analyze(lots, accounting, request_benchmarks(options), options.get('as_of'))
+        except (ValueError, KeyError, TypeError) as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        head = (f'HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('ascii') + body)
+        await writer.drain()
+
+    async def serve_connection(self, reader, writer):
+        """Minimal HTTP/1.1: one request after another on the connection, bodies sized by Content-Length."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {'error': 'Malformed request line.'}, False)
+                    break
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': f'Bodies are limited to {MAX_BODY_BYTES} bytes.'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                try:
+                    status, payload = await self.handle(method.upper(), target.split('?')[0], headers, body)
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f'{type(e).__name__}: {e}'}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        """Start listening and return the asyncio Server (port 0 picks a free one)."""
+        return await asyncio.start_server(self.serve_connection, host, port, backlog=1024, limit=MAX_BODY_BYTES)
+
+    def close(self):
+        self.market_data.close()
+        self.executor.shutdown(wait=False)
+
+
+async def serve(host, port, **options):
+    service = AnalysisService(**options)
+    server = await service.start(host, port)
+    print(f"Portfolio analysis service listening on http://{host}:{server.sockets[0].getsockname()[1]}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve portfolio analysis over HTTP with a warm, shared market data cache.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--benchmarks', default=os.environ.get('PORTFOLIO_BENCHMARKS', ','.join(ANALYZER_BENCHMARKS)),
+                        help="default comma-separated benchmarks (a request can send its own)")
+    parser.add_argument('--cache-entries', type=int, default=DEFAULT_CACHE_ENTRIES, help='price / dividend histories kept in memory')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='analysis threads (default: all cores)')
+    parser.add_argument('--fixtures', help='read market data from this fixture folder instead of Yahoo Finance')
+    args = parser.parse_args(argv)
+    benchmarks = [spec.strip() for spec in args.benchmarks.split(',') if spec.strip()]
+    try:
+        asyncio.run(serve(args.host, args.port, provider=market_data_provider(args.fixtures), benchmarks=benchmarks,
+                          cache_entries=args.cache_entries, workers=args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import json
+import math
+import os
+
+import pandas as pd
+
+from metrics import DAYS_PER_YEAR, TRADING_DAYS_PER_YEAR
+
+
+# End-of-day refreshes shouldn't redo decades of history. A MetricsAccumulator remembers just enough
+# (running peak, Welford mean/variance of daily returns, first/last values) to fold in new bars one at
+# a time, and round-trips through JSON so the next run picks up where this one stopped. Fed the same
+# bars, it reports what metrics.max_drawdown / annualized_volatility / total_return report, up to
+# floating-point rounding.
+#
+# Adjusted closes get rescaled back through history when a dividend or split lands, which would leave
+# the saved peak / last value on the old basis. So the caller can also stash a `basis` (the prices it
+# valued the last bar at) and start over when those no longer match what the store says.
+
+
+class MetricsAccumulator:
+    """O(1)-per-bar running drawdown, volatility, growth, dividends and benchmark-relative return."""
+
+    FIELDS = ('fingerprint', 'bars', 'first_date', 'first_value', 'last_date', 'last_value', 'peak', 'worst_drawdown',
+              'return_count', 'return_mean', 'return_m2', 'dividends', 'benchmark_first', 'benchmark_last', 'basis')
+
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.bars = 0
+        self.first_date = None
+        self.first_value = None
+        self.last_date = None
+        self.last_value = None
+        self.peak = None
+        self.worst_drawdown = 0.0
+        self.return_count = 0
+        self.return_mean = 0.0
+        self.return_m2 = 0.0
+        self.dividends = 0.0
+        self.benchmark_first = None
+        self.benchmark_last = None
+        self.basis = None
+
+    def update(self, date, value, dividends=0.0, benchmark=None):
+        """Fold in one daily bar. Bars at or before the last one seen are skipped, so replays are harmless.
+
+        Days the portfolio is worth nothing are skipped too, the same way the batch series drops them.
+        """
+        date = pd.Timestamp(date)
+        if self.last_date is not None and date <= self.last_date:
+            return False
+        if not value > 0:
+            return False
+
+        if self.bars == 0:
+            self.first_date, self.first_value, self.peak = date, value, value
+        else:
+            daily_return = value / self.last_value - 1
+            self.return_count += 1
+            delta = daily_return - self.return_mean
+            self.return_mean += delta / self.return_count
+            self.return_m2 += delta * (daily_return - self.return_mean)
+
+        self.peak = max(self.peak, value)
+        self.worst_drawdown = min(self.worst_drawdown, value / self.peak - 1)
+        self.dividends += dividends
+        if benchmark is not None and math.isfinite(benchmark):
+            if self.benchmark_first is None:
+                self.benchmark_first = benchmark
+            self.benchmark_last = benchmark
+
+        self.bars += 1
+        self.last_date, self.last_value = date, value
+        return True
+
+    def update_many(self, dates, values, dividends=None, benchmark=None):
+        """Fold in a small batch of bars in date order; returns how many were new."""
+        dividends = [0.0] * len(dates) if dividends is None else dividends
+        benchmark = [None] * len(dates) if benchmark is None else benchmark
+        return sum(self.update(*bar) for bar in zip(dates, values, dividends, benchmark))
+
+    @classmethod
+    def from_series(cls, values, dividends=None, benchmark=None, fingerprint=None):
+        accumulator = cls(fingerprint)
+        accumulator.update_many(
+            values.index, values.to_numpy(dtype='float64'),
+            None if dividends is None else dividends.reindex(values.index, fill_value=0.0).to_numpy(dtype='float64'),
+            None if benchmark is None else benchmark.reindex(values.index).to_numpy(dtype='float64'))
+        return accumulator
+
+    def max_drawdown(self):
+        return self.worst_drawdown * 100
+
+    def volatility(self):
+        if self.return_count < 2:
+            return 0
+        return math.sqrt(self.return_m2 / (self.return_count - 1)) * math.sqrt(TRADING_DAYS_PER_YEAR) * 100
+
+    def total_return(self, with_dividends=False):
+        if not self.bars:
+            return 0
+        end_value = self.last_value + (self.dividends if with_dividends else 0.0)
+        return (end_value / self.first_value - 1) * 100
+
+    def cagr(self, with_dividends=False):
+        if not self.bars:
+            return 0
+        years = (self.last_date - self.first_date).days / DAYS_PER_YEAR
+        if years <= 0:
+            return self.total_return(with_dividends)
+        end_value = self.last_value + (self.dividends if with_dividends else 0.0)
+        return ((end_value / self.first_value)**(1 / years) - 1) * 100
+
+    def benchmark_return(self):
+        if self.benchmark_first is None:
+            return math.nan
+        return (self.benchmark_last / self.benchmark_first - 1) * 100
+
+    def relative_return(self):
+        return self.total_return() - self.benchmark_return()
+
+    def to_dict(self):
+        state = {name: getattr(self, name) for name in self.FIELDS}
+        for name in ('first_date', 'last_date'):
+            if state[name] is not None:
+                state[name] = state[name].isoformat()
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        accumulator = cls()
+        for name in cls.FIELDS:
+            setattr(accumulator, name, state.get(name, getattr(accumulator, name)))
+        for name in ('first_date', 'last_date'):
+            if accumulator.__dict__[name] is not None:
+                setattr(accumulator, name, pd.Timestamp(state[name]))
+        return accumulator
+
+    def save(self, path):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
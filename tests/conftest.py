@@ -0,0 +1,24 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def market():
+    """Small deterministic market: 6 tickers over 300 business days, staggered listings and dividends."""
+    rng = np.random.default_rng(7)
+    calendar = pd.bdate_range('2020-01-01', periods=300).as_unit('ns')
+    tickers = ['AAA', 'BBB', 'CCC', 'DDD', 'EEE', 'BENCH']
+    closes = 50 * np.exp(np.cumsum(rng.normal(0.0004, 0.015, (len(calendar), len(tickers))), axis=0))
+    closes[:40, 2] = np.nan
+    prices = pd.DataFrame(closes, index=calendar, columns=tickers)
+    dividends = {
+        'AAA': pd.Series([0.4, 0.45, 0.5], index=calendar[[30, 120, 210]]),
+        'CCC': pd.Series([0.2, 0.25], index=pd.DatetimeIndex([calendar[90] + pd.Timedelta(days=1), calendar[250]])),
+    }
+    return prices, dividends
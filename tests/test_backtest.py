@@ -0,0 +1,103 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import Strategy, is_target_weights_csv, main, read_target_weights, run_backtest, strategy_grid
+from market_data import write_price_fixtures
+
+
+def day_by_day(prices, strategy, dividends, initial_value=10_000.0):
+    """The obvious simulation: every day, collect dividends, check every trigger, trade if one fired."""
+    assets = list(strategy.targets.columns[(strategy.targets > 0).any()])
+    closes = prices[assets].ffill().dropna()
+    calendar, matrix = closes.index, closes.to_numpy()
+    paid = np.zeros_like(matrix)
+    for column, ticker in enumerate(assets):
+        for day, amount in dividends.get(ticker, pd.Series(dtype='float64')).items():
+            row = calendar.searchsorted(day)
+            if 0 < row < len(calendar):
+                paid[row, column] += amount
+    targets = strategy.targets.reindex(columns=assets, fill_value=0.0)
+
+    def target_on(row):
+        live = [k for k, day in enumerate(targets.index) if pd.isna(day) or calendar.searchsorted(day) <= row]
+        return targets.iloc[max(live) if live else 0].to_numpy()
+
+    frequency = {'none': None, 'monthly': 'M', 'quarterly': 'Q', 'annual': 'Y'}[strategy.rebalance]
+    periods = calendar.to_period(frequency).asi8 if frequency else None
+    shares, cash, current, values = np.zeros(len(assets)), initial_value, None, []
+    for row in range(len(calendar)):
+        if strategy.reinvest_dividends:
+            shares = shares + shares * paid[row] / matrix[row]
+        else:
+            cash += shares @ paid[row]
+        value = shares @ matrix[row] + cash
+        target = target_on(row)
+        trade = row == 0
+        if row > 0:
+            trade |= periods is not None and periods[row] != periods[row - 1]
+            trade |= not np.allclose(target, current)
+            trade |= bool(strategy.band) and np.max(np.abs(shares * matrix[row] / value - current)) > strategy.band
+        if trade:
+            current = target
+            value -= strategy.cost_bps / 1e4 * np.abs(current * value - shares * matrix[row]).sum()
+            shares, cash = current * value / matrix[row], 0.0
+        values.append(value)
+    return pd.Series(values, index=calendar)
+
+
+def test_event_stepped_backtest_matches_a_day_by_day_loop(market):
+    prices, dividends = market
+    tickers = ['AAA', 'BBB', 'CCC', 'DDD']
+    weights = pd.Series([4.0, 3.0, 2.0, 1.0], index=tickers)
+    schedule = pd.DataFrame([[1.0, 1.0, 1.0, 1.0], [1.0, 2.0, 3.0, 4.0]], columns=tickers,
+                            index=pd.DatetimeIndex([prices.index[0] - pd.Timedelta(days=400), prices.index[180]]))
+    strategies = strategy_grid(weights, ('none', 'monthly', 'quarterly', 'annual'), (None, 0.02, 0.1), (0.0, 25.0), (True, False))
+    strategies += [Strategy(schedule, 'none', None, 10.0, True, name='schedule'),
+                   Strategy(schedule, 'quarterly', 0.05, 10.0, False, name='schedule_band')]
+
+    result = run_backtest(prices, strategies, dividends, block_elements=64)
+    for strategy in strategies:
+        expected = day_by_day(prices, strategy, dividends)
+        np.testing.assert_allclose(result.values[strategy.name].dropna().to_numpy(), expected.to_numpy(), rtol=1e-9,
+                                   err_msg=strategy.name)
+
+    summary = result.summary(prices, ['BENCH'])
+    final = result.values.ffill().iloc[-1]
+    np.testing.assert_allclose(summary['total_return'], (final / 10_000 - 1) * 100)
+    assert (summary.loc['none_0bps_drip', ['rebalances', 'costs_paid']] == [0, 0]).all()
+
+
+def test_target_weights_from_either_csv_layout():
+    weights = read_target_weights(io.StringIO('Ticker,Weight\nAAA,60\n bbb ,30\nAAA,10\n'))
+    pd.testing.assert_series_equal(weights, pd.Series([0.7, 0.3], index=['AAA', 'BBB']), check_names=False)
+    schedule = read_target_weights(io.StringIO('Date,AAA,bbb\n2021-01-01,3,1\n2020-01-01,1,1\n'))
+    assert list(schedule.columns) == ['AAA', 'BBB'] and schedule.index.is_monotonic_increasing
+    np.testing.assert_allclose(schedule.to_numpy(), [[0.5, 0.5], [0.75, 0.25]])
+    with pytest.raises(ValueError):
+        read_target_weights(io.StringIO('Symbol,Amount\nAAA,1\n'))
+
+
+def test_file_kinds_are_told_apart():
+    assert is_target_weights_csv(io.StringIO('Ticker,Weight\nAAA,1\n'))
+    assert is_target_weights_csv(io.StringIO('Date,AAA,BBB\n2020-01-01,1,1\n'))
+    assert not is_target_weights_csv(io.StringIO('Date,Ticker,Action,Quantity,Price\n2020-01-02,AAA,BUY,1,10\n'))
+    assert not is_target_weights_csv(io.StringIO('Ticker,Shares,Purchase_Date,Purchase_Price\nAAA,1,2020-01-02,10\n'))
+
+
+def test_main_backtests_a_ledger(tmp_path, market, monkeypatch, capsys):
+    prices, _ = market
+    write_price_fixtures(str(tmp_path / 'fixtures'), prices)
+    monkeypatch.setenv('PORTFOLIO_PRICE_STORE', str(tmp_path / 'store'))
+    ledger = tmp_path / 'ledger.csv'
+    ledger.write_text('Date,Ticker,Action,Quantity,Price\n2020-02-03,AAA,BUY,30,50\n2020-02-03,BBB,BUY,10,45\n'
+                      '2020-06-01,AAA,SELL,10,55\n2020-07-01,CCC,BUY,5,60\n')
+
+    code = main([str(ledger), '--fixtures', str(tmp_path / 'fixtures'), '--benchmarks', 'BENCH',
+                 '--rebalance', 'none', 'monthly', '--costs-bps', '0', '-o', str(tmp_path / 'summary.csv')])
+    assert code == 0, capsys.readouterr().err
+    summary = pd.read_csv(tmp_path / 'summary.csv', index_col='strategy')
+    assert list(summary.index) == ['none_0bps_drip', 'monthly_0bps_drip']
+    assert np.isfinite(summary['beta_vs_BENCH']).all()
@@ -0,0 +1,110 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from batch import portfolio_names, run_batch
+from dividends import DividendCache
+from market_data import InMemoryProvider
+from price_store import PriceStore
+
+
+def write_portfolio(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = ['Ticker,Shares,Purchase_Date,Purchase_Price'] + [f'{t},{n},{d},{p}' for t, n, d, p in rows]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+def open_stores(root, prices, dividends):
+    provider = InMemoryProvider(prices, dividends)
+    return PriceStore(os.path.join(root, 'store'), provider), DividendCache(os.path.join(root, 'dividends'), provider)
+
+
+def test_portfolio_names_are_unique():
+    assert portfolio_names(['x/a/main.csv', 'x/b/main.csv', 'x/b/main.csv']) == ['a/main', 'b/main', 'b/main (2)']
+    assert portfolio_names(['x/one.csv', 'x/two.csv']) == ['one', 'two']
+
+
+def test_same_file_name_in_two_folders_stays_apart(tmp_path, market):
+    prices, dividends = market
+    paths = [write_portfolio(str(tmp_path / 'a' / 'main.csv'), [('AAA', 10, '2020-02-03', 50)]),
+             write_portfolio(str(tmp_path / 'b' / 'main.csv'), [('BBB', 500, '2020-06-01', 40)])]
+    price_store, dividend_cache = open_stores(str(tmp_path), prices, dividends)
+    as_of = prices.index[-1] + pd.Timedelta(days=1)
+
+    results = run_batch(paths, price_store, dividend_cache, ['BENCH'], workers=1, as_of=as_of,
+                        report_dir=str(tmp_path / 'reports')).set_index('portfolio')
+    assert list(results.index) == ['a/main', 'b/main']
+    assert (results['error'] == '').all()
+    assert results.loc['a/main', 'total_invested'] == 500 and results.loc['b/main', 'total_invested'] == 20000
+    assert results['beta_vs_BENCH'].nunique() == 2
+    assert os.path.exists(tmp_path / 'reports' / 'a' / 'main.html') and os.path.exists(tmp_path / 'reports' / 'b' / 'main.html')
+
+    streamed = run_batch(paths, price_store, dividend_cache, ['BENCH'], workers=1, as_of=as_of,
+                         state_dir=str(tmp_path / 'state')).set_index('portfolio')
+    assert os.path.exists(tmp_path / 'state' / 'a' / 'main.json') and os.path.exists(tmp_path / 'state' / 'b' / 'main.json')
+    np.testing.assert_allclose(streamed['volatility'], results['volatility'])
+
+
+def test_checkpoints_start_over_when_history_is_readjusted(tmp_path, market):
+    prices, dividends = market
+    path = write_portfolio(str(tmp_path / 'p' / 'main.csv'), [('AAA', 10, '2020-02-03', 50), ('BBB', 20, '2020-03-02', 45)])
+    store_root, state_dir = str(tmp_path / 'store'), str(tmp_path / 'state')
+
+    def run(source, **kwargs):
+        price_store, dividend_cache = open_stores(store_root, source, dividends)
+        as_of = source.index[-1] + pd.Timedelta(days=1)
+        return run_batch([path], price_store, dividend_cache, ['BENCH'], workers=1, as_of=as_of, **kwargs).iloc[0]
+
+    run(prices.iloc[:200], state_dir=state_dir)
+    # A dividend on day 250 scales every earlier AAA and BENCH close down on the next fetch.
+    readjusted = prices.copy()
+    readjusted.iloc[:250, [0, 5]] *= 0.97
+    streamed, full = run(readjusted, state_dir=state_dir), run(readjusted)
+    for column in ('volatility', 'max_drawdown', 'benchmark_return'):
+        np.testing.assert_allclose(streamed[column], full[column], rtol=1e-9)
+
+
+def test_relative_columns_match_the_single_portfolio_analysis(tmp_path, market):
+    from benchmark_comparison import compare_to_benchmarks
+    from valuation import value_lots
+
+    prices, dividends = market
+    rows = [('AAA', 10, '2020-02-03', 50), ('CCC', 300, '2020-05-01', 40)]
+    path = write_portfolio(str(tmp_path / 'p' / 'main.csv'), rows)
+    price_store, dividend_cache = open_stores(str(tmp_path), prices, dividends)
+    results = run_batch([path], price_store, dividend_cache, ['BENCH'], workers=1,
+                        as_of=prices.index[-1] + pd.Timedelta(days=1)).iloc[0]
+
+    values = value_lots([r[0] for r in rows], [r[1] for r in rows], [pd.Timestamp(r[2]) for r in rows], prices).total
+    _, table = compare_to_benchmarks(values[values > 0], prices, ['BENCH'])
+    for statistic in ('alpha', 'beta', 'tracking_error', 'information_ratio', 'up_capture', 'down_capture'):
+        np.testing.assert_allclose(results[f'{statistic}_vs_BENCH'], table.loc['BENCH', statistic], rtol=1e-9)
+
+
+def test_main_reports_an_empty_folder(tmp_path, capsys):
+    from batch import main
+
+    (tmp_path / 'empty').mkdir()
+    assert main([str(tmp_path / 'empty'), '--fixtures', str(tmp_path), '--price-store', str(tmp_path / 'store'),
+                 '-o', str(tmp_path / 'out.csv')]) == 1
+    assert 'No portfolio CSVs' in capsys.readouterr().err
+    assert not (tmp_path / 'out.csv').exists()
+
+
+def test_per_lot_metrics_match_the_analyzer(market):
+    from analysis import compute_performance
+    from batch import analyze_portfolio
+    from portfolio_io import read_portfolio_csv
+
+    prices, dividends = market
+    lots = read_portfolio_csv(io.StringIO('Ticker,Shares,Purchase_Date,Purchase_Price\nAAA,10,2020-02-03,50\n'
+                                          'CCC,5,2020-01-02,40\n'))
+    as_of = prices.index[-1] + pd.Timedelta(days=1)
+    row, _, positions = analyze_portfolio(lots, prices, prices.ffill().iloc[-1], dividends, None, as_of)
+    expected, summary, _ = compute_performance(lots, prices, dividends, as_of)
+    pd.testing.assert_frame_equal(positions, expected)
+    assert {key: row[key] for key in summary} == summary
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from benchmark_comparison import relative_statistics
+from metrics import TRADING_DAYS_PER_YEAR
+
+
+def test_relative_statistics_match_a_per_pair_pandas_computation(market):
+    prices, _ = market
+    portfolio_returns = prices[['AAA', 'CCC']].pct_change(fill_method=None)
+    benchmark_returns = prices[['BENCH', 'DDD']].pct_change()
+    benchmark_returns.iloc[200:210, 1] = np.nan
+    statistics = relative_statistics(portfolio_returns, benchmark_returns)
+
+    for portfolio in portfolio_returns:
+        for benchmark in benchmark_returns:
+            pair = pd.concat([portfolio_returns[portfolio], benchmark_returns[benchmark]], axis=1).dropna()
+            p, b = pair.iloc[:, 0], pair.iloc[:, 1]
+            beta = p.cov(b) / b.var()
+            active = p - b
+            expected = {
+                'beta': beta,
+                'alpha': (p.mean() - beta * b.mean()) * TRADING_DAYS_PER_YEAR * 100,
+                'tracking_error': active.std() * np.sqrt(TRADING_DAYS_PER_YEAR) * 100,
+                'information_ratio': active.mean() * TRADING_DAYS_PER_YEAR / (active.std() * np.sqrt(TRADING_DAYS_PER_YEAR)),
+                'up_capture': p[b > 0].sum() / b[b > 0].sum() * 100,
+                'down_capture': p[b < 0].sum() / b[b < 0].sum() * 100,
+            }
+            for name, value in expected.items():
+                np.testing.assert_allclose(statistics[name].loc[portfolio, benchmark], value, rtol=1e-9, err_msg=name)
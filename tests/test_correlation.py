@@ -0,0 +1,53 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from correlation import ledoit_wolf_intensity, pairwise_correlation, shrink_correlation, top_pairs
+
+
+def _returns(market):
+    prices, _ = market
+    returns = prices.pct_change(fill_method=None)
+    returns['GONE'] = np.nan  # a ticker without a single price
+    returns.iloc[150:170, 1] = np.nan
+    return returns
+
+
+def test_pairwise_correlation_matches_dataframe_corr(market):
+    returns = _returns(market)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        blocked = pairwise_correlation(returns, block_size=3)
+    expected = returns.corr()
+    expected.loc['GONE', 'GONE'] = 1.0  # every ticker correlates perfectly with itself, even without data
+    pd.testing.assert_frame_equal(blocked, expected, rtol=1e-10, atol=1e-12)
+
+    complete = returns[['AAA', 'DDD', 'EEE']].iloc[1:]
+    pd.testing.assert_frame_equal(pairwise_correlation(complete, block_size=2), complete.corr(), rtol=1e-10, atol=1e-12)
+    pd.testing.assert_frame_equal(pairwise_correlation(returns, dtype='float32'), blocked.astype('float32'), atol=1e-5)
+
+
+def test_ledoit_wolf_intensity_matches_the_textbook_formula(market):
+    returns = _returns(market)[['AAA', 'BBB', 'DDD', 'EEE', 'BENCH']].iloc[1:].fillna(0.0)
+    returns['BENCH'] = returns['BENCH'] + returns['AAA']  # give it something to shrink
+    z = ((returns - returns.mean()) / returns.std(ddof=0)).to_numpy()
+    days, n = z.shape
+
+    sample = z.T @ z / days
+    average_variance = np.trace(sample) / n
+    distance = np.sum((sample - average_variance * np.eye(n)) ** 2) / n
+    noise = sum(np.sum((np.outer(row, row) - sample) ** 2) for row in z) / days ** 2 / n
+    expected = min(noise, distance) / distance
+    assert 0 < expected < 1
+    np.testing.assert_allclose(ledoit_wolf_intensity(returns, block_size=2), expected, rtol=1e-10)
+
+
+def test_shrinkage_and_top_pairs(market):
+    corr = pairwise_correlation(_returns(market).drop(columns='GONE'))
+    shrunk = shrink_correlation(corr, 0.25)
+    np.testing.assert_allclose(shrunk.values, 0.75 * corr.values + 0.25 * np.eye(len(corr)))
+
+    pairs = top_pairs(corr, k=3)
+    upper = corr.where(np.triu(np.ones(corr.shape, dtype=bool), 1)).stack().sort_values(ascending=False)
+    np.testing.assert_allclose(pairs['correlation'], upper.iloc[:3].values)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from dividends import DividendCache, dividend_cash_by_day, dividends_since_purchase
+from market_data import InMemoryProvider
+
+
+def test_dividends_since_purchase_matches_a_loop(market):
+    prices, dividends = market
+    rng = np.random.default_rng(0)
+    tickers = rng.choice(['AAA', 'CCC', 'BBB', 'ZZZ'], 60)
+    purchase_dates = prices.index[rng.integers(0, len(prices), 60)]
+    end = prices.index[200]
+
+    expected = []
+    for ticker, bought in zip(tickers, purchase_dates):
+        history = dividends.get(ticker, pd.Series(dtype='float64', index=pd.DatetimeIndex([])))
+        expected.append(history[(history.index >= bought) & (history.index <= end)].sum())
+    np.testing.assert_allclose(dividends_since_purchase(dividends, tickers, purchase_dates, end), expected)
+
+
+def test_dividend_cash_lands_on_the_next_trading_day(market):
+    prices, dividends = market
+    holdings = np.tile([10.0, 0.0, 4.0], (len(prices), 1))
+    cash = dividend_cash_by_day(prices.index, holdings, ['AAA', 'BBB', 'CCC'], dividends)
+
+    expected = pd.Series(0.0, index=prices.index)
+    for ticker, shares in (('AAA', 10.0), ('CCC', 4.0)):
+        for day, amount in dividends[ticker].items():
+            expected[expected.index[expected.index >= day][0]] += shares * amount
+    np.testing.assert_allclose(cash, expected.values)
+
+
+def test_cache_serves_repeats_from_disk_and_reports_failures(tmp_path, market):
+    _, dividends = market
+
+    class Flaky(InMemoryProvider):
+        def fetch_dividends(self, ticker):
+            if ticker == 'BAD':
+                raise ConnectionError(ticker)
+            return super().fetch_dividends(ticker)
+
+    provider = Flaky(pd.DataFrame(), dividends)
+    cache = DividendCache(str(tmp_path), provider, backoff_seconds=0)
+    found, errors = cache.histories(['AAA', 'CCC', 'BAD', 'AAA'])
+    assert list(errors) == ['BAD'] and found['BAD'].empty
+    pd.testing.assert_series_equal(found['AAA'], dividends['AAA'], check_names=False, check_freq=False)
+
+    calls = provider.dividend_calls
+    found, errors = cache.histories(['AAA', 'CCC'])
+    assert provider.dividend_calls == calls and not errors
+    np.testing.assert_allclose(found['CCC'].values, dividends['CCC'].values)
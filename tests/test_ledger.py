@@ -0,0 +1,98 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ledger import account_lots, read_ledger
+
+
+def random_ledger(seed=5, rows=400):
+    """A ledger CSV with buys, partial and full sells, splits, dividends and reinvestments on a few tickers."""
+    rng = np.random.default_rng(seed)
+    days = np.sort(rng.integers(0, 900, rows))
+    held = {'AAA': 0.0, 'BBB': 0.0, 'CCC': 0.0}
+    lines = ['Date,Ticker,Action,Quantity,Price,Fees']
+    for day in days:
+        date = (pd.Timestamp('2018-01-01') + pd.Timedelta(days=int(day))).date()
+        ticker = str(rng.choice(list(held)))
+        roll = rng.random()
+        price = round(float(rng.uniform(20, 200)), 2)
+        fee = round(float(rng.choice([0.0, 1.0, 4.95])), 2)
+        if roll < 0.02:
+            ratio = int(rng.choice([2, 3]))
+            held[ticker] *= ratio
+            lines.append(f'{date},{ticker},SPLIT,{ratio},0,0')
+        elif roll < 0.08 and held[ticker] > 0:
+            lines.append(f'{date},{ticker},DIVIDEND,{held[ticker]},{0.3},0')
+        elif roll < 0.45 and held[ticker] > 0:
+            shares = held[ticker] if rng.random() < 0.15 else float(rng.integers(1, int(held[ticker]) + 1))
+            held[ticker] -= shares
+            lines.append(f'{date},{ticker},SELL,{shares},{price},{fee}')
+        else:
+            shares = float(rng.integers(1, 50))
+            held[ticker] += shares
+            lines.append(f"{date},{ticker},{'REINVEST' if roll > 0.95 else 'BUY'},{shares},{price},{fee}")
+    return '\n'.join(lines) + '\n'
+
+
+def replay(text, method):
+    """One Python object per lot, one transaction at a time: the way lot accounting is usually written."""
+    rows = pd.read_csv(io.StringIO(text))
+    results, open_lots = {}, []
+    for ticker, trades in rows.groupby('Ticker', sort=False):
+        lots, proceeds, realized_cost = [], 0.0, 0.0
+        for row in trades.itertuples():
+            if row.Action == 'SPLIT':
+                lots = [[shares * row.Quantity, cost / row.Quantity, date] for shares, cost, date in lots]
+            elif row.Action in ('BUY', 'REINVEST'):
+                lots.append([row.Quantity, (row.Quantity * row.Price + row.Fees) / row.Quantity, row.Date])
+            elif row.Action == 'SELL':
+                proceeds += row.Quantity * row.Price - row.Fees
+                if method == 'average':
+                    held = sum(shares for shares, _, _ in lots)
+                    basis = sum(shares * cost for shares, cost, _ in lots)
+                    realized_cost += basis * row.Quantity / held
+                    lots = [[shares * (1 - row.Quantity / held), cost, date] for shares, cost, date in lots]
+                    continue
+                to_sell = row.Quantity
+                while to_sell > 1e-9:
+                    lot = lots[0] if method == 'fifo' else lots[-1]
+                    taken = min(lot[0], to_sell)
+                    realized_cost += taken * lot[1]
+                    lot[0] -= taken
+                    to_sell -= taken
+                    if lot[0] <= 1e-9:
+                        lots.remove(lot)
+                lots = [lot for lot in lots if lot[0] > 1e-9]
+        lots = [lot for lot in lots if lot[0] > 1e-9]
+        results[ticker] = {
+            'shares': sum(shares for shares, _, _ in lots),
+            'cost_basis': sum(shares * cost for shares, cost, _ in lots),
+            'proceeds': proceeds,
+            'realized_cost': realized_cost,
+        }
+        open_lots += [(ticker, pd.Timestamp(date), shares) for shares, _, date in lots]
+    return pd.DataFrame(results).T, open_lots
+
+
+@pytest.mark.parametrize('method', ['fifo', 'lifo', 'average'])
+def test_lot_accounting_matches_a_lot_by_lot_replay(method):
+    text = random_ledger()
+    accounting = account_lots(read_ledger(io.StringIO(text), chunksize=97), method)
+    expected, expected_lots = replay(text, method)
+
+    positions = accounting.positions.loc[expected.index]
+    for column in expected.columns:
+        np.testing.assert_allclose(positions[column], expected[column].astype(float), rtol=1e-9, atol=1e-6, err_msg=column)
+    np.testing.assert_allclose(positions['realized_pnl'], positions['proceeds'] - positions['realized_cost'])
+    if method != 'average':
+        lots = accounting.open_lots
+        actual = sorted(zip(lots.index, lots['purchase_date'], lots['shares'].round(6)))
+        assert actual == sorted((t, d, round(s, 6)) for t, d, s in expected_lots)
+
+
+def test_ledger_that_oversells_is_rejected():
+    text = 'Date,Ticker,Action,Quantity,Price\n2020-01-02,AAA,BUY,5,10\n2020-01-03,AAA,SELL,6,11\n2020-01-03,X,HOLD,1,1\n'
+    with pytest.raises(ValueError, match='AAA'):
+        read_ledger(io.StringIO(text))
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from monte_carlo import simulate_portfolio
+
+
+@pytest.fixture
+def history(market):
+    prices, _ = market
+    returns = prices[['AAA', 'BBB', 'DDD']].pct_change().iloc[1:]
+    return returns, np.array([5000.0, 3000.0, 2000.0])
+
+
+@pytest.mark.parametrize('method', ['parametric', 'bootstrap'])
+def test_same_seed_gives_the_same_paths_on_a_pool(history, method):
+    returns, holdings = history
+    serial = simulate_portfolio(returns, holdings, n_paths=5000, method=method, chunk_size=1500, seed=3)
+    pooled = simulate_portfolio(returns, holdings, n_paths=5000, method=method, chunk_size=1500, seed=3, workers=2)
+    for horizon in serial.horizons:
+        np.testing.assert_array_equal(serial.terminal_values[horizon], pooled.terminal_values[horizon])
+        assert len(serial.terminal_values[horizon]) == 5000
+    other = simulate_portfolio(returns, holdings, n_paths=5000, method=method, chunk_size=1500, seed=4)
+    assert not np.array_equal(serial.terminal_values[21], other.terminal_values[21])
+
+
+def test_bootstrap_matches_a_day_by_day_loop(history):
+    returns, holdings = history
+    log_returns = np.log1p(returns.to_numpy())
+    block_length, horizons = 10, (5, 21)
+    result = simulate_portfolio(returns, holdings, horizons=horizons, n_paths=200, method='bootstrap',
+                                block_length=block_length, seed=11)
+
+    # Replay the same block starts one day at a time, wrapping around the end of the history.
+    rng = np.random.default_rng(np.random.SeedSequence(11).spawn(1)[0])
+    starts = [rng.integers(0, len(log_returns), size=200) for _ in range(-(-max(horizons) // block_length))]
+    for path in range(200):
+        days = [(s[path] + k) % len(log_returns) for s in starts for k in range(block_length)]
+        for horizon in horizons:
+            expected = np.exp(log_returns[days[:horizon]].sum(axis=0)) @ holdings
+            np.testing.assert_allclose(result.terminal_values[horizon][path], expected, rtol=1e-10)
+
+
+def test_parametric_moments_and_risk_summaries(history):
+    returns, holdings = history
+    result = simulate_portfolio(returns, holdings, horizons=(21,), n_paths=100_000, seed=1)
+    log_returns = np.log1p(returns.to_numpy())
+    mean, covariance = log_returns.mean(axis=0) * 21, np.cov(log_returns, rowvar=False) * 21
+    expected_mean = holdings @ np.exp(mean + np.diag(covariance) / 2)
+    values = result.terminal_values[21]
+    np.testing.assert_allclose(values.mean(), expected_mean, rtol=2e-3)
+
+    summary = result.summary()
+    assert summary.loc[21, 'VaR_99'] > summary.loc[21, 'VaR_95']
+    assert summary.loc[21, 'CVaR_95'] >= summary.loc[21, 'VaR_95']
+    np.testing.assert_allclose(summary.loc[21, 'VaR_95'], 10000 - np.quantile(values, 0.05))
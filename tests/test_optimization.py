@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from optimization import PortfolioOptimizer, _solve_mean_variance
+
+optimize = pytest.importorskip('scipy.optimize')
+
+
+def _slsqp(objective, n, upper, constraints=()):
+    bounds = [(0.0, upper)] * n
+    constraints = [{'type': 'eq', 'fun': lambda w: w.sum() - 1}, *constraints]
+    return optimize.minimize(objective, np.full(n, 1.0 / n), bounds=bounds, constraints=constraints, method='SLSQP',
+                             options={'ftol': 1e-15, 'maxiter': 2000}).x
+
+
+@pytest.fixture
+def optimizer(market):
+    prices, _ = market
+    returns = prices.pct_change(fill_method=None).iloc[1:]
+    return PortfolioOptimizer(returns, max_weight=0.4, risk_free_rate=0.02)
+
+
+def test_optimized_portfolios_match_slsqp(optimizer):
+    mu, sigma, n = optimizer._mu, optimizer._sigma, len(optimizer.assets)
+
+    reference = _slsqp(lambda w: w @ sigma @ w, n, 0.4)
+    weights = optimizer.min_variance()[optimizer.assets].to_numpy()
+    np.testing.assert_allclose(weights @ sigma @ weights, reference @ sigma @ reference, rtol=1e-7)
+    assert weights.min() >= -1e-12 and weights.max() <= 0.4 + 1e-12 and abs(weights.sum() - 1) < 1e-10
+
+    reference = _slsqp(lambda w: -(w @ mu - 0.02) / np.sqrt(w @ sigma @ w), n, 0.4)
+    best = optimizer.evaluate(reference)['sharpe'].iloc[0]
+    assert optimizer.evaluate(optimizer.max_sharpe())['sharpe'].iloc[0] >= best - 1e-6
+
+    target = 0.5 * (optimizer.evaluate(optimizer.min_variance())['volatility'].iloc[0] +
+                    optimizer.evaluate(optimizer.max_sharpe())['volatility'].iloc[0])
+    reference = _slsqp(lambda w: -(w @ mu), n, 0.4, [{'type': 'ineq', 'fun': lambda w: (target / 100) ** 2 - w @ sigma @ w}])
+    stats = optimizer.evaluate(optimizer.target_volatility(target)).iloc[0]
+    assert stats['volatility'] <= target + 1e-9
+    np.testing.assert_allclose(stats['expected_return'], optimizer.evaluate(reference)['expected_return'].iloc[0], rtol=1e-4)
+
+
+def test_risk_parity_contributions_are_equal(optimizer):
+    weights = optimizer.risk_parity()[optimizer.assets].to_numpy()
+    contributions = weights * (optimizer._sigma @ weights)
+    np.testing.assert_allclose(contributions, contributions.mean(), rtol=1e-6)
+
+
+def test_summary_includes_target_volatility(optimizer):
+    current = pd.Series(1 / len(optimizer.columns), index=optimizer.columns)
+    weights, stats = optimizer.summary(current, target_volatility=18)
+    assert list(weights.columns) == ['current', 'min_variance', 'max_sharpe', 'risk_parity', 'target_volatility']
+    pd.testing.assert_series_equal(weights['target_volatility'], optimizer.target_volatility(18), check_names=False)
+    assert stats.loc['target_volatility', 'volatility'] <= 18 + 1e-9
+    assert 'target_volatility' not in optimizer.summary()[0]
+
+
+def test_ill_conditioned_covariance_solves_to_the_optimum():
+    # Eigenvalues over seven orders of magnitude: steps get tiny long before the optimum is reached.
+    rng = np.random.default_rng(0)
+    n = 40
+    basis, _ = np.linalg.qr(rng.normal(size=(n, n)))
+    sigma = (basis * np.logspace(0, -7, n)) @ basis.T
+    weights = _solve_mean_variance(np.zeros(n), sigma, [0.0], 0.0, 0.2)[0]
+    reference = optimize.minimize(lambda w: w @ sigma @ w / 2, np.full(n, 1.0 / n), jac=lambda w: sigma @ w,
+                                  bounds=[(0.0, 0.2)] * n, constraints=[{'type': 'eq', 'fun': lambda w: w.sum() - 1}],
+                                  method='SLSQP', options={'ftol': 1e-16, 'maxiter': 2000}).x
+    expected = reference @ sigma @ reference / 2
+    assert weights @ sigma @ weights / 2 - expected <= 1e-7 * expected
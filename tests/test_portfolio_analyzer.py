@@ -0,0 +1,15 @@
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+from portfolio_analyzer import _show
+
+
+def test_show_closes_only_the_figure_it_was_given():
+    plt.close('all')
+    first, second = plt.figure(), plt.figure()
+    _show(first)
+    assert plt.get_fignums() == [second.number]
+    plt.close('all')
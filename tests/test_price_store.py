@@ -0,0 +1,74 @@
+import pandas as pd
+
+from market_data import InMemoryProvider
+from price_store import PriceStore
+
+
+def test_second_run_fetches_nothing_and_matches_source(tmp_path, market):
+    prices, _ = market
+    provider = InMemoryProvider(prices)
+    store = PriceStore(str(tmp_path), provider)
+    start, end = prices.index[0], prices.index[-1] + pd.Timedelta(days=1)
+
+    first = store.adjusted_close(['AAA', 'CCC'], start, end)
+    calls = provider.price_calls
+    second = store.adjusted_close(['AAA', 'CCC'], start, end)
+
+    assert provider.price_calls == calls
+    pd.testing.assert_frame_equal(first, second)
+    pd.testing.assert_frame_equal(first, prices[['AAA', 'CCC']].dropna(how='all'), check_freq=False)
+
+
+def test_only_the_new_tail_is_fetched(tmp_path, market):
+    prices, _ = market
+    provider = InMemoryProvider(prices)
+    store = PriceStore(str(tmp_path), provider)
+    store.update(['AAA'], prices.index[0], prices.index[200])
+    store.update(['AAA'], prices.index[0], prices.index[-1] + pd.Timedelta(days=1))
+
+    assert store.series('AAA').index[-1] == prices.index[-1]
+    assert len(store.series('AAA')) == len(prices)
+
+
+def test_history_before_listing_is_only_asked_for_once(tmp_path, market):
+    prices, _ = market
+    provider = InMemoryProvider(prices)
+    store = PriceStore(str(tmp_path), provider)
+    store.update(['CCC'], prices.index[60], prices.index[-1])
+
+    # CCC only lists on day 41, so the head before that is empty, and that answer shouldn't be asked for again.
+    store.update(['CCC'], pd.Timestamp('2019-01-01'), prices.index[-1])
+    calls = provider.price_calls
+    store.update(['CCC'], pd.Timestamp('2019-01-01'), prices.index[-1])
+    assert provider.price_calls == calls
+    assert store.series('CCC').index[0] == prices['CCC'].first_valid_index()
+
+
+def test_ticker_missing_from_a_batch_is_fetched_in_full_later(tmp_path, market):
+    prices, _ = market
+    start, end = prices.index[0], prices.index[50]
+    failed = prices.copy()
+    failed['BBB'] = float('nan')  # how a symbol that failed comes back inside a batch
+    failed = failed.drop(columns='DDD')
+    store = PriceStore(str(tmp_path), InMemoryProvider(failed))
+    store.update(['AAA', 'BBB'], start, end)
+    store.update(['DDD'], start, end)  # not in the provider at all
+    assert 'BBB' not in store.coverage and 'DDD' not in store.coverage
+
+    store.provider = InMemoryProvider(prices)
+    healed = store.adjusted_close(['AAA', 'BBB', 'DDD'], start, end)
+    pd.testing.assert_frame_equal(healed, prices.loc[prices.index < end, ['AAA', 'BBB', 'DDD']], check_freq=False)
+
+
+def test_stored_history_is_rescaled_after_a_new_adjustment(tmp_path, market):
+    prices, _ = market
+    store = PriceStore(str(tmp_path), InMemoryProvider(prices))
+    store.update(['AAA'], prices.index[0], prices.index[150])
+
+    # A dividend on day 150 rescales every earlier adjusted close.
+    adjusted = prices.copy()
+    adjusted.loc[adjusted.index < prices.index[150], 'AAA'] *= 0.99
+    store.provider = InMemoryProvider(adjusted)
+    store.update(['AAA'], prices.index[0], prices.index[-1] + pd.Timedelta(days=1))
+
+    pd.testing.assert_series_equal(store.series('AAA'), adjusted['AAA'], check_names=False, check_freq=False)
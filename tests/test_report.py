@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+from report import decimate
+
+
+def test_decimate_keeps_every_bucket_extreme():
+    rng = np.random.default_rng(2)
+    values = pd.Series(100 + np.cumsum(rng.normal(size=100_001)), index=pd.RangeIndex(100_001))
+    values.iloc[54_321] = 1e6
+    values.iloc[7] = -1e6
+    thinned = decimate(values, max_points=200)
+
+    assert len(thinned) <= 202 and thinned.index.is_monotonic_increasing
+    assert thinned.index[0] == 0 and thinned.index[-1] == 100_000
+    size = -(-len(values) // 100)
+    for bucket in range(100):
+        chunk = values.iloc[bucket * size:(bucket + 1) * size]
+        assert chunk.idxmax() in thinned.index and chunk.idxmin() in thinned.index
+    pd.testing.assert_series_equal(decimate(values.iloc[:150], max_points=200), values.iloc[:150])
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from metrics import TRADING_DAYS_PER_YEAR
+from rolling_risk import rolling_risk
+
+
+def test_rolling_risk_matches_pandas_rolling(market):
+    prices, _ = market
+    values = prices[['AAA', 'BBB', 'CCC']]
+    window, risk_free_rate = 21, 0.03
+    report = rolling_risk(values, prices['BENCH'], windows=(window,), risk_free_rate=risk_free_rate, column_block=2)[window]
+
+    returns = values.pct_change(fill_method=None)
+    benchmark = prices['BENCH'].pct_change()
+    rolling = returns.rolling(window)
+    daily_risk_free = risk_free_rate / TRADING_DAYS_PER_YEAR
+    scale = np.sqrt(TRADING_DAYS_PER_YEAR)
+    shortfall = np.minimum(returns - daily_risk_free, 0.0).where(returns.notna())
+    expected = {
+        'volatility': rolling.std() * scale * 100,
+        'sharpe': (rolling.mean() - daily_risk_free) / rolling.std() * scale,
+        'sortino': (rolling.mean() - daily_risk_free) / np.sqrt((shortfall ** 2).rolling(window).mean()) * scale,
+        'beta': rolling.cov(benchmark).div(benchmark.rolling(window).var(), axis=0),
+        'correlation': rolling.corr(benchmark),
+        'max_drawdown': values.rolling(window).apply(lambda w: (w / np.maximum.accumulate(w) - 1).min() * 100, raw=True),
+    }
+    for metric, frame in expected.items():
+        pd.testing.assert_frame_equal(report[metric], frame, check_names=False, rtol=1e-7, atol=1e-9, obj=metric)
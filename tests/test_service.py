@@ -0,0 +1,151 @@
+import asyncio
+import json
+import os
+
+import pandas as pd
+
+from dividends import DividendCache
+from market_data import InMemoryProvider
+from price_store import PriceStore
+from service import AnalysisService, MarketDataCache, parse_portfolio
+
+
+def open_cache(root, provider):
+    price_store = PriceStore(os.path.join(root, 'store'), provider)
+    return MarketDataCache(price_store, DividendCache(os.path.join(root, 'dividends'), provider, retries=1))
+
+
+def test_concurrent_requests_share_fetches(tmp_path, market):
+    prices, dividends = market
+    cache = open_cache(str(tmp_path), InMemoryProvider(prices, dividends, delay_seconds=0.05))
+    start, end = prices.index[0], prices.index[-1] + pd.Timedelta(days=1)
+
+    async def run():
+        first, second = await asyncio.gather(cache.prices(['AAA', 'BBB'], start, end), cache.prices(['BBB', 'CCC'], start, end))
+        again = await cache.prices(['CCC', 'AAA'], start, end)
+        return first, second, again
+
+    try:
+        first, second, again = asyncio.run(run())
+    finally:
+        cache.close()
+    assert cache.fetches == 2 and cache.coalesced == 1
+    pd.testing.assert_series_equal(first['BBB'], second['BBB'], check_freq=False)
+    pd.testing.assert_series_equal(again['CCC'].dropna(), prices['CCC'].dropna(), check_names=False, check_freq=False)
+    pd.testing.assert_series_equal(again['AAA'], prices['AAA'], check_names=False, check_freq=False)
+
+
+def test_cancelled_request_does_not_cancel_its_peers(tmp_path, market):
+    prices, dividends = market
+    cache = open_cache(str(tmp_path), InMemoryProvider(prices, dividends, delay_seconds=0.1))
+    start, end = prices.index[0], prices.index[-1] + pd.Timedelta(days=1)
+
+    async def run():
+        first = asyncio.ensure_future(cache.prices(['AAA'], start, end))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(cache.prices(['AAA', 'BBB'], start, end))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        peers = await asyncio.wait_for(second, timeout=5)
+        later = await asyncio.wait_for(cache.prices(['BBB'], start, end), timeout=5)
+        return first, peers, later
+
+    try:
+        first, peers, later = asyncio.run(run())
+    finally:
+        cache.close()
+    assert first.cancelled()
+    assert list(peers.columns) == ['AAA', 'BBB'] and len(peers) == len(prices)
+    assert cache.stats()['in_flight'] == 0 and len(later) == len(prices)
+
+
+def test_failed_dividends_are_fetched_again(tmp_path, market):
+    prices, dividends = market
+
+    class FailsOnce(InMemoryProvider):
+        def fetch_dividends(self, ticker):
+            if ticker == 'AAA' and self.dividend_calls == 0:
+                self.dividend_calls += 1
+                raise ConnectionError('timed out')
+            return super().fetch_dividends(ticker)
+
+    provider = FailsOnce(prices, dividends)
+    cache = open_cache(str(tmp_path), provider)
+    day = prices.index[-1]
+
+    async def run():
+        return await cache.dividends(['AAA'], day), await cache.dividends(['AAA'], day), await cache.dividends(['AAA'], day)
+
+    try:
+        (_, failed), (histories, errors), _ = asyncio.run(run())
+    finally:
+        cache.close()
+    assert isinstance(failed['AAA'], ConnectionError)
+    assert not errors and len(histories['AAA']) == len(dividends['AAA'])
+    assert provider.dividend_calls == 2 and cache.fetches == 2
+
+
+LOTS = [{'ticker': 'AAA', 'shares': 20, 'purchase_date': '2020-02-03', 'purchase_price': 50},
+        {'ticker': 'CCC', 'shares': 5, 'purchase_date': '2020-07-01', 'purchase_price': 60}]
+
+
+def analysis_request(body, content_type='text/csv'):
+    return (f'POST /analyze HTTP/1.1\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n').encode('ascii') + body
+
+
+def test_served_analysis_matches_analyze(tmp_path, market):
+    prices, dividends = market
+    provider = InMemoryProvider(prices, dividends)
+    service = AnalysisService(provider, str(tmp_path), benchmarks=['BENCH'])
+    as_of = str(prices.index[-1].date())
+    body = json.dumps({'lots': LOTS, 'benchmarks': 'BENCH', 'as_of': as_of}).encode('utf-8')
+
+    async def run():
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(analysis_request(body, 'application/json'))
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+        lots, accounting, _ = parse_portfolio(body, 'application/json')
+        expected = await service.analyze(lots, accounting, ['BENCH'], as_of)
+        bad = await service.handle('POST', '/analyze', {'content-type': 'application/json'},
+                                   json.dumps({'lots': LOTS, 'benchmarks': [1, 2]}).encode('utf-8'))
+        return response, expected, bad
+
+    try:
+        response, expected, bad = asyncio.run(run())
+    finally:
+        service.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 200 OK')
+    assert json.dumps(json.loads(payload), sort_keys=True) == json.dumps(expected, sort_keys=True)
+    assert bad[0] == 400 and 'benchmarks' in bad[1]['error']
+
+
+def test_concurrent_analyses_fetch_prices_once(tmp_path, market):
+    prices, dividends = market
+    provider = InMemoryProvider(prices, dividends, delay_seconds=0.2)
+    service = AnalysisService(provider, str(tmp_path), benchmarks=['BENCH'])
+    as_of = str(prices.index[-1].date())
+    body = json.dumps({'lots': LOTS, 'as_of': as_of}).encode('utf-8')
+    headers = {'content-type': 'application/json'}
+
+    async def run():
+        responses = await asyncio.gather(*(service.handle('POST', '/analyze', headers, body) for _ in range(300)))
+        lots, accounting, _ = parse_portfolio(body, 'application/json')
+        return responses, await service.analyze(lots, accounting, as_of=as_of)
+
+    try:
+        responses, expected = asyncio.run(run())
+    finally:
+        service.close()
+    assert provider.price_calls == 1
+    assert all(status == 200 for status, _ in responses)
+    assert all(json.dumps(payload, sort_keys=True) == json.dumps(expected, sort_keys=True) for _, payload in responses)
@@ -0,0 +1,23 @@
+import numpy as np
+
+from metrics import annualized_volatility, max_drawdown, total_return
+from streaming import MetricsAccumulator
+
+
+def test_accumulator_resumed_from_json_matches_a_full_recompute(tmp_path, market):
+    prices, _ = market
+    values = prices['AAA'] * 10 + prices['BBB'] * 5
+    benchmark = prices['BENCH']
+
+    accumulator = MetricsAccumulator.from_series(values.iloc[:120], benchmark=benchmark)
+    for chunk in (slice(100, 200), slice(200, None)):  # overlapping bars get skipped
+        path = str(tmp_path / 'state.json')
+        accumulator.save(path)
+        accumulator = MetricsAccumulator.load(path)
+        assert accumulator.update_many(values.index[chunk], values.values[chunk], benchmark=benchmark.values[chunk]) > 0
+
+    assert accumulator.bars == len(values)
+    np.testing.assert_allclose(accumulator.volatility(), annualized_volatility(values), rtol=1e-9)
+    np.testing.assert_allclose(accumulator.max_drawdown(), max_drawdown(values), rtol=1e-9)
+    np.testing.assert_allclose(accumulator.total_return(), (values.iloc[-1] / values.iloc[0] - 1) * 100, rtol=1e-9)
+    np.testing.assert_allclose(accumulator.benchmark_return(), total_return(benchmark, values.index[0]), rtol=1e-9)
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from valuation import value_lots
+
+
+def test_value_lots_matches_a_per_lot_loop(market):
+    prices, _ = market
+    rng = np.random.default_rng(1)
+    tickers = list(rng.choice(['AAA', 'BBB', 'CCC', 'MISSING'], 40))
+    shares = rng.integers(1, 100, 40).astype(float)
+    purchase_dates = list(prices.index[rng.integers(0, len(prices), 40)])
+    purchase_dates[0] = prices.index[-1] + pd.Timedelta(days=30)  # bought after the last bar: never held
+
+    # The way the analyzer used to do it: one Series per lot, added into a running total.
+    expected_total = pd.Series(0.0, index=prices.index)
+    expected_lots = []
+    for ticker, count, bought in zip(tickers, shares, purchase_dates):
+        closes = prices[ticker] if ticker in prices else pd.Series(np.nan, index=prices.index)
+        value = (closes.fillna(0) * count).where(prices.index >= bought, 0.0)
+        expected_total += value
+        expected_lots.append(value.values)
+
+    valuation = value_lots(tickers, shares, purchase_dates, prices)
+    np.testing.assert_allclose(valuation.total.values, expected_total.values)
+    np.testing.assert_allclose(valuation.lot_values().values, np.column_stack(expected_lots))
+    np.testing.assert_allclose(valuation.by_ticker.sum(axis=1).values, expected_total.values)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+
+# Turns lots (ticker, shares, purchase date) plus the adjusted-close matrix into value-over-time series.
+#
+# Instead of adding one Series per ticker into a running total, every lot becomes a step in a
+# (days x tickers) holdings matrix: drop its share count on the row of its purchase date, cumsum
+# down the days, multiply by prices. Any number of lots per ticker just stack up in the same column.
+
+
+def holdings_matrix(calendar, n_columns, event_columns, event_dates, share_deltas):
+    """(days x columns) shares held, from signed share changes taking effect on `event_dates`.
+
+    An event lands on the first calendar day on or after its date; events after the last day are ignored.
+    """
+    rows = np.searchsorted(calendar.values, pd.DatetimeIndex(event_dates).values.astype(calendar.values.dtype), side='left')
+    changes = np.zeros((len(calendar) + 1, n_columns))
+    np.add.at(changes, (rows, np.asarray(event_columns)), np.asarray(share_deltas, dtype='float64'))
+    return np.cumsum(changes[:-1], axis=0)
+
+
+class PortfolioValuation:
+    """Value series for a set of lots. `total` and `by_ticker` are cheap; `lot_values()` is days x lots."""
+
+    def __init__(self, calendar, tickers, holdings, price_matrix, lot_columns, lot_start_rows, lot_shares):
+        self.calendar = calendar
+        self.tickers = tickers
+        self.holdings = holdings
+        self.price_matrix = price_matrix
+        self.lot_columns = lot_columns
+        self.lot_start_rows = lot_start_rows
+        self.lot_shares = lot_shares
+        self._by_ticker = holdings * price_matrix
+
+    @property
+    def by_ticker(self):
+        return pd.DataFrame(self._by_ticker, index=self.calendar, columns=self.tickers)
+
+    @property
+    def total(self):
+        return pd.Series(self._by_ticker.sum(axis=1), index=self.calendar, name='Portfolio Value')
+
+    def lot_values(self, lots=None):
+        """(days x lots) value of each lot (or just the positions in `lots`)."""
+        lots = np.arange(len(self.lot_columns)) if lots is None else np.asarray(lots)
+        held = np.arange(len(self.calendar))[:, None] >= self.lot_start_rows[lots]
+        values = self.price_matrix[:, self.lot_columns[lots]] * np.where(held, self.lot_shares[lots], 0.0)
+        return pd.DataFrame(values, index=self.calendar)
+
+
+def value_lots(tickers, shares, purchase_dates, prices):
+    """Value every lot against `prices` (trading days x tickers) in one go.
+
+    `tickers`, `shares` and `purchase_dates` are parallel, one entry per lot; the same ticker can show up
+    as many times as you bought it. Missing bars count as zero, just like a day we had no quote for.
+    """
+    lot_tickers = pd.Index(tickers)
+    unique_tickers = pd.Index(list(dict.fromkeys(lot_tickers)))
+    lot_columns = unique_tickers.get_indexer(lot_tickers)
+    lot_shares = np.asarray(shares, dtype='float64')
+
+    calendar = pd.DatetimeIndex(prices.index)
+    price_matrix = np.nan_to_num(prices.reindex(columns=unique_tickers).to_numpy(dtype='float64'))
+    lot_start_rows = np.searchsorted(
+        calendar.values, pd.DatetimeIndex(purchase_dates).values.astype(calendar.values.dtype), side='left')
+
+    holdings = holdings_matrix(calendar, len(unique_tickers), lot_columns, purchase_dates, lot_shares)
+    return PortfolioValuation(calendar, unique_tickers, holdings, price_matrix, lot_columns, lot_start_rows, lot_shares)